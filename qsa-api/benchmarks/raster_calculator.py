@@ -0,0 +1,92 @@
+# coding: utf8
+
+"""
+Compare the raster calculator engines on a synthetic raster.
+
+A random DEM of `--size` x `--size` pixels is generated, added to a
+temporary QGIS project and the expression is evaluated by each engine in
+a local GeoTIFF (upload and overviews are not part of the measure):
+
+    $ python benchmarks/raster_calculator.py --size 20000 --engines qgis,tiled,numpy
+"""
+
+import time
+import click
+import numpy
+import rasterio
+import tempfile
+from pathlib import Path
+from flask import Flask
+from rasterio.windows import Window
+from rasterio.transform import from_origin
+
+from qgis.core import QgsProject, QgsRasterLayer
+
+from qsa_api.config import QSAConfig
+from qsa_api.processing.raster_calculator import RasterCalculator
+
+
+def synthetic_dem(path: Path, size: int) -> None:
+    profile = {
+        "driver": "GTiff",
+        "width": size,
+        "height": size,
+        "count": 1,
+        "dtype": "float32",
+        "crs": "EPSG:3857",
+        "transform": from_origin(0, size * 10.0, 10.0, 10.0),
+        "tiled": True,
+        "BIGTIFF": "IF_SAFER",
+    }
+
+    rng = numpy.random.default_rng(0)
+    with rasterio.open(path, "w", **profile) as dst:
+        strip = 512
+        for row in range(0, size, strip):
+            height = min(strip, size - row)
+            data = rng.random((height, size), dtype=numpy.float32) * 3000
+            dst.write(data, 1, window=Window(0, row, size, height))
+
+
+@click.command()
+@click.option("--size", default=10000, help="Width and height in pixels")
+@click.option("--expression", default='("dem@1" * 2 + 10) / 3')
+@click.option("--engines", default="qgis,tiled,numpy")
+def main(size, expression, engines):
+    app = Flask(__name__)
+    app.config["CONFIG"] = QSAConfig()
+
+    with app.app_context(), tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+
+        dem = tmpdir / "dem.tif"
+        click.echo(f"Generate {size}x{size} synthetic DEM")
+        synthetic_dem(dem, size)
+
+        project = QgsProject()
+        project.addMapLayer(QgsRasterLayer(dem.as_posix(), "dem", "gdal"))
+        project_uri = (tmpdir / "benchmark.qgs").as_posix()
+        project.write(project_uri)
+
+        grid, err = RasterCalculator._grid(project_uri, expression, {})
+        if not grid:
+            raise click.ClickException(err)
+        vuri = RasterCalculator._virtual_uri(expression, grid)
+
+        for engine in engines.split(","):
+            out = tmpdir / f"{engine}.tif"
+
+            start = time.time()
+            rc, err = RasterCalculator._write(engine, vuri, out.as_posix())
+            duration = time.time() - start
+
+            if not rc:
+                click.echo(f"{engine}: failed ({err})", err=True)
+                continue
+
+            click.echo(f"{engine}: {duration:.2f}s")
+            out.unlink()
+
+
+if __name__ == "__main__":
+    main()
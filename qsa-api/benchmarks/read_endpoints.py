@@ -0,0 +1,160 @@
+# coding: utf8
+
+"""
+Measure the throughput of QSA read endpoints according to the number of
+gunicorn workers.
+
+For each number of workers, a gunicorn server is started with the
+configuration file of the container image, a project with a few layers is
+created and read endpoints are requested by concurrent clients. Run from the
+qsa-api directory with the usual QSA_* environment variables:
+
+    $ python benchmarks/read_endpoints.py --workers 1,2,4 --clients 16
+
+An already running instance may be benchmarked with `--url` instead.
+"""
+
+import os
+import sys
+import time
+import click
+import signal
+import requests
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = Path(__file__).resolve().parent.parent
+GPKG = ROOT / "tests" / "data.gpkg"
+GEOTIFF = ROOT / "tests" / "landsat_4326.tif"
+
+PROJECT = "qsa_benchmark"
+
+
+def wait_ready(url: str, timeout: float = 60.0) -> None:
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            requests.get(f"{url}/api/projects/", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f"QSA is not reachable at {url}")
+
+
+def setup(url: str) -> None:
+    requests.delete(f"{url}/api/projects/{PROJECT}")
+    requests.post(
+        f"{url}/api/projects/",
+        json={"name": PROJECT, "author": "benchmark"},
+    )
+
+    layers = [
+        ("polygons", f"{GPKG}|layername=polygons", "vector"),
+        ("lines", f"{GPKG}|layername=lines", "vector"),
+        ("landsat", f"{GEOTIFF}", "raster"),
+    ]
+    for name, datasource, layer_type in layers:
+        requests.post(
+            f"{url}/api/projects/{PROJECT}/layers",
+            json={
+                "name": name,
+                "datasource": datasource,
+                "type": layer_type,
+                "crs": 4326,
+            },
+        )
+
+
+def teardown(url: str) -> None:
+    requests.delete(f"{url}/api/projects/{PROJECT}")
+
+
+def endpoints() -> list:
+    return [
+        "/api/projects/",
+        f"/api/projects/{PROJECT}",
+        f"/api/projects/{PROJECT}/layers",
+        f"/api/projects/{PROJECT}/layers/polygons",
+        f"/api/projects/{PROJECT}/layers/landsat",
+        f"/api/projects/{PROJECT}/styles",
+    ]
+
+
+def run(url: str, clients: int, requests_count: int) -> float:
+    urls = endpoints()
+    session = requests.Session()
+
+    def request(i: int) -> int:
+        return session.get(f"{url}{urls[i % len(urls)]}").status_code
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        codes = list(executor.map(request, range(requests_count)))
+    duration = time.time() - start
+
+    errors = len([c for c in codes if c >= 400 and c != 415])
+    if errors:
+        click.echo(f"  {errors} requests failed", err=True)
+
+    return requests_count / duration
+
+
+def start_gunicorn(workers: int, threads: int, port: int):
+    env = os.environ.copy()
+    env["QSA_WORKERS"] = str(workers)
+    env["QSA_THREADS"] = str(threads)
+
+    cmd = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "-c",
+        (ROOT / "gunicorn.conf.py").as_posix(),
+        "-b",
+        f"127.0.0.1:{port}",
+        "qsa_api.app:app",
+    ]
+    return subprocess.Popen(
+        cmd,
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+@click.command()
+@click.option("--url", default="", help="Benchmark a running instance")
+@click.option("--workers", default="1,2,4", help="Numbers of workers")
+@click.option("--threads", default=1, help="Threads per worker")
+@click.option("--clients", default=16, help="Concurrent clients")
+@click.option("--requests", "requests_count", default=500)
+@click.option("--port", default=5050)
+def main(url, workers, threads, clients, requests_count, port):
+    if url:
+        setup(url)
+        rps = run(url, clients, requests_count)
+        click.echo(f"{url}: {rps:.1f} req/s")
+        teardown(url)
+        return
+
+    url = f"http://127.0.0.1:{port}"
+    for count in [int(w) for w in workers.split(",")]:
+        server = start_gunicorn(count, threads, port)
+        try:
+            wait_ready(url)
+            setup(url)
+            rps = run(url, clients, requests_count)
+            click.echo(
+                f"workers={count} threads={threads} clients={clients}: "
+                f"{rps:.1f} req/s"
+            )
+            teardown(url)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
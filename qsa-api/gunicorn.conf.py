@@ -0,0 +1,33 @@
+# coding: utf8
+
+# Gunicorn configuration file used by the container image. The QSA package is
+# not imported here on purpose: the QGIS application has to be initialized in
+# each worker, not in the master process before forking.
+
+import os
+
+bind = "0.0.0.0:5000"
+
+workers = int(os.environ.get("QSA_WORKERS", "1"))
+threads = int(os.environ.get("QSA_THREADS", "1"))
+timeout = int(os.environ.get("QSA_TIMEOUT", "300"))
+
+# each worker imports the application and initializes its own QgsApplication
+preload_app = False
+
+# the monitoring server listens on a single port and keeps track of the
+# connected QGIS Server instances in memory, so it cannot be shared between
+# several workers (threads are fine)
+_single_worker = (
+    os.environ.get("QSA_QGISSERVER_MONITORING_PORT", "0") != "0"
+    and workers > 1
+)
+if _single_worker:
+    workers = 1
+
+
+def on_starting(server):
+    if _single_worker:
+        server.log.warning(
+            "QSA_QGISSERVER_MONITORING_PORT is set: only 1 worker is used"
+        )
@@ -1,7 +1,7 @@
 # coding: utf8
 
 import os
-from qgis.core import QgsApplication
+from qgis.core import QgsApplication, QgsStyle
 
 
 # avoid "Application path not initialized" message
@@ -11,3 +11,8 @@ os.environ["QT_QPA_PLATFORM"] = "offscreen"
 QgsApplication.setPrefixPath("/usr", True)
 qgs = QgsApplication([], False)
 qgs.initQgis()
+
+# QgsApplication is initialized once per process (each gunicorn worker
+# imports the application). The default style is lazily loaded by QGIS, so
+# load it now to avoid concurrent initializations from request threads.
+QgsStyle.defaultStyle()
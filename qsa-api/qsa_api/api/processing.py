@@ -1,12 +1,21 @@
 # coding: utf8
 
+import json
 from jsonschema import validate
-from flask import Blueprint, jsonify, request
 from jsonschema.exceptions import ValidationError
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 
 from ..utils import logger
 from ..project import QSAProject
 from ..processing import RasterCalculator, Histogram
+from ..processing.raster_calculator import (
+    ENGINES,
+    FORMATS,
+    COG_COMPRESSIONS,
+    COG_PREDICTORS,
+    GRID_POLICIES,
+    GRID_OVERSIZES,
+)
 
 from .utils import log_request
 
@@ -24,6 +33,26 @@ def raster_calculator(project: str):
             "properties": {
                 "expression": {"type": "string"},
                 "output": {"type": "string"},
+                "engine": {"type": "string", "enum": ENGINES},
+                "format": {"type": "string", "enum": FORMATS},
+                "compress": {"type": "string", "enum": COG_COMPRESSIONS},
+                "predictor": {"type": "string", "enum": COG_PREDICTORS},
+                "stream": {"type": "boolean"},
+                "overviews": {"type": "boolean"},
+                "crs": {"type": "string"},
+                "extent": {
+                    "type": "array",
+                    "items": {"type": "number"},
+                    "minItems": 4,
+                    "maxItems": 4,
+                },
+                "resolution": {"type": "number", "exclusiveMinimum": 0},
+                "resolution_policy": {
+                    "type": "string",
+                    "enum": GRID_POLICIES,
+                },
+                "oversize": {"type": "string", "enum": GRID_OVERSIZES},
+                "dry_run": {"type": "boolean"},
             },
         }
 
@@ -36,16 +65,81 @@ def raster_calculator(project: str):
         expression = data["expression"]
         output = data["output"]
 
+        engine = "qgis"
+        if "engine" in data:
+            engine = data["engine"]
+
+        output_format = "gtiff"
+        if "format" in data:
+            output_format = data["format"]
+
+        compress = "DEFLATE"
+        if "compress" in data:
+            compress = data["compress"]
+
+        predictor = "YES"
+        if "predictor" in data:
+            predictor = data["predictor"]
+
+        stream = False
+        if "stream" in data:
+            stream = data["stream"]
+
+        overviews = True
+        if "overviews" in data:
+            overviews = data["overviews"]
+
+        grid = {}
+        if "crs" in data:
+            grid["crs"] = data["crs"]
+
+        if "extent" in data:
+            grid["extent"] = data["extent"]
+
+        if "resolution" in data:
+            grid["resolution"] = data["resolution"]
+
+        if "resolution_policy" in data:
+            grid["policy"] = data["resolution_policy"]
+
+        if "oversize" in data:
+            grid["oversize"] = data["oversize"]
+
+        dry_run = False
+        if "dry_run" in data:
+            dry_run = data["dry_run"]
+
+        if stream and (output_format == "cog" or engine == "qgis"):
+            return {
+                "error": "Streaming requires GeoTIFF format and tiled or numpy engine"
+            }, 415
+
         psql_schema = request.args.get("schema", default="public")
         proj = QSAProject(project, psql_schema)
 
         if not proj.exists():
             return {"error": "Project doesn't exist"}, 415
 
-        calc = RasterCalculator(proj._qgis_project_uri, expression)
+        calc = RasterCalculator(
+            proj._qgis_project_uri,
+            expression,
+            engine,
+            output_format,
+            compress,
+            predictor,
+            stream,
+            grid,
+            overviews,
+        )
         if not calc.is_valid():
             return {"error": "Invalid expression"}, 415
 
+        if dry_run:
+            estimate, msg = calc.estimate()
+            if not estimate:
+                return {"error": msg}, 415
+            return jsonify(estimate), 201
+
         rc, msg = calc.process(output)
         if not rc:
             return {
@@ -58,17 +152,79 @@ def raster_calculator(project: str):
         return {"error": "internal server error"}, 415
 
 
+HISTOGRAM_PROPERTIES = {
+    "min": {"type": "number"},
+    "max": {"type": "number"},
+    "count": {"type": "number"},
+    "bands": {
+        "type": "array",
+        "items": {"type": "integer", "minimum": 1},
+        "minItems": 1,
+    },
+    "bbox": {
+        "type": "array",
+        "items": {"type": "number"},
+        "minItems": 4,
+        "maxItems": 4,
+    },
+    "crs": {"type": "string"},
+    "sample_size": {"type": "integer", "minimum": 0},
+    "approximate": {"type": "boolean"},
+}
+
+
+def histogram_options(data: dict) -> dict:
+    mini = None
+    if "min" in data:
+        mini = data["min"]
+
+    maxi = None
+    if "max" in data:
+        maxi = data["max"]
+
+    count = 1000
+    if "count" in data:
+        count = data["count"]
+
+    bands = None
+    if "bands" in data:
+        bands = data["bands"]
+
+    bbox = None
+    if "bbox" in data:
+        bbox = data["bbox"]
+
+    crs = ""
+    if "crs" in data:
+        crs = data["crs"]
+
+    sample_size = 250000
+    if "sample_size" in data:
+        sample_size = data["sample_size"]
+
+    approximate = False
+    if "approximate" in data:
+        approximate = data["approximate"]
+
+    return {
+        "mini": mini,
+        "maxi": maxi,
+        "count": count,
+        "bands": bands,
+        "bbox": bbox,
+        "crs": crs,
+        "sample_size": sample_size,
+        "approximate": approximate,
+    }
+
+
 @processing.post("/raster/histogram/<project>/<layer>")
 def raster_histogram(project: str, layer: str):
     log_request()
     try:
         schema = {
             "type": "object",
-            "properties": {
-                "min": {"type": "number"},
-                "max": {"type": "number"},
-                "count": {"type": "number"},
-            },
+            "properties": HISTOGRAM_PROPERTIES,
         }
 
         data = request.get_json()
@@ -77,29 +233,30 @@ def raster_histogram(project: str, layer: str):
         except ValidationError as e:
             return {"error": e.message}, 415
 
-        mini = None
-        if "min" in data:
-            mini = data["min"]
-
-        maxi = None
-        if "max" in data:
-            maxi = data["max"]
-
-        count = 1000
-        if "count" in data:
-            count = data["count"]
+        options = histogram_options(data)
 
         psql_schema = request.args.get("schema", default="public")
         proj = QSAProject(project, psql_schema)
         if proj.exists():
-            layer_infos = proj.layer(layer)
+            # the datasource is read without opening the layer, bands are
+            # checked when the histogram is computed
+            layer_infos = proj.layer_datasource(layer)
             if layer_infos:
-                if "type" in layer_infos and layer_infos["type"] != "raster":
+                if layer_infos["type"] != "raster":
                     return {
                         "error": "Histogram is available for raster layer only"
                     }
-                histo = Histogram(proj._qgis_project_uri, layer)
-                return jsonify(histo.process(mini, maxi, count)), 201
+
+                histo = Histogram(
+                    proj._qgis_project_uri,
+                    layer,
+                    layer_infos["source"],
+                    layer_infos["provider"],
+                )
+                h, err = histo.process(**options)
+                if err:
+                    return {"error": err}, 415
+                return jsonify(h), 201
             else:
                 return {"error": "Layer does not exist"}, 415
         else:
@@ -107,3 +264,53 @@ def raster_histogram(project: str, layer: str):
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
+
+
+@processing.post("/raster/histograms/<project>")
+def raster_histograms(project: str):
+    log_request()
+    try:
+        schema = {
+            "type": "object",
+            "properties": {
+                "layers": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "minItems": 1,
+                },
+                **HISTOGRAM_PROPERTIES,
+            },
+        }
+
+        data = request.get_json()
+        try:
+            validate(data, schema)
+        except ValidationError as e:
+            return {"error": e.message}, 415
+
+        layers = None
+        if "layers" in data:
+            layers = data["layers"]
+
+        psql_schema = request.args.get("schema", default="public")
+        proj = QSAProject(project, psql_schema)
+        if not proj.exists():
+            return {"error": "Project does not exist"}, 415
+
+        # one JSON document per line, sent as soon as a layer is processed
+        histograms = Histogram.process_batch(
+            proj._qgis_project_uri, layers, **histogram_options(data)
+        )
+
+        def generate():
+            for histo in histograms:
+                yield json.dumps(histo) + "\n"
+
+        return Response(
+            stream_with_context(generate()),
+            status=201,
+            mimetype="application/x-ndjson",
+        )
+    except Exception as e:
+        logger().exception(str(e))
+        return {"error": "internal server error"}, 415
@@ -1,6 +1,6 @@
 # coding: utf8
 
-import shutil
+import io
 import requests
 from jsonschema import validate
 from jsonschema.exceptions import ValidationError
@@ -11,6 +11,7 @@ from qgis.PyQt.QtCore import QDateTime
 from ..wms import WMS
 from ..utils import logger
 from ..project import QSAProject
+from ..raster import RESAMPLINGS, PREVIEW_MAX_SIZE
 
 from .utils import log_request
 
@@ -145,7 +146,7 @@ def project_del_style(name, style):
         psql_schema = request.args.get("schema", default="public")
         project = QSAProject(name, psql_schema)
         if project.exists():
-            if style in project.styles:
+            if project.style_exists(style):
                 rc, msg = project.remove_style(style)
                 if not rc:
                     return {"error": msg}, 415
@@ -196,6 +197,85 @@ def project_layer_update_style(name, layer_name):
         return {"error": "internal server error"}, 415
 
 
+@projects.post("/<name>/layers/<layer_name>/preview")
+def project_layer_preview(name, layer_name):
+    log_request()
+    try:
+        schema = {
+            "type": "object",
+            "required": ["symbology"],
+            "properties": {
+                "symbology": {"type": "object"},
+                "rendering": {"type": "object"},
+                "width": {
+                    "type": "integer",
+                    "minimum": 1,
+                    "maximum": PREVIEW_MAX_SIZE,
+                },
+                "height": {
+                    "type": "integer",
+                    "minimum": 1,
+                    "maximum": PREVIEW_MAX_SIZE,
+                },
+                "bbox": {
+                    "type": "array",
+                    "items": {"type": "number"},
+                    "minItems": 4,
+                    "maxItems": 4,
+                },
+                "timeout": {"type": "integer", "minimum": 1},
+            },
+        }
+
+        psql_schema = request.args.get("schema", default="public")
+        project = QSAProject(name, psql_schema)
+        if project.exists():
+            data = request.get_json()
+            try:
+                validate(data, schema)
+            except ValidationError as e:
+                return {"error": e.message}, 415
+
+            rendering = {}
+            if "rendering" in data:
+                rendering = data["rendering"]
+
+            width = 256
+            if "width" in data:
+                width = data["width"]
+
+            height = 256
+            if "height" in data:
+                height = data["height"]
+
+            bbox = None
+            if "bbox" in data:
+                bbox = data["bbox"]
+
+            timeout = 2000
+            if "timeout" in data:
+                timeout = data["timeout"]
+
+            png, err = project.layer_preview(
+                layer_name,
+                data["symbology"],
+                rendering,
+                width,
+                height,
+                bbox,
+                timeout,
+            )
+            if png is None:
+                return {"error": err}, 415
+
+            return send_file(io.BytesIO(png), mimetype="image/png")
+        else:
+            return {"error": "Project does not exist"}, 415
+    except Exception as e:
+        logger().exception(str(e))
+        return {"error": "internal server error"}, 415
+
+
 @projects.get("/<name>/layers/<layer_name>/map/url")
 def project_layer_map_url(name, layer_name):
     log_request()
@@ -220,13 +300,11 @@ def project_layer_map(name, layer_name):
         project = QSAProject(name, psql_schema)
         if project.exists():
             url = WMS.getmap(name, psql_schema, layer_name)
-            r = requests.get(url, stream=True)
+            r = requests.get(url)
 
-            png = "/tmp/map.png"
-            with open(png, "wb") as out_file:
-                shutil.copyfileobj(r.raw, out_file)
-
-            return send_file(png, mimetype="image/png")
+            # keep the image in memory, a shared file on disk is not safe
+            # with several threads or workers
+            return send_file(io.BytesIO(r.content), mimetype="image/png")
         else:
             return {"error": "Project does not exist"}, 415
     except Exception as e:
@@ -275,6 +353,70 @@ def project_add_style(name):
         return {"error": "internal server error"}, 415
 
 
+@projects.post("/<name>/styles/batch")
+def project_update_styles(name):
+    log_request()
+    try:
+        schema = {
+            "type": "object",
+            "properties": {
+                "styles": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "required": ["name", "type", "rendering", "symbology"],
+                        "properties": {
+                            "name": {"type": "string"},
+                            "type": {"type": "string"},
+                            "symbology": {"type": "object"},
+                            "rendering": {"type": "object"},
+                        },
+                    },
+                },
+                "layers": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "required": ["layer", "style", "current"],
+                        "properties": {
+                            "layer": {"type": "string"},
+                            "style": {"type": "string"},
+                            "current": {"type": "boolean"},
+                        },
+                    },
+                },
+            },
+        }
+
+        psql_schema = request.args.get("schema", default="public")
+        project = QSAProject(name, psql_schema)
+        if project.exists():
+            data = request.get_json()
+            try:
+                validate(data, schema)
+            except ValidationError as e:
+                return {"error": e.message}, 415
+
+            styles = []
+            if "styles" in data:
+                styles = data["styles"]
+
+            layers = []
+            if "layers" in data:
+                layers = data["layers"]
+
+            rc, err = project.update_styles(styles, layers)
+            if rc:
+                return jsonify(rc), 201
+            else:
+                return {"error": err}, 415
+        else:
+            return {"error": "Project does not exist"}, 415
+    except Exception as e:
+        logger().exception(str(e))
+        return {"error": "internal server error"}, 415
+
+
 @projects.get("/<name>/styles/default")
 def project_default_styles(name: str) -> dict:
     log_request()
@@ -350,7 +492,38 @@ def project_add_layer(name):
                 "crs": {"type": "number"},
                 "type": {"type": "string"},
                 "overview": {"type": "boolean"},
+                "overview_resampling": {
+                    "type": "string",
+                    "enum": RESAMPLINGS,
+                },
+                "overview_background": {"type": "boolean"},
                 "datetime": {"type": "string"},
+                "cache": {
+                    "type": "object",
+                    "properties": {
+                        "meta_size": {
+                            "type": "array",
+                            "items": {"type": "integer", "minimum": 1},
+                            "minItems": 2,
+                            "maxItems": 2,
+                        },
+                        "meta_buffer": {"type": "integer", "minimum": 0},
+                        "use_direct_from_level": {
+                            "type": "integer",
+                            "minimum": 0,
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": ["image/png", "image/jpeg", "mixed"],
+                        },
+                        "grids": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "minItems": 1,
+                        },
+                    },
+                    "additionalProperties": False,
+                },
             },
         }
 
@@ -372,6 +545,14 @@ def project_add_layer(name):
             if "overview" in data:
                 overview = data["overview"]
 
+            overview_resampling = "NEAREST"
+            if "overview_resampling" in data:
+                overview_resampling = data["overview_resampling"]
+
+            overview_background = False
+            if "overview_background" in data:
+                overview_background = data["overview_background"]
+
             datetime = None
             if "datetime" in data:
                 # check format "yyyy-MM-dd HH:mm:ss"
@@ -381,6 +562,10 @@ def project_add_layer(name):
                 if not datetime.isValid():
                     return {"error": "Invalid datetime"}, 415
 
+            cache = None
+            if "cache" in data:
+                cache = data["cache"]
+
             rc, err = project.add_layer(
                 data["datasource"],
                 data["type"],
@@ -388,6 +573,9 @@ def project_add_layer(name):
                 crs,
                 overview,
                 datetime,
+                cache,
+                overview_resampling,
+                overview_background,
             )
             if rc:
                 return jsonify(rc), 201
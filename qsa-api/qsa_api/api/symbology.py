@@ -1,13 +1,19 @@
 # coding: utf8
 
-from flask import Blueprint, jsonify
+import json
+import hashlib
+import threading
+import functools
+from flask import Blueprint, Response, jsonify, request
 
 from qgis.core import (
+    Qgis,
     QgsStyle,
     QgsSimpleLineSymbolLayer,
     QgsSimpleFillSymbolLayer,
     QgsSingleBandGrayRenderer,
     QgsMultiBandColorRenderer,
+    QgsPalettedRasterRenderer,
     QgsSimpleMarkerSymbolLayer,
     QgsSingleBandPseudoColorRenderer,
 )
@@ -18,13 +24,52 @@ from .utils import log_request
 
 symbology = Blueprint("symbology", __name__)
 
+# properties only depend on the QGIS version, so clients may keep them
+CACHE_MAX_AGE = 7 * 24 * 3600
+
+_responses = {}
+_responses_lock = threading.Lock()
+
+
+def cached_json(key: str, compute) -> Response:
+    """
+    Serve the JSON document returned by `compute`, which is only called
+    the first time `key` is requested, with a strong ETag.
+    """
+    with _responses_lock:
+        cached = _responses.get(key)
+
+    if cached is None:
+        body = json.dumps(compute(), sort_keys=True).encode()
+        etag = hashlib.sha1(Qgis.version().encode() + body).hexdigest()
+        cached = (body, etag)
+
+        with _responses_lock:
+            _responses[key] = cached
+
+    body, etag = cached
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = CACHE_MAX_AGE
+    return response.make_conditional(request)
+
+
+@functools.cache
+def color_ramp_names() -> dict:
+    # lowercase name to name of default color ramps
+    names = QgsStyle().defaultStyle().colorRampNames()
+    return {name.lower(): name for name in names}
+
 
 @symbology.get("/vector/line/single_symbol/line/properties")
 def symbology_symbols_line():
     log_request()
     try:
-        props = QgsSimpleLineSymbolLayer().properties()
-        return jsonify(props)
+        def properties() -> dict:
+            return QgsSimpleLineSymbolLayer().properties()
+
+        return cached_json(request.path, properties)
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
@@ -34,11 +79,14 @@ def symbology_symbols_line():
 def symbology_symbols_fill():
     log_request()
     try:
-        props = QgsSimpleFillSymbolLayer().properties()
-        props["outline_style"] = (
-            "solid (no, solid, dash, dot, dash dot, dash dot dot)"
-        )
-        return jsonify(props)
+        def properties() -> dict:
+            props = QgsSimpleFillSymbolLayer().properties()
+            props["outline_style"] = (
+                "solid (no, solid, dash, dot, dash dot, dash dot dot)"
+            )
+            return props
+
+        return cached_json(request.path, properties)
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
@@ -48,11 +96,14 @@ def symbology_symbols_fill():
 def symbology_symbols_marker():
     log_request()
     try:
-        props = QgsSimpleMarkerSymbolLayer().properties()
-        props["outline_style"] = (
-            "solid (no, solid, dash, dot, dash dot, dash dot dot)"
-        )
-        return jsonify(props)
+        def properties() -> dict:
+            props = QgsSimpleMarkerSymbolLayer().properties()
+            props["outline_style"] = (
+                "solid (no, solid, dash, dot, dash dot, dash dot dot)"
+            )
+            return props
+
+        return cached_json(request.path, properties)
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
@@ -62,9 +113,12 @@ def symbology_symbols_marker():
 def symbology_vector_rendering():
     log_request()
     try:
-        props = {}
-        props["opacity"] = 100.0
-        return jsonify(props)
+        def properties() -> dict:
+            props = {}
+            props["opacity"] = 100.0
+            return props
+
+        return cached_json(request.path, properties)
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
@@ -76,14 +130,17 @@ def symbology_vector_rendering():
 def symbology_raster_singlebandgray():
     log_request()
     try:
-        props = {}
-        props["gray"] = {"band": 1, "min": 0.0, "max": 1.0}
-        props["contrast_enhancement"] = {
-            "algorithm": "NoEnhancement (StretchToMinimumMaximum, NoEnhancement)",
-            "limits_min_max": "MinMax (MinMax, UserDefined)",
-        }
-        props["color_gradient"] = "BlackToWhite (BlackToWhite, WhiteToBlack)"
-        return jsonify(props)
+        def properties() -> dict:
+            props = {}
+            props["gray"] = {"band": 1, "min": 0.0, "max": 1.0}
+            props["contrast_enhancement"] = {
+                "algorithm": "NoEnhancement (StretchToMinimumMaximum, NoEnhancement)",
+                "limits_min_max": "MinMax (MinMax, UserDefined)",
+            }
+            props["color_gradient"] = "BlackToWhite (BlackToWhite, WhiteToBlack)"
+            return props
+
+        return cached_json(request.path, properties)
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
@@ -95,15 +152,18 @@ def symbology_raster_singlebandgray():
 def symbology_raster_multibandcolor():
     log_request()
     try:
-        props = {}
-        props["red"] = {"band": 1, "min": 0.0, "max": 1.0}
-        props["green"] = {"band": 2, "min": 0.0, "max": 1.0}
-        props["blue"] = {"band": 3, "min": 0.0, "max": 1.0}
-        props["contrast_enhancement"] = {
-            "algorithm": "NoEnhancement (StretchToMinimumMaximum, NoEnhancement)",
-            "limits_min_max": "MinMax (MinMax, UserDefined)",
-        }
-        return jsonify(props)
+        def properties() -> dict:
+            props = {}
+            props["red"] = {"band": 1, "min": 0.0, "max": 1.0}
+            props["green"] = {"band": 2, "min": 0.0, "max": 1.0}
+            props["blue"] = {"band": 3, "min": 0.0, "max": 1.0}
+            props["contrast_enhancement"] = {
+                "algorithm": "NoEnhancement (StretchToMinimumMaximum, NoEnhancement)",
+                "limits_min_max": "MinMax (MinMax, UserDefined)",
+            }
+            return props
+
+        return cached_json(request.path, properties)
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
@@ -115,21 +175,24 @@ def symbology_raster_multibandcolor():
 def symbology_raster_singlebandpseudocolor():
     log_request()
     try:
-        ramps = ", ".join(QgsStyle().defaultStyle().colorRampNames())
-
-        props = {}
-        props["band"] = {"band": 1, "min": 0.0, "max": 1.0}
-        props["ramp"] = {
-            "name": f"Spectral ({ramps})",
-            "color1": "0,0,0,255",
-            "color2": "255,255,255,255",
-            "stops": "0.2;2,2,11,255:0.8;200,200,110,255",
-            "interpolation": "Linear (Linear, Discrete, Exact)",
-        }
-        props["contrast_enhancement"] = {
-            "limits_min_max": "MinMax (MinMax, UserDefined)",
-        }
-        return jsonify(props)
+        def properties() -> dict:
+            ramps = ", ".join(QgsStyle().defaultStyle().colorRampNames())
+
+            props = {}
+            props["band"] = {"band": 1, "min": 0.0, "max": 1.0}
+            props["ramp"] = {
+                "name": f"Spectral ({ramps})",
+                "color1": "0,0,0,255",
+                "color2": "255,255,255,255",
+                "stops": "0.2;2,2,11,255:0.8;200,200,110,255",
+                "interpolation": "Linear (Linear, Discrete, Exact)",
+            }
+            props["contrast_enhancement"] = {
+                "limits_min_max": "MinMax (MinMax, UserDefined)",
+            }
+            return props
+
+        return cached_json(request.path, properties)
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
@@ -141,18 +204,46 @@ def symbology_raster_singlebandpseudocolor():
 def symbology_raster_singlebandpseudocolor_ramp_props(name):
     log_request()
     try:
-        proper_name = ""
-        for n in QgsStyle().defaultStyle().colorRampNames():
-            if n.lower() == name:
-                proper_name = n
-
-        props = {}
-        ramp = QgsStyle().defaultStyle().colorRamp(proper_name)
-        if ramp:
-            props["color1"] = ramp.properties()["color1"].split("rgb")[0]
-            props["color2"] = ramp.properties()["color2"].split("rgb")[0]
-
-        return jsonify(props)
+        proper_name = color_ramp_names().get(name.lower(), "")
+        if not proper_name:
+            return jsonify({})
+
+        def properties() -> dict:
+            props = {}
+            ramp = QgsStyle().defaultStyle().colorRamp(proper_name)
+            if ramp:
+                props["color1"] = ramp.properties()["color1"].split("rgb")[0]
+                props["color2"] = ramp.properties()["color2"].split("rgb")[0]
+            return props
+
+        return cached_json(f"ramp/{proper_name}", properties)
+    except Exception as e:
+        logger().exception(str(e))
+        return {"error": "internal server error"}, 415
+
+
+@symbology.get(
+    f"/raster/{QgsPalettedRasterRenderer(None, 1, []).type()}/properties"
+)
+def symbology_raster_paletted():
+    log_request()
+    try:
+        def properties() -> dict:
+            ramps = ", ".join(QgsStyle().defaultStyle().colorRampNames())
+
+            props = {}
+            props["band"] = {"band": 1}
+            props["ramp"] = {
+                "name": f"Spectral ({ramps})",
+                "color1": "0,0,0,255",
+                "color2": "255,255,255,255",
+            }
+            props["classes"] = [
+                {"value": 1, "color": "#0000ff", "label": "Water"},
+            ]
+            return props
+
+        return cached_json(request.path, properties)
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
@@ -162,12 +253,15 @@ def symbology_raster_singlebandpseudocolor_ramp_props(name):
 def symbology_raster_rendering():
     log_request()
     try:
-        props = {}
-        props["gamma"] = 1.0
-        props["brightness"] = 0
-        props["contrast"] = 0
-        props["saturation"] = 0
-        return jsonify(props)
+        def properties() -> dict:
+            props = {}
+            props["gamma"] = 1.0
+            props["brightness"] = 0
+            props["contrast"] = 0
+            props["saturation"] = 0
+            return props
+
+        return cached_json(request.path, properties)
     except Exception as e:
         logger().exception(str(e))
         return {"error": "internal server error"}, 415
@@ -34,7 +34,9 @@ class QSA:
         app.logger.setLevel(self.cfg.loglevel)
 
     def run(self):
-        app.run(host="0.0.0.0", threaded=False)
+        # the development server runs a single process, use gunicorn to
+        # serve several workers (see gunicorn.conf.py)
+        app.run(host="0.0.0.0", threaded=self.cfg.threads > 1)
 
 
 qsa = QSA()
@@ -23,6 +23,10 @@ class QSAConfig:
             logging_level = logging.ERROR
         return logging_level
 
+    @property
+    def threads(self) -> int:
+        return int(os.environ.get("QSA_THREADS", "1"))
+
     @property
     def gdal_pam_proxy_dir(self) -> Path:
         return Path(os.environ.get("GDAL_PAM_PROXY_DIR", ""))
@@ -31,6 +35,20 @@ class QSAConfig:
     def monitoring_port(self) -> int:
         return int(os.environ.get("QSA_QGISSERVER_MONITORING_PORT", "0"))
 
+    @property
+    def processing_workers(self) -> int:
+        return int(
+            os.environ.get("QSA_PROCESSING_WORKERS", str(os.cpu_count()))
+        )
+
+    @property
+    def processing_tile_size(self) -> int:
+        return int(os.environ.get("QSA_PROCESSING_TILE_SIZE", "1024"))
+
+    @property
+    def processing_max_pixels(self) -> int:
+        return int(os.environ.get("QSA_PROCESSING_MAX_PIXELS", "1000000000"))
+
     @property
     def qgisserver_url(self) -> str:
         return os.environ.get("QSA_QGISSERVER_URL", "")
@@ -47,6 +65,14 @@ class QSAConfig:
     def mapproxy_projects_dir(self) -> str:
         return os.environ.get("QSA_MAPPROXY_PROJECTS_DIR", "").replace('"', "")
 
+    @property
+    def mapproxy_cache_type(self) -> str:
+        return os.environ.get("QSA_MAPPROXY_CACHE_TYPE", "file").lower()
+
+    @property
+    def mapproxy_cache_usage_ttl(self) -> int:
+        return int(os.environ.get("QSA_MAPPROXY_CACHE_USAGE_TTL", "300"))
+
     @property
     def mapproxy_cache_s3_bucket(self) -> str:
         return os.environ.get("QSA_MAPPROXY_CACHE_S3_BUCKET", "")
@@ -55,6 +81,22 @@ class QSAConfig:
     def mapproxy_cache_s3_dir(self) -> str:
         return os.environ.get("QSA_MAPPROXY_CACHE_S3_DIR", "/mapproxy/cache")
 
+    @property
+    def s3_multipart_threshold(self) -> int:
+        return int(os.environ.get("QSA_S3_MULTIPART_THRESHOLD", "64"))
+
+    @property
+    def s3_multipart_chunksize(self) -> int:
+        return int(os.environ.get("QSA_S3_MULTIPART_CHUNKSIZE", "64"))
+
+    @property
+    def s3_max_concurrency(self) -> int:
+        return int(os.environ.get("QSA_S3_MAX_CONCURRENCY", "10"))
+
+    @property
+    def s3_checksum_algorithm(self) -> str:
+        return os.environ.get("QSA_S3_CHECKSUM_ALGORITHM", "CRC32").upper()
+
     @property
     def aws_access_key_id(self) -> str:
         return os.environ.get("AWS_ACCESS_KEY_ID", "")
@@ -0,0 +1,177 @@
+# coding: utf8
+
+import os
+import random
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+
+class QSADatabase:
+    """
+    SQLite database of a QSA project.
+
+    Connections are kept in a per process pool, so that statements
+    prepared by sqlite3 are reused between requests, and the database is
+    used in WAL mode so that readers don't wait for writers. The schema
+    is upgraded with `migrations` the first time the database is opened
+    by a process, its version being stored in `PRAGMA user_version`.
+    A random `PRAGMA application_id` is written at the creation of the
+    database to identify it.
+    """
+
+    POOL_SIZE = 4
+
+    # path -> (pid, file identity, idle connections)
+    _pools = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path: Path, migrations: list) -> None:
+        self.path = path
+        self.migrations = migrations
+
+    @property
+    def version(self) -> tuple:
+        # changes whenever a transaction is committed, by any process
+        versions = []
+        for p in [self.path, Path(f"{self.path}-wal")]:
+            try:
+                versions.append(p.stat().st_mtime_ns)
+            except FileNotFoundError:
+                versions.append(0)
+        return tuple(versions)
+
+    @contextmanager
+    def connect(self):
+        con, identity = self._acquire()
+        try:
+            yield con
+        finally:
+            if con.in_transaction:
+                con.rollback()
+            self._release(con, identity)
+
+    @contextmanager
+    def transaction(self):
+        with self.connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+
+    def execute(self, sql: str, parameters: tuple = ()) -> list:
+        with self.connect() as con:
+            return con.execute(sql, parameters).fetchall()
+
+    def migrate(self) -> None:
+        with self.connect():
+            pass
+
+    def close(self) -> None:
+        with QSADatabase._lock:
+            pool = QSADatabase._pools.pop(self.path.as_posix(), None)
+
+        if pool:
+            for con in pool[2]:
+                con.close()
+
+    def _acquire(self) -> (sqlite3.Connection, tuple):
+        key = self.path.as_posix()
+
+        # a project removed and created again by another worker is a new
+        # file, so connections to the previous one are discarded
+        identity = self._identity()
+
+        stale = []
+        with QSADatabase._lock:
+            pool = QSADatabase._pools.get(key)
+            if pool and (pool[0] != os.getpid() or pool[1] != identity):
+                stale = pool[2]
+                pool = None
+                del QSADatabase._pools[key]
+
+            if pool and pool[2]:
+                return pool[2].pop(), identity
+
+        for con in stale:
+            con.close()
+
+        con = self._open()
+        if pool is None:
+            self._migrate(con)
+
+            identity = self._identity()
+            with QSADatabase._lock:
+                QSADatabase._pools[key] = (os.getpid(), identity, [])
+
+        return con, identity
+
+    def _release(self, con: sqlite3.Connection, identity: tuple) -> None:
+        # a connection to a database replaced in the meantime is not
+        # pooled with connections to the new one
+        with QSADatabase._lock:
+            pool = QSADatabase._pools.get(self.path.as_posix())
+            if (
+                pool
+                and pool[0] == os.getpid()
+                and pool[1] == identity
+                and len(pool[2]) < QSADatabase.POOL_SIZE
+            ):
+                pool[2].append(con)
+                return
+
+        con.close()
+
+    def _identity(self) -> tuple:
+        # the inode of a removed file may be reused, but not the random
+        # application id stored in the header of the database
+        try:
+            with open(self.path, "rb") as file:
+                header = file.read(100)
+                inode = os.fstat(file.fileno()).st_ino
+        except FileNotFoundError:
+            return ()
+        return (inode, header[68:72])
+
+    def _open(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # transactions are explicitly managed
+        con = sqlite3.connect(
+            self.path.as_posix(),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        con.execute("PRAGMA journal_mode = WAL")
+        con.execute("PRAGMA synchronous = NORMAL")
+        return con
+
+    def _migrate(self, con: sqlite3.Connection) -> None:
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(self.migrations):
+            return
+
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            # another worker may have upgraded the schema in the meantime
+            version = con.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                application_id = random.randint(1, 2**31 - 1)
+                con.execute(f"PRAGMA application_id = {application_id}")
+
+            for number in range(version, len(self.migrations)):
+                self.migrations[number](con, self.path.parent)
+                con.execute(f"PRAGMA user_version = {number + 1}")
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+        # the header is written in the database file at checkpoint time
+        if version == 0:
+            con.execute("PRAGMA wal_checkpoint")
@@ -0,0 +1,129 @@
+# coding: utf8
+
+import os
+import fcntl
+import hashlib
+import threading
+import functools
+from pathlib import Path
+
+from .utils import StorageBackend, config
+
+
+class QSALock:
+    """
+    Per project advisory lock shared by all workers and threads.
+
+    A `fcntl` lock on a file next to the project directory is used with
+    filesystem storage, and a PostgreSQL session-level advisory lock when
+    QGIS projects are stored in PostgreSQL (so that several QSA instances
+    sharing the same database are serialized too). The lock is reentrant
+    within a thread.
+    """
+
+    _local = threading.local()
+
+    def __init__(self, name: str, schema: str = "") -> None:
+        self.name = name
+        self.schema = "public"
+        if schema:
+            self.schema = schema
+
+    def __enter__(self) -> "QSALock":
+        held = QSALock._held()
+
+        key = self._key
+        if key in held:
+            held[key][0] += 1
+            return self
+
+        if StorageBackend.type() == StorageBackend.POSTGRESQL:
+            handle = self._acquire_postgresql()
+        else:
+            handle = self._acquire_filesystem()
+
+        held[key] = [1, handle]
+        return self
+
+    def __exit__(self, *args) -> None:
+        held = QSALock._held()
+
+        key = self._key
+        held[key][0] -= 1
+        if held[key][0] > 0:
+            return
+
+        _, handle = held.pop(key)
+        if StorageBackend.type() == StorageBackend.POSTGRESQL:
+            self._release_postgresql(handle)
+        else:
+            self._release_filesystem(handle)
+
+    @staticmethod
+    def _held() -> dict:
+        if not hasattr(QSALock._local, "held"):
+            QSALock._local.held = {}
+        return QSALock._local.held
+
+    @property
+    def _key(self) -> str:
+        return f"{self.schema}:{self.name}"
+
+    @property
+    def _lock_file(self) -> Path:
+        # the lock file lives outside the project directory to survive
+        # its creation and removal
+        prefix = ""
+        if StorageBackend.type() == StorageBackend.POSTGRESQL:
+            prefix = f"{self.schema}_"
+
+        projects_dir = Path(config().qgisserver_projects_dir)
+        return projects_dir / f".{prefix}{self.name}.lock"
+
+    def _acquire_filesystem(self) -> int:
+        path = self._lock_file
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def _release_filesystem(self, fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def _acquire_postgresql(self):
+        import psycopg2
+
+        # advisory locks are identified by a signed 64 bits integer
+        digest = hashlib.sha1(f"qsa:{self._key}".encode()).digest()
+        lock_id = int.from_bytes(digest[:8], "big", signed=True)
+
+        con = psycopg2.connect(
+            service=config().qgisserver_projects_psql_service
+        )
+        con.autocommit = True
+        with con.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (lock_id,))
+        return con, lock_id
+
+    def _release_postgresql(self, handle) -> None:
+        con, lock_id = handle
+        try:
+            with con.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (lock_id,))
+        finally:
+            con.close()
+
+
+def locked(fn):
+    """
+    Run a QSAProject/QSAMapProxy method while holding the project lock.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with QSALock(self.name, self.schema):
+            return fn(self, *args, **kwargs)
+
+    return wrapper
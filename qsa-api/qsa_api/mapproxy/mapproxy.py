@@ -1,14 +1,31 @@
 # coding: utf8
 
 import sys
+import json
 import yaml
 import boto3
 import shutil
+import sqlite3
 from pathlib import Path
+from datetime import datetime as dt, timedelta, timezone
 
 from qgis.PyQt.QtCore import Qt, QDateTime
 
-from ..utils import config, logger, qgisserver_base_url
+from . import usage
+from ..lock import QSALock
+from ..utils import config, logger, qgisserver_base_url, atomic_write
+
+
+# grids provided by MapProxy without any definition in the configuration
+BUILTIN_GRIDS = ["GLOBAL_WEBMERCATOR", "GLOBAL_GEODETIC", "GLOBAL_MERCATOR"]
+
+CACHE_FORMATS = ["image/png", "image/jpeg", "mixed"]
+
+# tiles storage on the filesystem
+CACHE_TYPES = ["file", "mbtiles", "sqlite", "geopackage"]
+
+# threads used to walk through cache directories or S3 prefixes
+USAGE_WORKERS = 8
 
 
 class QSAMapProxy:
@@ -21,14 +38,19 @@ class QSAMapProxy:
     def create(self) -> None:
         parent = Path(__file__).resolve().parent
         template = parent / "mapproxy.yaml"
-        shutil.copy(template, self._mapproxy_project)
+        with atomic_write(self._mapproxy_project) as tmp:
+            shutil.copy(template, tmp)
 
     def remove(self) -> None:
         self._mapproxy_project.unlink()
+        self._usage_file.unlink(missing_ok=True)
 
     def write(self) -> None:
-        with open(self._mapproxy_project, "w") as file:
-            yaml.safe_dump(self.cfg, file, sort_keys=False)
+        # MapProxy reloads its configuration on change, so the file is
+        # never written in place
+        with atomic_write(self._mapproxy_project) as tmp:
+            with open(tmp, "w") as file:
+                yaml.safe_dump(self.cfg, file, sort_keys=False)
 
     def read(self) -> (bool, str):
         # if a QGIS project is created manually without QSA, the MapProxy
@@ -63,11 +85,73 @@ class QSAMapProxy:
             md["valid"] = True
 
             md["storage"] = "filesystem"
+            md["type"] = config().mapproxy_cache_type
             if config().mapproxy_cache_s3_bucket:
                 md["storage"] = "s3"
+                md["type"] = "s3"
+
+            rc, _ = self.read()
+            if rc:
+                md["grids"] = list(self.cfg.get("grids", {}).keys())
+                md["layers"] = self.usage()
 
         return md
 
+    def usage(self) -> dict:
+        # usage is stored with the configuration and only computed again
+        # for layers whose values are older than the configured TTL
+        stored = self._read_usage()
+
+        ttl = timedelta(seconds=config().mapproxy_cache_usage_ttl)
+        now = dt.now(timezone.utc)
+
+        layers = {}
+        computed = {}
+        for layer in self.cfg.get("layers", []):
+            name = layer["name"]
+
+            u = stored.get(name, {})
+            if (
+                "computed" in u
+                and now - dt.fromisoformat(u["computed"]) < ttl
+            ):
+                layers[name] = u
+                continue
+
+            self.debug(f"Compute cache usage for layer '{name}'")
+            u = self._layer_usage(name)
+            u["computed"] = now.isoformat(timespec="seconds")
+            u["cleared"] = stored.get(name, {}).get("cleared")
+
+            layers[name] = u
+            computed[name] = u
+
+        if computed:
+            self._update_usage(computed)
+
+        return layers
+
+    def cache_options(self, name: str) -> dict:
+        # tuning options of a layer's cache as stored in the configuration
+        cache = self.cfg.get("caches", {}).get(f"{name}_cache")
+        if not cache:
+            return {}
+
+        options = {}
+        for key in ["meta_size", "meta_buffer", "use_direct_from_level"]:
+            if key in cache:
+                options[key] = cache[key]
+
+        if "format" in cache:
+            options["format"] = cache["format"]
+            if "request_format" in cache:
+                options["format"] = "mixed"
+
+        if "grids" in cache:
+            options["grids"] = cache["grids"]
+
+        return options
+
     def clear_cache(self, layer_name: str) -> None:
         if config().mapproxy_cache_s3_bucket:
             bucket_name = config().mapproxy_cache_s3_bucket
@@ -85,13 +169,45 @@ class QSAMapProxy:
         else:
             cache_dir = self._mapproxy_project.parent / "cache_data"
             self.debug(f"Clear tiles cache '{cache_dir}'")
-            for d in cache_dir.glob(f"{layer_name}_cache_*"):
-                shutil.rmtree(d)
+
+            # directories for file/sqlite caches, a single file for
+            # mbtiles/geopackage caches. MapProxy keeps its connections to
+            # sqlite databases open, so their tiles are deleted instead of
+            # unlinking files which would still be read and written.
+            for p in cache_dir.glob(f"{layer_name}_cache[_.]*"):
+                if p.suffix == ".mbtiles":
+                    self._clear_tiles(p, "tiles")
+                elif p.suffix == ".gpkg":
+                    self._clear_tiles(p, layer_name)
+                elif p.is_dir():
+                    levels = list(p.glob("*.mbtile"))
+                    for level in levels:
+                        self._clear_tiles(level, "tiles")
+
+                    if not levels:
+                        shutil.rmtree(p)
 
             cache_dir = self._mapproxy_project.parent / "cache_data" / "legends"
             self.debug(f"Clear legends cache '{cache_dir}'")
             shutil.rmtree(cache_dir, ignore_errors=True)
 
+        now = dt.now(timezone.utc).isoformat(timespec="seconds")
+        u = usage.empty_usage()
+        u["computed"] = now
+        u["cleared"] = now
+        self._update_usage({layer_name: u})
+
+    def remove_usage(self, name: str) -> None:
+        with QSALock(self.name, self.schema):
+            stored = self._read_usage()
+            if name not in stored:
+                return
+
+            stored.pop(name)
+            with atomic_write(self._usage_file) as tmp:
+                with open(tmp, "w") as file:
+                    json.dump(stored, file)
+
     def add_layer(
         self,
         name: str,
@@ -99,10 +215,36 @@ class QSAMapProxy:
         srs: int,
         is_raster: bool,
         datetime: QDateTime | None,
+        options: dict | None = None,
     ) -> (bool, str):
         if self.cfg is None:
             return False, "Invalid MapProxy configuration"
 
+        opts = QSAMapProxy._default_cache_options(is_raster)
+        if options:
+            opts.update(options)
+
+        if len(opts["meta_size"]) != 2:
+            return False, "Invalid meta size"
+
+        if opts["format"] not in CACHE_FORMATS:
+            return False, f"Invalid cache format {opts['format']}"
+
+        for grid in opts["grids"]:
+            if not self._add_grid(grid):
+                return False, f"Invalid grid {grid}"
+
+        cache_type = config().mapproxy_cache_type
+        if cache_type not in CACHE_TYPES:
+            return False, f"Invalid MapProxy cache type {cache_type}"
+
+        if (
+            not config().mapproxy_cache_s3_bucket
+            and cache_type in ["mbtiles", "geopackage"]
+            and len(opts["grids"]) > 1
+        ):
+            return False, f"A {cache_type} cache supports a single grid"
+
         if "layers" not in self.cfg:
             self.cfg["layers"] = []
             self.cfg["caches"] = {}
@@ -117,11 +259,16 @@ class QSAMapProxy:
 
         self.cfg["layers"].append(lyr)
 
-        c = {"grids": ["webmercator"], "sources": [f"{name}_wms"]}
-        if is_raster:
-            c["use_direct_from_level"] = 14
-            c["meta_size"] = [1, 1]
-            c["meta_buffer"] = 0
+        c = {"grids": opts["grids"], "sources": [f"{name}_wms"]}
+        c["meta_size"] = opts["meta_size"]
+        c["meta_buffer"] = opts["meta_buffer"]
+        if opts["use_direct_from_level"] is not None:
+            c["use_direct_from_level"] = opts["use_direct_from_level"]
+
+        # "mixed" stores opaque tiles in JPEG and transparent ones in PNG
+        c["format"] = opts["format"]
+        if opts["format"] == "mixed":
+            c["request_format"] = "image/png"
 
         if config().mapproxy_cache_s3_bucket:
             s3_cache_dir = f"{config().mapproxy_cache_s3_dir}/{name}"
@@ -129,6 +276,19 @@ class QSAMapProxy:
             c["cache"]["type"] = "s3"
             c["cache"]["directory"] = s3_cache_dir
             c["cache"]["bucket_name"] = config().mapproxy_cache_s3_bucket
+        elif cache_type == "mbtiles":
+            c["cache"] = {}
+            c["cache"]["type"] = "mbtiles"
+            c["cache"]["filename"] = f"{name}_cache.mbtiles"
+        elif cache_type == "geopackage":
+            c["cache"] = {}
+            c["cache"]["type"] = "geopackage"
+            c["cache"]["filename"] = f"{name}_cache.gpkg"
+            c["cache"]["table_name"] = name
+        elif cache_type == "sqlite":
+            # one sqlite file per zoom level in cache_data/{name}_cache_{grid}
+            c["cache"] = {}
+            c["cache"]["type"] = "sqlite"
 
         self.cfg["caches"][f"{name}_cache"] = c
 
@@ -176,6 +336,121 @@ class QSAMapProxy:
         if source_name in self.cfg["sources"]:
             self.cfg["sources"].pop(source_name)
 
+    def _clear_tiles(self, path: Path, table: str) -> None:
+        con = sqlite3.connect(path, timeout=10)
+        try:
+            with con:
+                con.execute(f'DELETE FROM "{table}"')
+        except sqlite3.Error as e:
+            self.debug(f"Failed to clear tiles of '{path}' ({e})")
+        finally:
+            con.close()
+
+    def _layer_usage(self, name: str) -> dict:
+        if config().mapproxy_cache_s3_bucket:
+            prefix = f"{config().mapproxy_cache_s3_dir}/{name}/".lstrip("/")
+            return usage.s3_usage(
+                config().mapproxy_cache_s3_bucket, prefix, USAGE_WORKERS
+            )
+
+        cache_dir = self._mapproxy_project.parent / "cache_data"
+        cache = self.cfg["caches"].get(f"{name}_cache", {})
+        cache_type = cache.get("cache", {}).get("type", "file")
+
+        if cache_type == "mbtiles":
+            return usage.table_usage(cache_dir / f"{name}_cache.mbtiles", "tiles")
+        elif cache_type == "geopackage":
+            return usage.table_usage(cache_dir / f"{name}_cache.gpkg", name)
+
+        directories = [
+            d.as_posix()
+            for d in cache_dir.glob(f"{name}_cache_*")
+            if d.is_dir()
+        ]
+        if cache_type == "sqlite":
+            return usage.sqlite_usage(directories)
+        return usage.file_usage(directories, USAGE_WORKERS)
+
+    @property
+    def _usage_file(self) -> Path:
+        return self._mapproxy_project.with_name(f"{self.name}.usage.json")
+
+    def _read_usage(self) -> dict:
+        if not self._usage_file.exists():
+            return {}
+
+        try:
+            with open(self._usage_file, "r") as file:
+                return json.load(file)
+        except json.JSONDecodeError:
+            return {}
+
+    def _update_usage(self, layers: dict) -> None:
+        with QSALock(self.name, self.schema):
+            stored = self._read_usage()
+
+            for name, u in layers.items():
+                cleared = stored.get(name, {}).get("cleared")
+                if cleared:
+                    # the cache has been cleared by another worker while
+                    # computing the usage
+                    if cleared > u["computed"]:
+                        continue
+
+                    if not u["cleared"] or cleared > u["cleared"]:
+                        u["cleared"] = cleared
+                stored[name] = u
+
+            with atomic_write(self._usage_file) as tmp:
+                with open(tmp, "w") as file:
+                    json.dump(stored, file)
+
+    def _add_grid(self, grid: str) -> bool:
+        if "grids" not in self.cfg:
+            self.cfg["grids"] = {}
+
+        if grid in self.cfg["grids"] or grid in BUILTIN_GRIDS:
+            return True
+
+        # configuration files created before a grid was shared in the
+        # template do not have its definition yet
+        grids = QSAMapProxy._template()["grids"]
+        if grid in grids:
+            self.cfg["grids"][grid] = grids[grid]
+            return True
+
+        return False
+
+    @staticmethod
+    def _default_cache_options(is_raster: bool) -> dict:
+        if is_raster:
+            # rasters are rendered quickly without labels, so metatiling
+            # is useless and QGIS Server is directly used for high zoom
+            # levels
+            return {
+                "meta_size": [1, 1],
+                "meta_buffer": 0,
+                "use_direct_from_level": 14,
+                "format": "image/png",
+                "grids": ["webmercator"],
+            }
+
+        # bigger metatiles with a buffer avoid duplicated or truncated
+        # labels and reduce the number of requests to QGIS Server
+        return {
+            "meta_size": [4, 4],
+            "meta_buffer": 80,
+            "use_direct_from_level": None,
+            "format": "image/png",
+            "grids": ["webmercator"],
+        }
+
+    @staticmethod
+    def _template() -> dict:
+        template = Path(__file__).resolve().parent / "mapproxy.yaml"
+        with open(template, "r") as file:
+            return yaml.safe_load(file)
+
     def debug(self, msg: str) -> None:
         caller = f"{self.__class__.__name__}.{sys._getframe().f_back.f_code.co_name}"
         msg = f"[{caller}][{self.name}] {msg}"
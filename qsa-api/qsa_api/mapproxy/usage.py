@@ -0,0 +1,132 @@
+# coding: utf8
+
+import os
+import sqlite3
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from ..utils import s3_client
+
+
+# Helpers computing the usage of a layer's cache as a dict like:
+#   {"tiles": 12, "size": 3456, "zoom": {"0": {"tiles": 1, "size": 288}}}
+
+
+def empty_usage() -> dict:
+    return {"tiles": 0, "size": 0, "zoom": {}}
+
+
+def merge_usage(usage: dict, zoom: str, tiles: int, size: int) -> None:
+    if not tiles:
+        return
+
+    z = usage["zoom"].setdefault(zoom, {"tiles": 0, "size": 0})
+    z["tiles"] += tiles
+    z["size"] += size
+
+    usage["tiles"] += tiles
+    usage["size"] += size
+
+
+def _scandir(path: str) -> (int, int):
+    tiles = 0
+    size = 0
+
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    tiles += 1
+                    size += entry.stat(follow_symlinks=False).st_size
+
+    return tiles, size
+
+
+def _tiles_table(path: Path, table: str) -> list:
+    # read-only access, MapProxy may write in the database meanwhile
+    uri = f"{path.as_uri()}?mode=ro"
+    con = sqlite3.connect(uri, uri=True, timeout=10)
+    try:
+        return con.execute(
+            f'SELECT zoom_level, COUNT(*), SUM(LENGTH(tile_data)) FROM "{table}" GROUP BY zoom_level'
+        ).fetchall()
+    except sqlite3.Error:
+        return []
+    finally:
+        con.close()
+
+
+def file_usage(directories: list, workers: int) -> dict:
+    # file caches: {cache_dir}/{zz}/{xxx}/{xxx}/{xxx}/{yyy}/{yyy}/{yyy}.png
+    zooms = []
+    for d in directories:
+        with os.scandir(d) as it:
+            for entry in it:
+                if entry.is_dir() and entry.name.isdigit():
+                    zooms.append((str(int(entry.name)), entry.path))
+
+    usage = empty_usage()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda z: _scandir(z[1]), zooms)
+        for (zoom, _), (tiles, size) in zip(zooms, results):
+            merge_usage(usage, zoom, tiles, size)
+    return usage
+
+
+def sqlite_usage(directories: list) -> dict:
+    # sqlite caches: {cache_dir}/{z}.mbtile
+    usage = empty_usage()
+    for d in directories:
+        for f in Path(d).glob("*.mbtile"):
+            if not f.stem.isdigit():
+                continue
+
+            for _, tiles, size in _tiles_table(f, "tiles"):
+                merge_usage(usage, str(int(f.stem)), tiles, size or 0)
+    return usage
+
+
+def table_usage(path: Path, table: str) -> dict:
+    # mbtiles and geopackage caches store all zoom levels in a single table
+    usage = empty_usage()
+    if path.exists():
+        for zoom, tiles, size in _tiles_table(path, table):
+            merge_usage(usage, str(zoom), tiles, size or 0)
+    return usage
+
+
+def s3_usage(bucket: str, prefix: str, workers: int) -> dict:
+    # clients are thread-safe, so the cached one is shared with the workers
+    paginator = s3_client().get_paginator("list_objects_v2")
+
+    def list_prefix(p: str) -> list:
+        objects = []
+        for page in paginator.paginate(Bucket=bucket, Prefix=p):
+            for obj in page.get("Contents", []):
+                objects.append((obj["Key"], obj["Size"]))
+        return objects
+
+    # list the first level of "directories" to paginate them in parallel
+    prefixes = []
+    objects = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        for p in page.get("CommonPrefixes", []):
+            prefixes.append(p["Prefix"])
+        for obj in page.get("Contents", []):
+            objects.append((obj["Key"], obj["Size"]))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(list_prefix, prefixes):
+            objects += result
+
+    usage = empty_usage()
+    for key, size in objects:
+        # the zoom level is the first numeric part of the key
+        parts = key[len(prefix) :].split("/")
+        zoom = next((p for p in parts[:-1] if p.isdigit()), None)
+        if zoom is not None:
+            merge_usage(usage, str(int(zoom)), 1, size)
+    return usage
@@ -0,0 +1,325 @@
+# coding: utf8
+
+import re
+import numpy as np
+
+
+# Tokens of the raster calculator syntax (see QGIS qgsrastercalclexer.ll)
+TOKENS = re.compile(
+    r"""
+    \s*(?:
+        (?P<quoted>"(?:\\.|[^"\\])*")
+      | (?P<ref>[\w.:/]+@\d+)
+      | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>!=|<=|>=|[-+*/^=<>(),])
+    )""",
+    re.VERBOSE,
+)
+
+# binary operators with their precedence and associativity, OR binding
+# tighter than AND like in QGIS (see qgsrastercalcparser.yy)
+OPERATORS = {
+    "AND": (1, "left"),
+    "OR": (2, "left"),
+    "=": (3, "left"),
+    "!=": (3, "left"),
+    "<": (3, "left"),
+    ">": (3, "left"),
+    "<=": (3, "left"),
+    ">=": (3, "left"),
+    "+": (4, "left"),
+    "-": (4, "left"),
+    "*": (5, "left"),
+    "/": (5, "left"),
+    "^": (6, "right"),
+}
+
+FUNCTIONS = {
+    "sqrt": 1,
+    "sin": 1,
+    "cos": 1,
+    "tan": 1,
+    "asin": 1,
+    "acos": 1,
+    "atan": 1,
+    "ln": 1,
+    "log10": 1,
+    "abs": 1,
+    "min": 2,
+    "max": 2,
+    "if": 3,
+}
+
+
+class RasterExpression:
+    """
+    Raster calculator expression evaluated with NumPy masked arrays.
+
+    The syntax is the one of QgsRasterCalcNode and the nodata semantic is
+    the same: a pixel is nodata if one of its inputs is nodata or if an
+    operation is invalid (division by zero, logarithm of a negative
+    value, ...).
+    """
+
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        self.error = ""
+
+        self._tokens = []
+        self._pos = 0
+        self.tree = None
+
+        try:
+            self._tokens = self._tokenize(expression)
+            self.tree = self._parse_expression(0)
+            if self._peek() is not None:
+                raise ValueError(f"Unexpected token '{self._peek()[1]}'")
+        except ValueError as e:
+            self.tree = None
+            self.error = str(e)
+
+    def is_valid(self) -> bool:
+        return self.tree is not None
+
+    @property
+    def references(self) -> list:
+        # raster references like "layer@1" in order of appearance
+        refs = []
+        self._references(self.tree, refs)
+        return refs
+
+    @property
+    def layers(self) -> list:
+        layers = []
+        for ref in self.references:
+            name = ref.rsplit("@", 1)[0]
+            if name not in layers:
+                layers.append(name)
+        return layers
+
+    def evaluate(self, arrays: dict) -> np.ma.MaskedArray:
+        """
+        Evaluate the expression where `arrays` maps each raster reference
+        to a masked array (all with the same shape).
+        """
+        with np.errstate(all="ignore"):
+            result = self._evaluate(self.tree, arrays)
+
+        shape = next(iter(arrays.values())).shape
+        if np.ndim(result) == 0:
+            result = np.ma.masked_array(np.full(shape, result, np.float64))
+        return result
+
+    def _evaluate(self, node: tuple, arrays: dict):
+        kind = node[0]
+
+        if kind == "number":
+            return node[1]
+        elif kind == "ref":
+            return np.ma.asarray(arrays[node[1]], dtype=np.float64)
+        elif kind == "neg":
+            return -self._evaluate(node[1], arrays)
+        elif kind == "function":
+            args = [self._evaluate(arg, arrays) for arg in node[2]]
+            return self._valid(self._function(node[1], args))
+
+        left = self._evaluate(node[2], arrays)
+        right = self._evaluate(node[3], arrays)
+        return self._valid(self._operator(node[1], left, right))
+
+    @staticmethod
+    def _valid(values):
+        # invalid operations produce nodata pixels
+        if np.ndim(values) == 0:
+            return values
+        return np.ma.masked_invalid(values, copy=False)
+
+    @staticmethod
+    def _operator(op: str, left, right):
+        if op == "+":
+            return np.ma.add(left, right)
+        elif op == "-":
+            return np.ma.subtract(left, right)
+        elif op == "*":
+            return np.ma.multiply(left, right)
+        elif op == "/":
+            return np.ma.divide(left, right)
+        elif op == "^":
+            return np.ma.power(left, right)
+        elif op == "=":
+            return np.ma.equal(left, right).astype(np.float64)
+        elif op == "!=":
+            return np.ma.not_equal(left, right).astype(np.float64)
+        elif op == "<":
+            return np.ma.less(left, right).astype(np.float64)
+        elif op == ">":
+            return np.ma.greater(left, right).astype(np.float64)
+        elif op == "<=":
+            return np.ma.less_equal(left, right).astype(np.float64)
+        elif op == ">=":
+            return np.ma.greater_equal(left, right).astype(np.float64)
+        elif op == "AND":
+            return np.ma.logical_and(
+                np.ma.not_equal(left, 0), np.ma.not_equal(right, 0)
+            ).astype(np.float64)
+        elif op == "OR":
+            return np.ma.logical_or(
+                np.ma.not_equal(left, 0), np.ma.not_equal(right, 0)
+            ).astype(np.float64)
+
+        raise ValueError(f"Unknown operator '{op}'")
+
+    @staticmethod
+    def _function(name: str, args: list):
+        if name == "sqrt":
+            return np.ma.sqrt(args[0])
+        elif name == "sin":
+            return np.ma.sin(args[0])
+        elif name == "cos":
+            return np.ma.cos(args[0])
+        elif name == "tan":
+            return np.ma.tan(args[0])
+        elif name == "asin":
+            return np.ma.arcsin(args[0])
+        elif name == "acos":
+            return np.ma.arccos(args[0])
+        elif name == "atan":
+            return np.ma.arctan(args[0])
+        elif name == "ln":
+            return np.ma.log(args[0])
+        elif name == "log10":
+            return np.ma.log10(args[0])
+        elif name == "abs":
+            return np.ma.absolute(args[0])
+        elif name == "min":
+            return np.ma.minimum(args[0], args[1])
+        elif name == "max":
+            return np.ma.maximum(args[0], args[1])
+        elif name == "if":
+            return np.ma.where(np.ma.not_equal(args[0], 0), args[1], args[2])
+
+        raise ValueError(f"Unknown function '{name}'")
+
+    def _references(self, node: tuple, refs: list) -> None:
+        if node is None:
+            return
+
+        kind = node[0]
+        if kind == "ref":
+            if node[1] not in refs:
+                refs.append(node[1])
+        elif kind == "neg":
+            self._references(node[1], refs)
+        elif kind == "function":
+            for arg in node[2]:
+                self._references(arg, refs)
+        elif kind == "operator":
+            self._references(node[2], refs)
+            self._references(node[3], refs)
+
+    @staticmethod
+    def _tokenize(expression: str) -> list:
+        tokens = []
+
+        pos = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            m = TOKENS.match(expression, pos)
+            if m is None or m.end() == pos:
+                raise ValueError(f"Invalid character at position {pos}")
+            pos = m.end()
+
+            kind = m.lastgroup
+            value = m.group(kind)
+            if kind == "quoted":
+                kind = "ref"
+                value = re.sub(r"\\(.)", r"\1", value[1:-1])
+                if "@" not in value:
+                    raise ValueError(f"Invalid raster reference '{value}'")
+            elif kind == "name" and value.upper() in ["AND", "OR"]:
+                kind = "op"
+                value = value.upper()
+
+            tokens.append((kind, value))
+
+        return tokens
+
+    def _peek(self):
+        if self._pos < len(self._tokens):
+            return self._tokens[self._pos]
+        return None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("Unexpected end of expression")
+        self._pos += 1
+        return token
+
+    def _expect(self, value: str) -> None:
+        token = self._next()
+        if token != ("op", value):
+            raise ValueError(f"Expected '{value}' instead of '{token[1]}'")
+
+    def _parse_expression(self, min_precedence: int) -> tuple:
+        # precedence climbing
+        left = self._parse_unary()
+
+        while True:
+            token = self._peek()
+            if token is None or token[0] != "op" or token[1] not in OPERATORS:
+                return left
+
+            precedence, associativity = OPERATORS[token[1]]
+            if precedence < min_precedence:
+                return left
+
+            self._next()
+            next_precedence = precedence + 1
+            if associativity == "right":
+                next_precedence = precedence
+
+            right = self._parse_expression(next_precedence)
+            left = ("operator", token[1], left, right)
+
+    def _parse_unary(self) -> tuple:
+        token = self._peek()
+        if token == ("op", "-"):
+            # unary minus has the highest precedence in QGIS
+            self._next()
+            return ("neg", self._parse_unary())
+        elif token == ("op", "+"):
+            self._next()
+            return self._parse_unary()
+        return self._parse_primary()
+
+    def _parse_primary(self) -> tuple:
+        kind, value = self._next()
+
+        if kind == "number":
+            return ("number", float(value))
+        elif kind == "ref":
+            return ("ref", value)
+        elif kind == "name":
+            name = value.lower()
+            if name not in FUNCTIONS:
+                raise ValueError(f"Unknown function '{value}'")
+
+            self._expect("(")
+            args = [self._parse_expression(0)]
+            while self._peek() == ("op", ","):
+                self._next()
+                args.append(self._parse_expression(0))
+            self._expect(")")
+
+            if len(args) != FUNCTIONS[name]:
+                raise ValueError(f"Invalid number of arguments for '{name}'")
+
+            return ("function", name, args)
+        elif (kind, value) == ("op", "("):
+            node = self._parse_expression(0)
+            self._expect(")")
+            return node
+
+        raise ValueError(f"Unexpected token '{value}'")
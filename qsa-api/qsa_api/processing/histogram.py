@@ -1,16 +1,99 @@
 # coding: utf8
 
-from multiprocessing import Process, Manager
+import math
+import rasterio
+import numpy as np
+from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+from multiprocessing import Pool, Process, Manager
 
-from qgis.core import QgsProject, QgsRectangle
+from qgis.core import (
+    Qgis,
+    QgsProject,
+    QgsMapLayer,
+    QgsRectangle,
+    QgsRasterLayer,
+    QgsCoordinateTransform,
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransformContext,
+)
+
+from ..config import QSAConfig
+
+
+def _batch_histogram(args: tuple) -> dict:
+    # histogram of a single layer computed by a process of the batch pool
+    name, source, provider, mini, maxi, count, options = args
+
+    try:
+        if options["approximate"] and provider == "gdal":
+            histo = Histogram._process_approximate(
+                source,
+                mini,
+                maxi,
+                count,
+                options["bands"],
+                options["bbox"],
+                options["crs"],
+                options["sample_size"],
+            )
+            return {"layer": name, "histogram": histo}
+
+        lyr = QgsRasterLayer(source, name, provider)
+        if not lyr.isValid():
+            return {"layer": name, "error": "Invalid layer"}
+
+        histo = Histogram._layer_histogram(lyr, mini, maxi, count, options)
+        return {"layer": name, "histogram": histo}
+    except Exception as e:
+        # an error for a layer must not interrupt the whole batch
+        return {"layer": name, "error": str(e)}
 
 
 class Histogram:
-    def __init__(self, project_uri: str, layer: str) -> None:
+    def __init__(
+        self,
+        project_uri: str,
+        layer: str,
+        source: str = "",
+        provider: str = "",
+    ) -> None:
         self.layer = layer
+        self.source = source
+        self.provider = provider
         self.project_uri = project_uri
 
-    def process(self, mini, maxi, count) -> (bool, dict):
+    def process(
+        self,
+        mini,
+        maxi,
+        count,
+        bands: list | None = None,
+        bbox: list | None = None,
+        crs: str = "",
+        sample_size: int = 250000,
+        approximate: bool = False,
+    ) -> (dict, str):
+        if approximate and self.source and self.provider == "gdal":
+            # read in-process by GDAL on overviews, much faster than
+            # spawning a process reading the project
+            try:
+                histo = Histogram._process_approximate(
+                    self.source,
+                    mini,
+                    maxi,
+                    count,
+                    bands,
+                    bbox,
+                    crs,
+                    sample_size,
+                )
+            except ValueError as e:
+                return {}, str(e)
+            return histo, ""
+
         # Some kind of cache is bothering us because when a raster layer is
         # added on S3, we cannot open it with GDAL provider later. The
         # QgsApplication needs to be restarted... why???
@@ -19,34 +102,221 @@ class Histogram:
 
         p = Process(
             target=Histogram._process,
-            args=(self.project_uri, self.layer, mini, maxi, count, out),
+            args=(
+                self.project_uri,
+                self.layer,
+                mini,
+                maxi,
+                count,
+                out,
+                {
+                    "bands": bands,
+                    "bbox": bbox,
+                    "crs": crs,
+                    "sample_size": sample_size,
+                },
+            ),
         )
         p.start()
         p.join()
 
         if "histo" in out:
-            return out["histo"].copy()
+            return out["histo"].copy(), ""
 
-        return {}
+        return {}, out.get("error", "Failed to compute histogram")
 
     @staticmethod
     def _process(
-        project_uri: str, layer: str, mini, maxi, count, out: dict
+        project_uri: str,
+        layer: str,
+        mini,
+        maxi,
+        count,
+        out: dict,
+        options: dict,
     ) -> None:
 
         project = QgsProject.instance()
         project.read(project_uri)
         lyr = project.mapLayersByName(layer)[0]
 
+        try:
+            out["histo"] = Histogram._layer_histogram(
+                lyr, mini, maxi, count, options
+            )
+        except ValueError as e:
+            out["error"] = str(e)
+
+    @staticmethod
+    def process_batch(
+        project_uri: str,
+        layers: list | None,
+        mini,
+        maxi,
+        count,
+        bands: list | None = None,
+        bbox: list | None = None,
+        crs: str = "",
+        sample_size: int = 250000,
+        approximate: bool = False,
+    ):
+        """
+        Yield histograms of several layers as soon as they're computed by
+        a pool of processes. The project is read once, without loading
+        layers, to get their datasource.
+        """
+        project = QgsProject()
+        project.read(project_uri, Qgis.ProjectReadFlag.DontResolveLayers)
+
+        options = {
+            "bands": bands,
+            "bbox": bbox,
+            "crs": crs,
+            "sample_size": sample_size,
+            "approximate": approximate,
+        }
+
+        args = []
+        others = []
+        for lyr in project.mapLayers().values():
+            if layers and lyr.name() not in layers:
+                continue
+
+            if lyr.type() != QgsMapLayer.RasterLayer:
+                others.append(lyr.name())
+                continue
+
+            args.append(
+                (
+                    lyr.name(),
+                    lyr.source(),
+                    lyr.providerType(),
+                    mini,
+                    maxi,
+                    count,
+                    options,
+                )
+            )
+
+        # requested layers that cannot be processed are reported first
+        names = [a[0] for a in args]
+        for name in layers or []:
+            if name in names:
+                continue
+
+            if name in others:
+                yield {"layer": name, "error": "Not a raster layer"}
+            else:
+                yield {"layer": name, "error": "Layer does not exist"}
+
+        if not args:
+            return
+
+        workers = min(len(args), QSAConfig().processing_workers)
+        with Pool(workers) as pool:
+            for result in pool.imap_unordered(_batch_histogram, args):
+                yield result
+
+    @staticmethod
+    def _layer_histogram(
+        lyr: QgsRasterLayer, mini, maxi, count, options: dict
+    ) -> dict:
+        extent = QgsRectangle()
+        if options["bbox"]:
+            extent = QgsRectangle(*options["bbox"])
+            if options["crs"]:
+                transform = QgsCoordinateTransform(
+                    QgsCoordinateReferenceSystem(options["crs"]),
+                    lyr.crs(),
+                    QgsCoordinateTransformContext(),
+                )
+                extent = transform.transformBoundingBox(extent)
+
+        bands = options["bands"]
+        if not bands:
+            bands = range(1, lyr.bandCount() + 1)
+        elif max(bands) > lyr.bandCount():
+            raise ValueError("Invalid band")
+
         histo = {}
-        for band in range(lyr.bandCount()):
+        for band in bands:
             h = lyr.dataProvider().histogram(
-                band + 1, count, mini, maxi, QgsRectangle(), 250000
+                band, count, mini, maxi, extent, options["sample_size"]
             )
 
-            histo[band + 1] = {}
-            histo[band + 1]["min"] = h.minimum
-            histo[band + 1]["max"] = h.maximum
-            histo[band + 1]["values"] = h.histogramVector
+            histo[band] = {}
+            histo[band]["min"] = h.minimum
+            histo[band]["max"] = h.maximum
+            histo[band]["values"] = h.histogramVector
+
+        return histo
+
+    @staticmethod
+    def _process_approximate(
+        source: str,
+        mini,
+        maxi,
+        count,
+        bands: list | None,
+        bbox: list | None,
+        crs: str,
+        sample_size: int,
+    ) -> dict:
+        histo = {}
+
+        with rasterio.open(source) as ds:
+            window = Window(0, 0, ds.width, ds.height)
+            if bbox:
+                bounds = bbox
+                if crs:
+                    bounds = transform_bounds(crs, ds.crs, *bbox)
+
+                try:
+                    window = (
+                        from_bounds(*bounds, transform=ds.transform)
+                        .intersection(window)
+                        .round_offsets()
+                        .round_lengths()
+                    )
+                except WindowError:
+                    return histo
+
+            # a decimated read lets GDAL use the closest overview level
+            width = max(1, int(window.width))
+            height = max(1, int(window.height))
+            pixels = width * height
+            if sample_size and pixels > sample_size:
+                factor = math.sqrt(pixels / sample_size)
+                width = max(1, int(width / factor))
+                height = max(1, int(height / factor))
+
+            if not bands:
+                bands = range(1, ds.count + 1)
+            elif max(bands) > ds.count:
+                raise ValueError("Invalid band")
+
+            for band in bands:
+                data = ds.read(
+                    band,
+                    window=window,
+                    out_shape=(height, width),
+                    resampling=Resampling.nearest,
+                    masked=True,
+                ).compressed()
+
+                lo = mini
+                if lo is None:
+                    lo = float(data.min()) if data.size else 0.0
+
+                hi = maxi
+                if hi is None:
+                    hi = float(data.max()) if data.size else 0.0
+
+                values, _ = np.histogram(data, bins=int(count), range=(lo, hi))
+
+                histo[band] = {}
+                histo[band]["min"] = lo
+                histo[band]["max"] = hi
+                histo[band]["values"] = values.tolist()
 
-        out["histo"] = histo
+        return histo
@@ -1,9 +1,18 @@
 # coding: utf8
 
+import math
+import shutil
 import rasterio
 import tempfile
+import rasterio.shutil
+import numpy as np
 from pathlib import Path
-from multiprocessing import Process, Manager
+from rasterio.vrt import WarpedVRT
+from rasterio.errors import RasterioError
+from rasterio.windows import Window
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from multiprocessing import Pool, Process, Manager
 
 from qgis.PyQt.QtCore import QUrl, QUrlQuery
 from qgis.analysis import QgsRasterCalcNode
@@ -12,6 +21,7 @@ from qgis.core import (
     QgsProject,
     QgsMapLayer,
     QgsRasterPipe,
+    QgsRectangle,
     QgsRasterLayer,
     QgsRasterBandStats,
     QgsRasterFileWriter,
@@ -21,13 +31,87 @@ from qgis.core import (
     QgsCoordinateReferenceSystem,
 )
 
+from ..config import QSAConfig
 from ..utils import s3_bucket_upload, s3_parse_uri, logger
+from .expression import RasterExpression
+
+ENGINES = ["qgis", "tiled", "numpy"]
+
+FORMATS = ["gtiff", "cog"]
+
+COG_COMPRESSIONS = ["NONE", "DEFLATE", "LZW", "ZSTD"]
+
+COG_PREDICTORS = ["NO", "YES", "STANDARD", "FLOATING_POINT"]
+
+# rows per strip of streamed outputs
+STRIP_SIZE = 16
+
+GRID_POLICIES = ["finest", "coarsest", "explicit"]
+
+GRID_OVERSIZES = ["refuse", "downsample"]
+
+DEFAULT_GRID = {
+    "crs": "EPSG:3857",
+    "extent": None,
+    "resolution": None,
+    "policy": "finest",
+    "oversize": "refuse",
+}
+
+DTYPES = {
+    Qgis.DataType.Byte: "uint8",
+    Qgis.DataType.UInt16: "uint16",
+    Qgis.DataType.Int16: "int16",
+    Qgis.DataType.UInt32: "uint32",
+    Qgis.DataType.Int32: "int32",
+    Qgis.DataType.Float32: "float32",
+    Qgis.DataType.Float64: "float64",
+}
+
+# virtual raster layer opened once per process of the tiled engine pool
+_tiled_layer = None
+
+
+def _tiled_init(vuri: str) -> None:
+    global _tiled_layer
+    _tiled_layer = QgsRasterLayer(vuri, "", "virtualraster")
+
+
+def _tiled_block(args: tuple) -> tuple:
+    (col, row, width, height, extent), nodata = args
+
+    block = _tiled_layer.dataProvider().block(
+        1, QgsRectangle(*extent), width, height
+    )
+    data = block.as_numpy(use_masking=True)
+    if hasattr(data, "filled"):
+        data = data.filled(nodata)
+
+    return col, row, data
 
 
 class RasterCalculator:
-    def __init__(self, project_uri: str, expression: str) -> None:
+    def __init__(
+        self,
+        project_uri: str,
+        expression: str,
+        engine: str = "qgis",
+        output_format: str = "gtiff",
+        compress: str = "DEFLATE",
+        predictor: str = "YES",
+        stream: bool = False,
+        grid: dict | None = None,
+        overviews: bool = True,
+    ) -> None:
+        self.engine = engine
         self.expression = expression
         self.project_uri = project_uri
+        self.output_format = output_format
+        self.compress = compress
+        self.predictor = predictor
+        self.stream = stream
+        self.grid = grid or {}
+        self.overviews = overviews
 
     def process(self, out_uri: str) -> (bool, str):
         # Some kind of cache is bothering us because when a raster layer is
@@ -38,63 +122,136 @@ class RasterCalculator:
 
         p = Process(
             target=RasterCalculator._process,
-            args=(self.project_uri, self.expression, out_uri, out),
+            args=(
+                self.project_uri,
+                self.expression,
+                self.engine,
+                out_uri,
+                out,
+                {
+                    "format": self.output_format,
+                    "compress": self.compress,
+                    "predictor": self.predictor,
+                    "stream": self.stream,
+                    "grid": self.grid,
+                    "overviews": self.overviews,
+                },
+            ),
         )
         p.start()
         p.join()
 
         return out["rc"], out["error"]
 
+    def estimate(self) -> (dict, str):
+        # output grid computed without evaluating the expression
+        manager = Manager()
+        out = manager.dict()
+
+        p = Process(
+            target=RasterCalculator._process_estimate,
+            args=(self.project_uri, self.expression, self.grid, out),
+        )
+        p.start()
+        p.join()
+
+        return out["estimate"], out["error"]
+
+    @staticmethod
+    def _process_estimate(
+        project_uri: str, expression: str, grid: dict, out: dict
+    ) -> None:
+        grid, err = RasterCalculator._grid(project_uri, expression, grid)
+
+        out["estimate"] = {}
+        if grid:
+            out["estimate"] = RasterCalculator._estimate(grid)
+        out["error"] = err
+
     @staticmethod
     def _process(
-        project_uri: str, expression: str, out_uri: str, out: dict
+        project_uri: str,
+        expression: str,
+        engine: str,
+        out_uri: str,
+        out: dict,
+        output: dict,
     ) -> None:
-        vuri = RasterCalculator._virtual_uri(project_uri, expression)
-        if not vuri:
+        grid, err = RasterCalculator._grid(
+            project_uri, expression, output["grid"]
+        )
+        if not grid:
             out["rc"] = False
-            out["error"] = "Failed to build virtual uri"
+            out["error"] = err
             return
 
-        lyr = QgsRasterLayer(vuri, "", "virtualraster")
+        RasterCalculator._debug(
+            f"Output grid of {grid['width']}x{grid['height']} pixels"
+        )
+        vuri = RasterCalculator._virtual_uri(expression, grid)
+
+        if output["stream"]:
+            rc, err = RasterCalculator._process_stream(
+                engine, vuri, out_uri, grid, output["overviews"]
+            )
+            out["rc"] = rc
+            out["error"] = err
+            return
 
         with tempfile.NamedTemporaryFile(suffix=".tif") as fp:
-            RasterCalculator._debug("Write temporary raster on disk")
-
-            file_writer = QgsRasterFileWriter(fp.name)
-            pipe = QgsRasterPipe()
-            pipe.set(lyr.dataProvider().clone())
-            rc = file_writer.writeRaster(
-                pipe,
-                lyr.width(),
-                lyr.height(),
-                lyr.extent(),
-                lyr.crs(),
+            RasterCalculator._debug(
+                f"Write temporary raster on disk ({engine} engine)"
             )
-            if rc != Qgis.RasterFileWriterResult.Success:
+
+            rc, err = RasterCalculator._write(engine, vuri, fp.name)
+            if not rc:
                 out["rc"] = False
-                out["error"] = "Failed to write raster"
+                out["error"] = err
                 return
 
             # update nodata
             RasterCalculator._update_nodata(fp.name)
 
-            # upload
+            if output["format"] == "cog":
+                # internal overviews are built by the COG driver which
+                # writes the final file sequentially, so that it's copied
+                # once directly on S3
+                RasterCalculator._debug(
+                    f"Write Cloud Optimized GeoTIFF to {out_uri}"
+                )
+                cfg = QSAConfig()
+                try:
+                    with rasterio.Env(
+                        VSIS3_CHUNK_SIZE=cfg.s3_multipart_chunksize,
+                        CPL_VSIL_USE_TEMP_FILE_FOR_RANDOM_WRITE="NO",
+                    ):
+                        RasterCalculator._write_cog(
+                            fp.name,
+                            out_uri,
+                            output["compress"],
+                            output["predictor"],
+                        )
+                except RasterioError as e:
+                    out["rc"] = False
+                    out["error"] = f"Failed to write COG ({e})"
+                    return
+
+                out["rc"] = True
+                out["error"] = ""
+                return
+
             bucket, subdirs, filename = s3_parse_uri(out_uri)
             dest = Path(subdirs) / Path(filename)
+
+            # upload
             rc, msg = s3_bucket_upload(bucket, fp.name, dest.as_posix())
-            if not rc:
-                out["rc"] = False
+            if not rc or not output["overviews"]:
+                out["rc"] = rc
                 out["error"] = msg
                 return
 
             # build overview
-            lyr = QgsRasterLayer(fp.name, "", "gdal")
-            RasterCalculator._debug("Build overview")
-            fmt = Qgis.RasterPyramidFormat.GeoTiff
-            levels = lyr.dataProvider().buildPyramidList()
-            for idx, level in enumerate(levels):
-                levels[idx].setBuild(True)
-            err = lyr.dataProvider().buildPyramids(levels, "NEAREST", fmt)
+            err = RasterCalculator._build_overview(fp.name)
             if err:
                 out["rc"] = False
                 out["error"] = f"Cannot build overview ({err})"
@@ -112,6 +269,352 @@ class RasterCalculator:
             out["rc"] = True
             out["error"] = ""
 
+    @staticmethod
+    def _process_stream(
+        engine: str, vuri: str, out_uri: str, grid: dict, overviews: bool
+    ) -> (bool, str):
+        # the raster is written by GDAL directly on S3 with a multipart
+        # upload, so that only a part is buffered in memory at once
+        cfg = QSAConfig()
+
+        # overviews are built on local disk, so their footprint is checked
+        # before anything is uploaded
+        if overviews:
+            size = RasterCalculator._overviews_size(grid)
+            free = shutil.disk_usage(tempfile.gettempdir()).free
+            if size > free:
+                return (
+                    False,
+                    f"Overviews need {size} bytes of temporary disk space but only {free} are available",
+                )
+
+        RasterCalculator._debug(
+            f"Stream raster to {out_uri} ({engine} engine)"
+        )
+        with rasterio.Env(
+            VSIS3_CHUNK_SIZE=cfg.s3_multipart_chunksize,
+            CPL_VSIL_USE_TEMP_FILE_FOR_RANDOM_WRITE="NO",
+        ):
+            rc, err = RasterCalculator._write(engine, vuri, out_uri, True)
+        if not rc or not overviews:
+            return rc, err
+
+        # overviews cannot be written next to the raster on S3, so they're
+        # built locally from a VRT referencing the uploaded raster (which
+        # is read back once)
+        bucket, subdirs, filename = s3_parse_uri(out_uri)
+        dest = Path(subdirs) / Path(f"{filename}.ovr")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vrt = (Path(tmpdir) / "raster.vrt").as_posix()
+            rasterio.shutil.copy(out_uri, vrt, driver="VRT")
+
+            err = RasterCalculator._build_overview(
+                vrt, ["COMPRESS_OVERVIEW=DEFLATE"]
+            )
+            if err:
+                return False, f"Cannot build overview ({err})"
+
+            return s3_bucket_upload(bucket, f"{vrt}.ovr", dest.as_posix())
+
+    @staticmethod
+    def _overviews_size(grid: dict) -> int:
+        # uncompressed size of the overview levels (1/4 + 1/16 + ... of
+        # the output size)
+        return RasterCalculator._estimate(grid)["size"] // 3
+
+    @staticmethod
+    def _build_overview(filename: str, options: list | None = None) -> str:
+        lyr = QgsRasterLayer(filename, "", "gdal")
+        RasterCalculator._debug("Build overview")
+        fmt = Qgis.RasterPyramidFormat.GeoTiff
+        levels = lyr.dataProvider().buildPyramidList()
+        for idx, level in enumerate(levels):
+            levels[idx].setBuild(True)
+        return lyr.dataProvider().buildPyramids(
+            levels, "NEAREST", fmt, options or []
+        )
+
+    @staticmethod
+    def _write(
+        engine: str, vuri: str, filename: str, stream: bool = False
+    ) -> (bool, str):
+        if engine == "tiled":
+            return RasterCalculator._write_tiled(vuri, filename, stream)
+        elif engine == "numpy":
+            return RasterCalculator._write_numpy(vuri, filename, stream)
+        elif stream:
+            return False, f"Streaming is not supported by {engine} engine"
+        return RasterCalculator._write_qgis(vuri, filename)
+
+    @staticmethod
+    def _write_cog(
+        src: str, dst: str, compress: str, predictor: str
+    ) -> None:
+        rasterio.shutil.copy(
+            src,
+            dst,
+            driver="COG",
+            BLOCKSIZE=512,
+            COMPRESS=compress,
+            PREDICTOR=predictor,
+            OVERVIEWS="IGNORE_EXISTING",
+            RESAMPLING="NEAREST",
+            BIGTIFF="IF_SAFER",
+            NUM_THREADS="ALL_CPUS",
+        )
+
+    @staticmethod
+    def _write_qgis(vuri: str, filename: str) -> (bool, str):
+        lyr = QgsRasterLayer(vuri, "", "virtualraster")
+
+        file_writer = QgsRasterFileWriter(filename)
+        pipe = QgsRasterPipe()
+        pipe.set(lyr.dataProvider().clone())
+        rc = file_writer.writeRaster(
+            pipe,
+            lyr.width(),
+            lyr.height(),
+            lyr.extent(),
+            lyr.crs(),
+        )
+        if rc != Qgis.RasterFileWriterResult.Success:
+            return False, "Failed to write raster"
+
+        return True, ""
+
+    @staticmethod
+    def _write_tiled(
+        vuri: str, filename: str, stream: bool = False
+    ) -> (bool, str):
+        # the output extent is split in tiles evaluated in a pool of
+        # processes, then assembled in a tiled GeoTIFF
+        lyr = QgsRasterLayer(vuri, "", "virtualraster")
+        if not lyr.isValid():
+            return False, "Invalid virtual raster"
+
+        data_type = lyr.dataProvider().dataType(1)
+        if data_type not in DTYPES:
+            return False, f"Unsupported data type {data_type.name}"
+
+        width = lyr.width()
+        height = lyr.height()
+        extent = lyr.extent()
+        nodata = QgsContrastEnhancement.minimumValuePossible(data_type)
+
+        cfg = QSAConfig()
+        tiles = RasterCalculator._tiles(
+            extent, width, height, cfg.processing_tile_size, stream
+        )
+
+        transform = from_bounds(
+            extent.xMinimum(),
+            extent.yMinimum(),
+            extent.xMaximum(),
+            extent.yMaximum(),
+            width,
+            height,
+        )
+        profile = RasterCalculator._profile(
+            width,
+            height,
+            DTYPES[data_type],
+            lyr.crs().toWkt(),
+            transform,
+            nodata,
+            stream,
+        )
+
+        RasterCalculator._debug(
+            f"Evaluate {len(tiles)} tiles with {cfg.processing_workers} processes"
+        )
+        with rasterio.open(filename, "w", **profile) as dst:
+            with Pool(
+                cfg.processing_workers,
+                initializer=_tiled_init,
+                initargs=(vuri,),
+            ) as pool:
+                # tiles are written as soon as they are computed to keep
+                # memory usage bounded, in order for a streamed output
+                imap = pool.imap_unordered
+                if stream:
+                    imap = pool.imap
+
+                args = [(tile, nodata) for tile in tiles]
+                for col, row, data in imap(_tiled_block, args):
+                    window = Window(col, row, data.shape[1], data.shape[0])
+                    dst.write(data, 1, window=window)
+
+        return True, ""
+
+    @staticmethod
+    def _write_numpy(
+        vuri: str, filename: str, stream: bool = False
+    ) -> (bool, str):
+        # the expression is evaluated on whole windows with NumPy, input
+        # rasters being read by GDAL and warped on the output grid
+        params, ok = QgsRasterDataProvider.decodeVirtualRasterProviderUri(
+            vuri
+        )
+        if not ok:
+            return False, "Invalid virtual raster"
+
+        expression = RasterExpression(params.formula)
+        if not expression.is_valid():
+            return False, f"Invalid expression ({expression.error})"
+
+        inputs = {}
+        for layer in params.rInputLayers:
+            if layer.provider != "gdal":
+                return False, f"Unsupported provider for '{layer.name}'"
+            inputs[layer.name] = layer.uri
+
+        for name in expression.layers:
+            if name not in inputs:
+                return False, f"Unknown raster layer '{name}'"
+
+        width = params.width
+        height = params.height
+        extent = params.extent
+        data_type = Qgis.DataType.Float64
+        nodata = QgsContrastEnhancement.minimumValuePossible(data_type)
+
+        transform = from_bounds(
+            extent.xMinimum(),
+            extent.yMinimum(),
+            extent.xMaximum(),
+            extent.yMaximum(),
+            width,
+            height,
+        )
+        crs = params.crs.toWkt()
+
+        profile = RasterCalculator._profile(
+            width, height, DTYPES[data_type], crs, transform, nodata, stream
+        )
+
+        cfg = QSAConfig()
+        tiles = RasterCalculator._tiles(
+            extent, width, height, cfg.processing_tile_size, stream
+        )
+
+        RasterCalculator._debug(f"Evaluate {len(tiles)} windows with NumPy")
+        sources = []
+        try:
+            vrts = {}
+            for name in expression.layers:
+                src = rasterio.open(inputs[name])
+                sources.append(src)
+
+                # pixels outside of the input are masked thanks to the
+                # alpha band when there's no nodata value
+                vrt = WarpedVRT(
+                    src,
+                    crs=crs,
+                    transform=transform,
+                    width=width,
+                    height=height,
+                    resampling=Resampling.nearest,
+                    add_alpha=src.nodata is None,
+                )
+                sources.append(vrt)
+                vrts[name] = vrt
+
+            for ref in expression.references:
+                name, band = ref.rsplit("@", 1)
+                if not 0 < int(band) <= vrts[name].src_dataset.count:
+                    return False, f"Invalid band for '{ref}'"
+
+            with rasterio.open(filename, "w", **profile) as dst:
+                for col, row, w, h, _ in tiles:
+                    window = Window(col, row, w, h)
+
+                    arrays = {}
+                    for ref in expression.references:
+                        name, band = ref.rsplit("@", 1)
+                        arrays[ref] = vrts[name].read(
+                            int(band), window=window, masked=True
+                        )
+
+                    data = expression.evaluate(arrays)
+                    data = data.astype(np.float64).filled(nodata)
+                    dst.write(data, 1, window=window)
+        except RasterioError as e:
+            return False, f"Failed to evaluate expression ({e})"
+        finally:
+            for src in reversed(sources):
+                src.close()
+
+        return True, ""
+
+    @staticmethod
+    def _profile(
+        width: int,
+        height: int,
+        dtype: str,
+        crs: str,
+        transform,
+        nodata: float,
+        stream: bool = False,
+    ) -> dict:
+        profile = {
+            "driver": "GTiff",
+            "width": width,
+            "height": height,
+            "count": 1,
+            "dtype": dtype,
+            "crs": crs,
+            "transform": transform,
+            "nodata": nodata,
+            "BIGTIFF": "IF_SAFER",
+        }
+
+        if stream:
+            # a streamable GeoTIFF is written sequentially, strip after
+            # strip, so that GDAL uploads it part by part
+            profile["tiled"] = False
+            profile["blockysize"] = STRIP_SIZE
+            profile["STREAMABLE_OUTPUT"] = "YES"
+        else:
+            profile["tiled"] = True
+            profile["blockxsize"] = 256
+            profile["blockysize"] = 256
+
+        return profile
+
+    @staticmethod
+    def _tiles(
+        extent: QgsRectangle,
+        width: int,
+        height: int,
+        size: int,
+        stream: bool = False,
+    ) -> list:
+        # pixel aligned tiles: (col, row, width, height, extent)
+        res_x = extent.width() / width
+        res_y = extent.height() / height
+
+        # full width strips of about size * size pixels when streamed
+        size_x = size
+        size_y = size
+        if stream:
+            size_x = width
+            size_y = max(STRIP_SIZE, size * size // width)
+            size_y -= size_y % STRIP_SIZE
+
+        tiles = []
+        for row in range(0, height, size_y):
+            for col in range(0, width, size_x):
+                w = min(size_x, width - col)
+                h = min(size_y, height - row)
+
+                xmin = extent.xMinimum() + col * res_x
+                ymax = extent.yMaximum() - row * res_y
+                tile_extent = (xmin, ymax - h * res_y, xmin + w * res_x, ymax)
+
+                tiles.append((col, row, w, h, tile_extent))
+        return tiles
+
     @staticmethod
     def _update_nodata(filename: str) -> None:
         # check if min is minimumValuePossible for the corresponding type
@@ -137,20 +640,30 @@ class RasterCalculator:
                 break
 
     @staticmethod
-    def _virtual_uri(project_uri: str, expression: str) -> str:
-        params = QgsRasterDataProvider.VirtualRasterParameters()
-        params.formula = expression
-        params.crs = QgsCoordinateReferenceSystem("EPSG:3857")
+    def _grid(project_uri: str, expression: str, grid: dict) -> (dict, str):
+        # output grid of the expression according to the resolution policy
+        # and the pixel budget
+        grid = {**DEFAULT_GRID, **grid}
+
+        crs = QgsCoordinateReferenceSystem(grid["crs"])
+        if not crs.isValid():
+            return {}, f"Invalid CRS {grid['crs']}"
+
+        if grid["policy"] == "explicit" and not grid["resolution"]:
+            return {}, "A resolution is required with explicit policy"
+
+        # layers actually referenced by the expression
+        node = QgsRasterCalcNode.parseRasterCalcString(expression, "")
+        if node is None:
+            return {}, "Invalid expression"
+        references = node.referencedLayerNames()
 
         project = QgsProject.instance()
         project.read(project_uri)
 
-        lyr_names = []
-        extent = None
-        width = 0
-        height = 0
-
-        params_query = QUrlQuery()
+        layers = {}
+        combined_extent = None
+        resolutions = []
         for layer in project.mapLayers().values():
             if layer.type() != QgsMapLayer.RasterLayer:
                 continue
@@ -158,54 +671,120 @@ class RasterCalculator:
             if layer.dataProvider().name() == "virtualraster":
                 continue
 
-            if layer.name() in lyr_names:
+            if layer.name() in layers:
                 continue
 
-            if layer.name() not in expression:
+            if layer.name() not in references:
                 continue
 
-            transform = QgsCoordinateTransform(
-                layer.crs(), params.crs, project
-            )
+            transform = QgsCoordinateTransform(layer.crs(), crs, project)
             lyr_extent = transform.transformBoundingBox(layer.extent())
 
-            if extent is None:
-                extent = lyr_extent
+            if combined_extent is None:
+                combined_extent = QgsRectangle(lyr_extent)
             else:
-                extent.combineExtentWith(lyr_extent)
-
-            if layer.width() > width:
-                width = layer.width()
+                combined_extent.combineExtentWith(lyr_extent)
 
-            if layer.height() > height:
-                height = layer.height()
+            # pixel size of the layer in the output CRS
+            resolutions.append(
+                (
+                    lyr_extent.width() / layer.width(),
+                    lyr_extent.height() / layer.height(),
+                )
+            )
 
-            vlayer = QgsRasterDataProvider.VirtualRasterInputLayers()
-            vlayer.name = layer.name()
-            vlayer.provider = layer.dataProvider().name()
-            vlayer.uri = layer.source()
+            layers[layer.name()] = (
+                layer.source(),
+                layer.dataProvider().name(),
+            )
 
-            # rInputLayers cannot be set from Python :(
-            # hack based on QgsRasterDataProvider.encodeVirtualRasterProviderUri
-            if vlayer.name not in lyr_names:
-                params_query.addQueryItem(vlayer.name + ":uri", vlayer.uri)
-                params_query.addQueryItem(
-                    vlayer.name + ":provider", vlayer.provider
+        if combined_extent is None:
+            return {}, "No raster layer referenced in expression"
+
+        if grid["resolution"]:
+            res_x = grid["resolution"]
+            res_y = grid["resolution"]
+        elif grid["policy"] == "coarsest":
+            res_x = max(r[0] for r in resolutions)
+            res_y = max(r[1] for r in resolutions)
+        else:
+            res_x = min(r[0] for r in resolutions)
+            res_y = min(r[1] for r in resolutions)
+
+        extent = combined_extent
+        if grid["extent"]:
+            extent = QgsRectangle(*grid["extent"])
+            if not combined_extent.intersects(extent):
+                return {}, "Extent does not intersect input layers"
+
+        width = max(1, round(extent.width() / res_x))
+        height = max(1, round(extent.height() / res_y))
+
+        max_pixels = QSAConfig().processing_max_pixels
+        if max_pixels and width * height > max_pixels:
+            if grid["oversize"] != "downsample":
+                return (
+                    {},
+                    f"Output of {width}x{height} pixels exceeds the budget of {max_pixels} pixels",
                 )
 
-            lyr_names.append(layer.name())
+            factor = math.sqrt(width * height / max_pixels)
+            res_x *= factor
+            res_y *= factor
+            width = max(1, math.floor(extent.width() / res_x))
+            height = max(1, math.floor(extent.height() / res_y))
+
+        # align the extent on the pixel size
+        extent.setXMaximum(extent.xMinimum() + width * res_x)
+        extent.setYMinimum(extent.yMaximum() - height * res_y)
+
+        return {
+            "crs": crs,
+            "extent": extent,
+            "width": width,
+            "height": height,
+            "resolution": [res_x, res_y],
+            "layers": layers,
+        }, ""
 
-        if extent is None:
-            return ""
+    @staticmethod
+    def _estimate(grid: dict) -> dict:
+        # outputs are written as Float64
+        pixels = grid["width"] * grid["height"]
+        return {
+            "crs": grid["crs"].authid(),
+            "extent": [
+                grid["extent"].xMinimum(),
+                grid["extent"].yMinimum(),
+                grid["extent"].xMaximum(),
+                grid["extent"].yMaximum(),
+            ],
+            "width": grid["width"],
+            "height": grid["height"],
+            "resolution": grid["resolution"],
+            "pixels": pixels,
+            "size": pixels * 8,
+            "layers": list(grid["layers"].keys()),
+        }
 
-        params.width = width
-        params.height = height
-        params.extent = extent
+    @staticmethod
+    def _virtual_uri(expression: str, grid: dict) -> str:
+        params = QgsRasterDataProvider.VirtualRasterParameters()
+        params.formula = expression
+        params.crs = grid["crs"]
+        params.width = grid["width"]
+        params.height = grid["height"]
+        params.extent = grid["extent"]
 
         vuri = QgsRasterDataProvider.encodeVirtualRasterProviderUri(params)
 
         # rInputLayers cannot be set from Python :(
         # hack based on QgsRasterDataProvider.encodeVirtualRasterProviderUri
+        params_query = QUrlQuery()
+        for name, (uri, provider) in grid["layers"].items():
+            params_query.addQueryItem(name + ":uri", uri)
+            params_query.addQueryItem(name + ":provider", provider)
+
         params_uri = QUrl()
         params_uri.setQuery(params_query)
         params_vuri = str(
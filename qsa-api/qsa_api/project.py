@@ -1,43 +1,64 @@
 # coding: utf8
 
+import os
 import sys
+import json
+import fcntl
+import time
 import shutil
+import hashlib
 import sqlite3
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+from flask import current_app
 
+from qgis.PyQt.QtXml import QDomDocument
 from qgis.PyQt.QtCore import Qt, QDateTime
 from qgis.core import (
     Qgis,
-    QgsSymbol,
     QgsProject,
     QgsMapLayer,
+    QgsMapLayerStyle,
+    QgsRectangle,
     QgsWkbTypes,
-    QgsFillSymbol,
-    QgsLineSymbol,
     QgsApplication,
     QgsVectorLayer,
     QgsRasterLayer,
-    QgsMarkerSymbol,
     QgsDateTimeRange,
+    QgsReadWriteContext,
     QgsRasterMinMaxOrigin,
     QgsContrastEnhancement,
-    QgsSingleSymbolRenderer,
-    QgsSimpleFillSymbolLayer,
-    QgsSimpleLineSymbolLayer,
-    QgsSimpleMarkerSymbolLayer,
     QgsRasterLayerTemporalProperties,
 )
 
+from .lock import QSALock, locked
+from .database import QSADatabase
 from .mapproxy import QSAMapProxy
-from .vector import VectorSymbologyRenderer
-from .utils import StorageBackend, config, logger
-from .raster import RasterSymbologyRenderer, RasterOverview
+from .vector import (
+    VectorClassification,
+    VectorSymbologyRenderer,
+    CLASSIFICATION_METHODS,
+)
+from .utils import StorageBackend, config, logger, atomic_write
+from .raster import (
+    RasterPreview,
+    RasterOverview,
+    RasterClassification,
+    RasterSymbologyRenderer,
+)
 
 
 RENDERER_TAG_NAME = "renderer-v2"  # constant from core/symbology/renderer.h
 
 
 class QSAProject:
+    # default styles of each project database, shared by the instances of
+    # a worker
+    _styles_default_cache: dict = {}
+    _styles_default_lock = threading.Lock()
+
     def __init__(self, name: str, schema: str = "public") -> None:
         self.name: str = name
         self.schema: str = "public"
@@ -45,23 +66,51 @@ class QSAProject:
             self.schema = schema
 
     @property
-    def sqlite_db(self) -> Path:
-        p = self._qgis_project_dir / "qsa.db"
-        if not p.exists():
-            p.parent.mkdir(parents=True, exist_ok=True)
-            con = sqlite3.connect(p)
-            cur = con.cursor()
-            cur.execute("CREATE TABLE styles_default(geometry, style)")
-            cur.execute("INSERT INTO styles_default VALUES('line', 'default')")
-            cur.execute(
-                "INSERT INTO styles_default VALUES('polygon', 'default')"
+    def database(self) -> QSADatabase:
+        return QSADatabase(
+            self._qgis_project_dir / "qsa.db", [QSAProject._migrate_v1]
+        )
+
+    @staticmethod
+    def _migrate_v1(con: sqlite3.Connection, directory: Path) -> None:
+        # tables were created lazily by older versions
+        con.execute("CREATE TABLE IF NOT EXISTS styles_default(geometry, style)")
+        for geometry in ["line", "polygon", "point"]:
+            con.execute(
+                "INSERT INTO styles_default SELECT ?, 'default' WHERE NOT "
+                "EXISTS (SELECT 1 FROM styles_default WHERE geometry = ?)",
+                (geometry, geometry),
             )
-            cur.execute(
-                "INSERT INTO styles_default VALUES('point', 'default')"
+
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS overviews("
+            "layer TEXT PRIMARY KEY, status TEXT, resampling TEXT, "
+            "duration REAL, error TEXT, updated TEXT)"
+        )
+
+        # classes computed on a datasource, shared by all its styles
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS classifications("
+            "key TEXT PRIMARY KEY, provider TEXT, source TEXT, field TEXT, "
+            "method TEXT, classes INTEGER, data TEXT, updated TEXT)"
+        )
+
+        # styles are indexed to avoid walking through the project directory
+        row = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'styles'"
+        ).fetchone()
+        if row is None:
+            con.execute(
+                "CREATE TABLE styles("
+                "name TEXT PRIMARY KEY, type TEXT, geometry TEXT, "
+                "renderer TEXT, hash TEXT, mtime REAL, json TEXT)"
             )
-            con.commit()
-            con.close()
-        return p
+
+            for qml in directory.glob("**/*.qml"):
+                # skip temporary files written by atomic_write
+                if qml.name.startswith("."):
+                    continue
+                QSAProject._index_style(con, qml)
 
     @staticmethod
     def projects(schema: str = "") -> list:
@@ -69,6 +118,10 @@ class QSAProject:
 
         if StorageBackend.type() == StorageBackend.FILESYSTEM:
             for i in QSAProject._qgis_projects_dir().glob("**/*.qgs"):
+                # skip temporary files written by QSAProject._write
+                if i.name.startswith("."):
+                    continue
+
                 name = i.parent.name.replace(
                     QSAProject._qgis_project_dir_prefix(), ""
                 )
@@ -89,12 +142,115 @@ class QSAProject:
 
     @property
     def styles(self) -> list[str]:
-        s = []
-        for qml in self._qgis_project_dir.glob("**/*.qml"):
-            s.append(qml.stem)
+        rows = self.database.execute("SELECT name FROM styles ORDER BY name")
+        s = [row[0] for row in rows]
         self.debug(f"{len(s)} styles found")
         return s
 
+    def _style_types(self) -> dict:
+        rows = self.database.execute("SELECT name, type FROM styles")
+        return {name: style_type for name, style_type in rows}
+
+    def style_exists(self, name: str) -> bool:
+        rows = self.database.execute(
+            "SELECT 1 FROM styles WHERE name = ?", (name,)
+        )
+        if not rows:
+            self._rescan_styles()
+            rows = self.database.execute(
+                "SELECT 1 FROM styles WHERE name = ?", (name,)
+            )
+        return bool(rows)
+
+    def _rescan_styles(self) -> None:
+        # QML files added or removed outside the API are only noticed when
+        # a style is missing from the index
+        paths = {}
+        for qml in self._qgis_project_dir.glob("*.qml"):
+            # skip temporary files written by atomic_write
+            if not qml.name.startswith("."):
+                paths[qml.stem] = qml
+
+        with self.database.transaction() as con:
+            for (name,) in con.execute("SELECT name FROM styles").fetchall():
+                if paths.pop(name, None) is None:
+                    con.execute("DELETE FROM styles WHERE name = ?", (name,))
+
+            for path in paths.values():
+                self.debug(f"Index style {path.stem}")
+                QSAProject._index_style(con, path)
+
+    @staticmethod
+    def _index_style(
+        con: sqlite3.Connection, path: Path, with_json: bool = False
+    ) -> (dict, str):
+        data = path.read_bytes()
+        metadata = QSAProject._style_metadata(data)
+
+        # the JSON representation is computed lazily for existing styles
+        m = {}
+        err = ""
+        style_json = None
+        if with_json:
+            m, err = QSAProject._style_to_json(path, metadata["type"])
+            if not err:
+                style_json = json.dumps(m)
+
+        con.execute(
+            "INSERT OR REPLACE INTO styles VALUES(?, ?, ?, ?, ?, ?, ?)",
+            (
+                path.stem,
+                metadata["type"],
+                metadata["geometry"],
+                metadata["renderer"],
+                hashlib.sha1(data).hexdigest(),
+                path.stat().st_mtime,
+                style_json,
+            ),
+        )
+
+        return m, err
+
+    @staticmethod
+    def _style_to_json(path: Path, style_type: str) -> (dict, str):
+        if style_type == "vector":
+            return VectorSymbologyRenderer.style_to_json(path)
+        return RasterSymbologyRenderer.style_to_json(path)
+
+    @staticmethod
+    def _style_metadata(data: bytes) -> dict:
+        metadata = {"type": "raster", "geometry": None, "renderer": None}
+
+        try:
+            root = ElementTree.fromstring(data)
+        except ElementTree.ParseError:
+            return metadata
+
+        renderer = root.find(RENDERER_TAG_NAME)
+        if renderer is not None:
+            metadata["type"] = "vector"
+            metadata["renderer"] = renderer.get("type")
+
+            symbol = renderer.find("symbols/symbol")
+            if symbol is not None:
+                geometries = {"fill": "polygon", "marker": "point"}
+                symbol_type = symbol.get("type", "")
+                metadata["geometry"] = geometries.get(symbol_type, symbol_type)
+        else:
+            renderer = root.find("pipe/rasterrenderer")
+            if renderer is not None:
+                metadata["renderer"] = renderer.get("type")
+
+        return metadata
+
+    def _update_styles_index(self, name: str, removed: bool = False) -> None:
+        with self.database.connect() as con:
+            if removed:
+                con.execute("DELETE FROM styles WHERE name = ?", (name,))
+            else:
+                path = self._qgis_project_dir / f"{name}.qml"
+                self._index_style(con, path, with_json=True)
+
     @property
     def project(self) -> QgsProject:
         project = QgsProject()
@@ -141,6 +297,7 @@ class QSAProject:
             return QSAMapProxy(self.name).metadata(), ""
         return {}, "Cache is disabled"
 
+    @locked
     def cache_reset(self) -> (bool, str):
         if self._mapproxy_enabled:
             mp = QSAMapProxy(self.name)
@@ -156,9 +313,17 @@ class QSAProject:
                 bbox = QSAProject._layer_bbox(layer)
                 epsg_code = QSAProject._layer_epsg_code(layer)
 
+                # keep cache tuning options set when the layer was added
+                options = mp.cache_options(layer.name())
+
                 mp.remove_layer(layer.name())
                 mp.add_layer(
-                    layer.name(), bbox, epsg_code, t == Qgis.LayerType.Raster, None
+                    layer.name(),
+                    bbox,
+                    epsg_code,
+                    t == Qgis.LayerType.Raster,
+                    None,
+                    options,
                 )
 
                 mp.write()
@@ -167,33 +332,66 @@ class QSAProject:
 
         return False, "Cache is disabled"
 
-    def style_default(self, geometry: str) -> bool:
-        con = sqlite3.connect(self.sqlite_db.as_posix())
-        cur = con.cursor()
-        sql = f"SELECT style FROM styles_default WHERE geometry = '{geometry}'"
-        res = cur.execute(sql)
-        default_style = res.fetchone()[0]
-        con.close()
-        return default_style
+    def style_default(self, geometry: str) -> str | None:
+        return self._styles_default().get(geometry)
+
+    def _styles_default(self) -> dict:
+        # default styles are kept in memory as long as the database is not
+        # modified, by this worker or another one
+        database = self.database
+        key = database.path.as_posix()
+        version = database.version
+
+        with QSAProject._styles_default_lock:
+            cached = QSAProject._styles_default_cache.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        rows = database.execute("SELECT geometry, style FROM styles_default")
+        styles = dict(rows)
+
+        with QSAProject._styles_default_lock:
+            QSAProject._styles_default_cache[key] = (version, styles)
+
+        return styles
 
     def style(self, name: str) -> (dict, str):
-        if name not in self.styles:
+        if not self.style_exists(name):
             return {}, "Invalid style"
 
-        path = self._qgis_project_dir / f"{name}.qml"
-
-        if VectorSymbologyRenderer.style_is_vector(path):
-            return VectorSymbologyRenderer.style_to_json(path)
-        else:
-            return RasterSymbologyRenderer.style_to_json(path)
+        with self.database.connect() as con:
+            row = con.execute(
+                "SELECT json, mtime FROM styles WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return {}, "Invalid style"
 
+            path = self._qgis_project_dir / f"{name}.qml"
+            try:
+                current_mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                # removed outside the API
+                con.execute("DELETE FROM styles WHERE name = ?", (name,))
+                return {}, "Invalid style"
+
+            # the cached representation is valid until the QML changes
+            style_json, mtime = row
+            if style_json and mtime == current_mtime:
+                return json.loads(style_json), ""
+
+            self.debug(f"Convert style {name} to JSON")
+            return self._index_style(con, path, with_json=True)
+
+    @locked
     def style_update(self, geometry: str, style: str) -> None:
-        con = sqlite3.connect(self.sqlite_db.as_posix())
-        cur = con.cursor()
-        sql = f"UPDATE styles_default SET style = '{style}' WHERE geometry = '{geometry}'"
-        cur.execute(sql)
-        con.commit()
-        con.close()
+        database = self.database
+        database.execute(
+            "UPDATE styles_default SET style = ? WHERE geometry = ?",
+            (style, geometry),
+        )
+
+        with QSAProject._styles_default_lock:
+            QSAProject._styles_default_cache.pop(database.path.as_posix(), None)
 
     def default_styles(self) -> list:
         s = {}
@@ -204,6 +402,133 @@ class QSAProject:
 
         return s
 
+    def overview_status(self, layer: str) -> dict:
+        rows = self.database.execute(
+            "SELECT status, resampling, duration, error, updated "
+            "FROM overviews WHERE layer = ?",
+            (layer,),
+        )
+
+        if not rows:
+            return {}
+
+        keys = ["status", "resampling", "duration", "error", "updated"]
+        status = dict(zip(keys, rows[0]))
+
+        # the job lock is released by the system when the process building
+        # overviews is killed, which leaves a stale "running" status
+        if status["status"] == "running":
+            # a status request doesn't create lock files
+            try:
+                fd = self._overview_lock(layer, create=False)
+            except FileNotFoundError:
+                # jobs create their lock before writing a "running" status
+                return self._overview_status_interrupted(layer, status)
+
+            if fd is not None:
+                try:
+                    status = self._overview_status_interrupted(layer, status)
+                finally:
+                    self._overview_unlock(fd)
+
+        return status
+
+    def _overview_status_interrupted(self, layer: str, status: dict) -> dict:
+        # the job may have been completed before the lock was acquired
+        rows = self.database.execute(
+            "SELECT status FROM overviews WHERE layer = ?", (layer,)
+        )
+        if rows and rows[0][0] != "running":
+            return self.overview_status(layer)
+
+        err = "Interrupted"
+        self.debug(f"Overviews of '{layer}' were interrupted")
+        self._overview_status_update(
+            layer, "failed", status["resampling"], None, err
+        )
+
+        status["status"] = "failed"
+        status["error"] = err
+        return status
+
+    def _overview_lock(self, layer: str, create: bool = True) -> int | None:
+        # held by the job building overviews of a layer
+        digest = hashlib.sha1(layer.encode()).hexdigest()
+        path = self._qgis_project_dir / f".overview_{digest}.lock"
+
+        flags = os.O_RDWR
+        if create:
+            flags |= os.O_CREAT
+        fd = os.open(path, flags, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def _overview_unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def _overview_status_update(
+        self,
+        layer: str,
+        status: str,
+        resampling: str,
+        duration: float | None = None,
+        error: str = "",
+    ) -> None:
+        updated = QDateTime.currentDateTimeUtc().toString(Qt.ISODate)
+
+        self.database.execute(
+            "INSERT OR REPLACE INTO overviews VALUES(?, ?, ?, ?, ?, ?)",
+            (layer, status, resampling, duration, error, updated),
+        )
+
+    def _build_overview_background(
+        self, datasource: str, provider: str, layer: str, resampling: str
+    ) -> None:
+        fd = self._overview_lock(layer)
+        if fd is None:
+            self.debug(f"Overviews of '{layer}' are already being built")
+            return
+
+        # the thread needs the application for config and logs
+        app = current_app._get_current_object()
+        self._overview_status_update(layer, "running", resampling)
+
+        def job():
+            # the lock is held until the final status is written
+            try:
+                with app.app_context():
+                    lyr = QgsRasterLayer(datasource, layer, provider)
+
+                    start = time.perf_counter()
+                    rc, err = RasterOverview(lyr).build(resampling)
+                    duration = time.perf_counter() - start
+
+                    status = "done"
+                    if not rc:
+                        status = "failed"
+                        self.debug(f"Overviews of '{layer}' failed ({err})")
+
+                    # the layer may have been removed while overviews
+                    # were built
+                    with QSALock(self.name, self.schema):
+                        if self.project.mapLayersByName(layer):
+                            self._overview_status_update(
+                                layer, status, resampling, duration, err
+                            )
+                        else:
+                            self.debug(f"Layer '{layer}' has been removed")
+            finally:
+                self._overview_unlock(fd)
+
+        self.debug(f"Build overviews of '{layer}' in background")
+        threading.Thread(target=job, daemon=True).start()
+
     def layer(self, name: str) -> dict:
         project = QgsProject()
         project.read(self._qgis_project_uri)
@@ -222,7 +547,12 @@ class QSAProject:
                 infos["bands"] = layer.bandCount()
                 infos["data_type"] = layer.dataProvider().dataType(1).name.lower()
 
+                overview = self.overview_status(name)
+                if overview:
+                    infos["overview"] = overview
+
             infos["source"] = layer.source()
+            infos["provider"] = layer.providerType()
             infos["crs"] = layer.crs().authid()
             infos["current_style"] = layer.styleManager().currentStyle()
             infos["styles"] = layer.styleManager().styles()
@@ -232,58 +562,264 @@ class QSAProject:
             return infos
         return {}
 
+    def layer_datasource(self, name: str) -> dict:
+        # the project is read without resolving layers, so that nothing
+        # is opened
+        layers = self.project.mapLayersByName(name)
+        if not layers:
+            return {}
+
+        layer = layers[0]
+        return {
+            "type": layer.type().name.lower(),
+            "source": layer.source(),
+            "provider": layer.providerType(),
+        }
+
+    @locked
     def layer_update_style(
         self, layer_name: str, style_name: str, current: bool
     ) -> (bool, str):
-        if layer_name not in self.layers:
-            return False, f"Layer '{layer_name}' does not exist"
+        return self.update_styles(
+            [], [{"layer": layer_name, "style": style_name, "current": current}]
+        )
+
+    @locked
+    def update_styles(self, styles: list, layers: list) -> (bool, str):
+        """
+        Add several styles and assign styles to several layers with a
+        single read and write of the QGIS project. Nothing is written
+        unless all styles and assignments are valid.
+        """
+        qmls = {}
+        style_types = self._style_types()
+        for style in styles:
+            qml, err = self._build_style(
+                style["type"], style["symbology"], style["rendering"]
+            )
+            if not qml:
+                return False, f"Style '{style['name']}': {err}"
+
+            qmls[style["name"]] = qml
+            style_types[style["name"]] = self._style_metadata(
+                qml.encode()
+            )["type"]
+
+        if not layers:
+            for name, qml in qmls.items():
+                self._write_style(name, qml)
+            return True, ""
+
+        for assignment in layers:
+            style_name = assignment["style"]
+            if style_name != "default" and style_name not in style_types:
+                return False, f"Style '{style_name}' does not exist"
 
-        if style_name != "default" and style_name not in self.styles:
-            return False, f"Style '{style_name}' does not exist"
+        # min/max are refreshed from data only when a raster style becomes
+        # current, otherwise layers metadata stored in the project is enough
+        refresh_needed = False
+        for assignment in layers:
+            style_type = style_types.get(assignment["style"], "raster")
+            if assignment["current"] and style_type == "raster":
+                refresh_needed = True
 
         flags = Qgis.ProjectReadFlags()
         flags |= Qgis.ProjectReadFlag.ForceReadOnlyLayers
+        if not refresh_needed:
+            flags |= Qgis.ProjectReadFlag.TrustLayerMetadata
 
         project = QgsProject()
         project.read(self._qgis_project_uri, flags)
 
-        style_path = self._qgis_project_dir / f"{style_name}.qml"
+        for assignment in layers:
+            layer_name = assignment["layer"]
+            style_name = assignment["style"]
 
-        layer = project.mapLayersByName(layer_name)[0]
+            layers_found = project.mapLayersByName(layer_name)
+            if not layers_found:
+                return False, f"Layer '{layer_name}' does not exist"
 
-        if style_name not in layer.styleManager().styles():
-            self.debug(f"Add new style {style_name} in style manager")
-            l = layer.clone()
-            l.loadNamedStyle(style_path.as_posix())  # set "default" style
+            # the default style of a layer matches its type
+            if style_name == "default":
+                continue
 
-            layer.styleManager().addStyle(
-                style_name, l.styleManager().style("default")
-            )
+            layer_type = layers_found[0].type().name.lower()
+            if style_types[style_name] != layer_type:
+                return (
+                    False,
+                    f"Style '{style_name}' cannot be applied to {layer_type} layer '{layer_name}'",
+                )
+
+        refresh = []
+        updated = []
+        for assignment in layers:
+            layer_name = assignment["layer"]
+            style_name = assignment["style"]
+            layer = project.mapLayersByName(layer_name)[0]
+
+            if style_name not in layer.styleManager().styles():
+                self.debug(f"Add new style {style_name} in style manager")
+                self._add_layer_style(
+                    layer, style_name, qmls.get(style_name, "")
+                )
 
-        if current:
-            self.debug(f"Set default style {style_name}")
-            layer.styleManager().setCurrentStyle(style_name)
+            if assignment["current"]:
+                self.debug(f"Set default style {style_name} for {layer_name}")
+                layer.styleManager().setCurrentStyle(style_name)
 
-            # refresh min/max for the current layer if necessary
-            # (because the style is built on an empty geotiff)
-            if layer.type() == QgsMapLayer.RasterLayer:
-                self.debug("Refresh symbology renderer min/max")
-                renderer = RasterSymbologyRenderer(layer.renderer().type())
-                renderer.refresh_min_max(layer)
+                # refresh min/max for the current layer if necessary
+                # (because the style is built on an empty geotiff)
+                if layer.type() == QgsMapLayer.RasterLayer:
+                    refresh.append(layer)
 
-            if self._mapproxy_enabled:
-                self.debug("Clear MapProxy cache")
-                mp = QSAMapProxy(self.name)
-                mp.clear_cache(layer_name)
+                if layer_name not in updated:
+                    updated.append(layer_name)
+
+        if refresh:
+            self.debug(
+                f"Refresh symbology renderer min/max of {len(refresh)} layers"
+            )
+            errors = self._refresh_min_max(refresh)
+            if errors:
+                return False, ", ".join(errors)
+
+        for name, qml in qmls.items():
+            self._write_style(name, qml)
 
         self.debug("Write project")
-        project.write()
+        self._write(project)
+
+        if self._mapproxy_enabled:
+            mp = QSAMapProxy(self.name)
+            for layer_name in updated:
+                self.debug(f"Clear MapProxy cache of {layer_name}")
+                mp.clear_cache(layer_name)
 
         return True, ""
 
+    def _add_layer_style(
+        self, layer: QgsMapLayer, style_name: str, qml: str = ""
+    ) -> None:
+        # a QML document has the same content as the XML data of a style
+        # so there's no need to load it on a clone of the layer, which
+        # would open the datasource again
+        if not qml:
+            style_path = self._qgis_project_dir / f"{style_name}.qml"
+            qml = style_path.read_text()
+        style = QgsMapLayerStyle(qml)
+        layer.styleManager().addStyle(style_name, style)
+
+    def _refresh_min_max(self, layers: list, persist: bool = True) -> list:
+        def refresh(layer: QgsRasterLayer) -> str:
+            renderer = RasterSymbologyRenderer(layer.renderer().type())
+            if renderer.type == RasterSymbologyRenderer.Type.PALETTED:
+                if layer.renderer().classes():
+                    return ""
+
+                # unique values detected on data for styles without classes
+                classes, err = self._raster_classes(layer, persist)
+                if err:
+                    return f"Layer '{layer.name()}': {err}"
+
+                renderer.refresh_classes(layer, classes)
+                return ""
+
+            renderer.refresh_min_max(layer)
+            return ""
+
+        if len(layers) == 1:
+            errors = [refresh(layers[0])]
+        else:
+            # the threads need the application for config (the project
+            # database is used by unique values detection)
+            app = current_app._get_current_object()
+
+            def refresh_in_context(layer: QgsRasterLayer) -> str:
+                with app.app_context():
+                    return refresh(layer)
+
+            # statistics are computed by distinct data providers so layers
+            # may be processed concurrently
+            workers = min(len(layers), config().processing_workers)
+            with ThreadPoolExecutor(workers) as executor:
+                errors = list(executor.map(refresh_in_context, layers))
+
+        return [err for err in errors if err]
+
+    def _raster_classes(
+        self, layer: QgsRasterLayer, persist: bool = True
+    ) -> (list, str):
+        band = layer.renderer().band()
+        source = layer.source()
+        provider = layer.providerType()
+
+        key = hashlib.sha1(
+            json.dumps([provider, source, band, "unique_values", 0]).encode()
+        ).hexdigest()
+
+        classes = self._classification_cached(key)
+        if classes is not None:
+            return classes, ""
+
+        classes, err = RasterClassification(layer).unique_values(band)
+        if err:
+            return [], err
+
+        if persist:
+            self._classification_update(
+                key, provider, source, str(band), "unique_values", 0, classes
+            )
+        return classes, ""
+
+    def layer_preview(
+        self,
+        layer_name: str,
+        symbology: dict,
+        rendering: dict,
+        width: int,
+        height: int,
+        bbox: list | None = None,
+        timeout: int = 2000,
+    ) -> (bytes | None, str):
+        # neither the project nor the caches are updated
+        project = QgsProject()
+        project.read(
+            self._qgis_project_uri, Qgis.ProjectReadFlag.DontResolveLayers
+        )
+
+        layers = project.mapLayersByName(layer_name)
+        if not layers or layers[0].type() != Qgis.LayerType.Raster:
+            return None, f"Raster layer '{layer_name}' does not exist"
+
+        lyr = QgsRasterLayer(
+            layers[0].source(), layer_name, layers[0].providerType()
+        )
+        if not lyr.isValid():
+            return None, f"Invalid layer ({lyr.error().summary()})"
+
+        if layers[0].crs().isValid():
+            lyr.setCrs(layers[0].crs())
+
+        rc, err = self._apply_style_raster(lyr, symbology, rendering)
+        if not rc:
+            return None, err
+
+        # classes detected for the preview are not stored in the database
+        errors = self._refresh_min_max([lyr], persist=False)
+        if errors:
+            return None, errors[0]
+
+        extent = None
+        if bbox:
+            extent = QgsRectangle(*bbox)
+
+        self.debug(f"Render preview of {layer_name} ({width}x{height})")
+        return RasterPreview(lyr).render(width, height, extent, timeout)
+
     def layer_exists(self, name: str) -> bool:
         return bool(self.layer(name))
 
+    @locked
     def remove_layer(self, name: str) -> bool:
         # remove layer in qgis project
         project = QgsProject()
@@ -294,7 +830,9 @@ class QSAProject:
             ids.append(layer.id())
         project.removeMapLayers(ids)
 
-        rc = project.write()
+        rc = self._write(project)
+
+        self.database.execute("DELETE FROM overviews WHERE layer = ?", (name,))
 
         # remove layer in mapproxy config
         if self._mapproxy_enabled:
@@ -306,6 +844,7 @@ class QSAProject:
 
             mp.remove_layer(name)
             mp.write()
+            mp.remove_usage(name)
 
         return rc
 
@@ -329,6 +868,7 @@ class QSAProject:
 
             return self.name in projects and self._qgis_projects_dir().exists()
 
+    @locked
     def create(self, author: str) -> (bool, str):
         if self.exists():
             return False
@@ -348,7 +888,7 @@ class QSAProject:
         project.setCrs(crs)
 
         self.debug("Write QGIS project")
-        rc = project.write(self._qgis_project_uri)
+        rc = self._write(project)
 
         # create mapproxy config file
         if self._mapproxy_enabled:
@@ -357,10 +897,11 @@ class QSAProject:
             mp.create()
 
         # init sqlite database
-        self.sqlite_db
+        self.database.migrate()
 
         return rc, project.error()
 
+    @locked
     def remove(self) -> None:
         # clear cache and stuff
         for layer in self.layers:
@@ -372,6 +913,7 @@ class QSAProject:
             mp.remove()
 
         # remove qsa projects dir
+        self.database.close()
         shutil.rmtree(self._qgis_project_dir, ignore_errors=True)
 
         # remove remove qgis prohect in db if necessary
@@ -383,6 +925,7 @@ class QSAProject:
             )
             storage.removeProject(self._qgis_project_uri)
 
+    @locked
     def add_layer(
         self,
         datasource: str,
@@ -391,17 +934,25 @@ class QSAProject:
         epsg_code: int,
         overview: bool,
         datetime: QDateTime | None,
+        cache: dict | None = None,
+        overview_resampling: str = "NEAREST",
+        overview_background: bool = False,
     ) -> (bool, str):
         t = self._layer_type(layer_type)
         if t is None:
             return False, "Invalid layer type"
 
-        if name in self.layers:
+        # the project is read once and written once
+        project = QgsProject()
+        project.read(self._qgis_project_uri, Qgis.ProjectReadFlag.DontResolveLayers)
+
+        if project.mapLayersByName(name):
             return False, f"A layer {name} already exists"
 
         provider = QSAProject._layer_provider(t, datasource)
 
         lyr = None
+        build_overview = False
         if t == Qgis.LayerType.Vector:
             self.debug("Init vector layer")
             lyr = QgsVectorLayer(datasource, name, provider)
@@ -411,13 +962,16 @@ class QSAProject:
 
             ovr = RasterOverview(lyr)
             if overview:
-                if not ovr.is_valid():
+                if ovr.is_valid():
+                    self.debug("Overviews already exist")
+                elif overview_background:
+                    # built once the layer is added
+                    build_overview = True
+                else:
                     self.debug("Build overviews")
-                    rc, err = ovr.build()
+                    rc, err = ovr.build(overview_resampling)
                     if not rc:
                         return False, err
-                else:
-                    self.debug("Overviews already exist")
 
             if datetime:
                 self.debug("Activate temporal properties")
@@ -444,25 +998,11 @@ class QSAProject:
         if not lyr.isValid():
             return False, f"Invalid layer ({lyr.error()})"
 
-        # create project
-        project = QgsProject()
-        project.read(self._qgis_project_uri, Qgis.ProjectReadFlag.DontResolveLayers)
-        project.addMapLayer(lyr)
-
-        self.debug("Write QGIS project")
-        project.write()
-
-        # set default style
-        if t == Qgis.LayerType.Vector:
-            self.debug("Set default style")
-            geometry = lyr.geometryType().name.lower()
-            default_style = self.style_default(geometry)
-
-            self.layer_update_style(name, default_style, True)
-
-        # add layer in mapproxy config file
+        # prepare mapproxy config before touching the project, so that
+        # invalid cache options do not leave a half added layer
+        mp = None
         if self._mapproxy_enabled:
-            self.debug("Update MapProxy configuration file")
+            self.debug("Update MapProxy configuration")
 
             bbox = QSAProject._layer_bbox(lyr)
             epsg_code = QSAProject._layer_epsg_code(lyr)
@@ -477,15 +1017,49 @@ class QSAProject:
                 return False, err
 
             rc, err = mp.add_layer(
-                name, bbox, epsg_code, t == Qgis.LayerType.Raster, datetime
+                name,
+                bbox,
+                epsg_code,
+                t == Qgis.LayerType.Raster,
+                datetime,
+                cache,
             )
             if not rc:
                 return False, err
 
+        # set default style before adding the layer in the project
+        if t == Qgis.LayerType.Vector:
+            geometry = lyr.geometryType().name.lower()
+            default_style = self.style_default(geometry)
+
+            if (
+                default_style
+                and default_style != "default"
+                and self.style_exists(default_style)
+            ):
+                self.debug(f"Set default style {default_style}")
+                self._add_layer_style(lyr, default_style)
+                lyr.styleManager().setCurrentStyle(default_style)
+
+        # update project
+        project.addMapLayer(lyr)
+
+        self.debug("Write QGIS project")
+        self._write(project)
+
+        # add layer in mapproxy config file
+        if mp:
+            self.debug("Write MapProxy configuration file")
             mp.write()
 
+        if build_overview:
+            self._build_overview_background(
+                datasource, provider, name, overview_resampling
+            )
+
         return True, ""
 
+    @locked
     def add_style(
         self,
         name: str,
@@ -493,17 +1067,57 @@ class QSAProject:
         symbology: dict,
         rendering: dict,
     ) -> (bool, str):
+        qml, err = self._build_style(layer_type, symbology, rendering)
+        if not qml:
+            return False, err
+
+        self._write_style(name, qml)
+        return True, ""
+
+    def _build_style(
+        self, layer_type: str, symbology: dict, rendering: dict
+    ) -> (str, str):
+        # QML document of a style, not written yet
         t = self._layer_type(layer_type)
 
         if t == Qgis.LayerType.Vector:
-            return self._add_style_vector(name, symbology, rendering)
+            return self._build_style_vector(symbology, rendering)
         elif t == Qgis.LayerType.Raster:
-            return self._add_style_raster(name, symbology, rendering)
-        elif t is None:
-            return False, "Invalid layer type"
+            return self._build_style_raster(symbology, rendering)
+        return "", "Invalid layer type"
 
-    def _add_style_raster(
-        self, name: str, symbology: dict, rendering: dict
+    def _write_style(self, name: str, qml: str) -> None:
+        path = self._qgis_project_dir / f"{name}.qml"
+        with atomic_write(path) as tmp:
+            tmp.write_text(qml)
+        self._update_styles_index(name)
+
+    @staticmethod
+    def _style_document(layer: QgsMapLayer, categories) -> (str, str):
+        doc = QDomDocument()
+        err = layer.exportNamedStyle(doc, QgsReadWriteContext(), categories)
+        if err:
+            return "", err
+
+        # indented like files written by QgsMapLayer.saveNamedStyle
+        return doc.toString(2), ""
+
+    def _build_style_raster(
+        self, symbology: dict, rendering: dict
+    ) -> (str, str):
+        # init renderer
+        tif = Path(__file__).resolve().parent / "raster" / "empty.tif"
+        rl = QgsRasterLayer(tif.as_posix(), "", "gdal")
+
+        rc, err = self._apply_style_raster(rl, symbology, rendering)
+        if not rc:
+            return "", err
+
+        return self._style_document(rl, QgsMapLayer.AllStyleCategories)
+
+    @staticmethod
+    def _apply_style_raster(
+        rl: QgsRasterLayer, symbology: dict, rendering: dict
     ) -> (bool, str):
         # safety check
         if "type" not in symbology:
@@ -512,10 +1126,6 @@ class QSAProject:
         if "properties" not in symbology:
             return False, "`properties` is missing in `symbology`"
 
-        # init renderer
-        tif = Path(__file__).resolve().parent / "raster" / "empty.tif"
-        rl = QgsRasterLayer(tif.as_posix(), "", "gdal")
-
         # symbology
         renderer = RasterSymbologyRenderer(symbology["type"])
         renderer.load(symbology["properties"])
@@ -596,88 +1206,163 @@ class QSAProject:
                             blue_ce.setMaximumValue(renderer.blue_max)
                         rl.renderer().setBlueContrastEnhancement(blue_ce)
 
-            # save
-            path = self._qgis_project_dir / f"{name}.qml"
-            rl.saveNamedStyle(
-                path.as_posix(), categories=QgsMapLayer.AllStyleCategories
-            )
             return True, ""
 
         return False, "Error"
 
-    def _add_style_vector(
-        self, name: str, symbology: dict, rendering: dict
-    ) -> (bool, str):
+    def _build_style_vector(
+        self, symbology: dict, rendering: dict
+    ) -> (str, str):
         if "type" not in symbology:
-            return False, "`type` is missing in `symbology`"
+            return "", "`type` is missing in `symbology`"
 
         if "symbol" not in symbology:
-            return False, "`symbol` is missing in `symbology`"
+            return "", "`symbol` is missing in `symbology`"
 
         if "properties" not in symbology:
-            return False, "`properties` is missing in `symbology`"
+            return "", "`properties` is missing in `symbology`"
+
+        renderer = VectorSymbologyRenderer(symbology["type"])
+        if renderer.type is None:
+            return "", "Invalid symbol"
 
-        if symbology["type"] != "single_symbol":
-            return False, "Invalid symbol"
+        # classes are computed from the data of a layer when not given
+        if "layer" in symbology:
+            symbology, err = self._classify(symbology)
+            if err:
+                return "", err
+
+        rc, err = renderer.load(symbology)
+        if not rc:
+            return "", err
 
-        r = None
         vl = QgsVectorLayer()
-        symbol = symbology["symbol"]
-        properties = symbology["properties"]
 
-        if symbol == "line":
-            r = QgsSingleSymbolRenderer(
-                QgsSymbol.defaultSymbol(QgsWkbTypes.LineGeometry)
-            )
+        if "opacity" in rendering:
+            vl.setOpacity(float(rendering["opacity"]))
+
+        vl.setRenderer(renderer.renderer)
+
+        return self._style_document(vl, QgsMapLayer.Symbology)
+
+    def _classify(self, symbology: dict) -> (dict, str):
+        renderer_type = VectorSymbologyRenderer(symbology["type"]).type
+        if renderer_type == VectorSymbologyRenderer.Type.CATEGORIZED:
+            if "categories" in symbology:
+                return symbology, ""
+            method = "categories"
+        elif renderer_type == VectorSymbologyRenderer.Type.GRADUATED:
+            if "ranges" in symbology:
+                return symbology, ""
+            method = "equal_interval"
+            if "method" in symbology:
+                method = symbology["method"]
+            if method not in CLASSIFICATION_METHODS:
+                return {}, f"Invalid classification method '{method}'"
+        else:
+            return symbology, ""
 
-            props = QgsSimpleLineSymbolLayer().properties()
-            for key in properties.keys():
-                if key not in props:
-                    return False, "Invalid properties"
+        if "field" not in symbology:
+            return {}, "`field` is missing in `symbology`"
 
-            symbol = QgsLineSymbol.createSimple(properties)
-            r.setSymbol(symbol)
-        elif symbol == "fill":
-            r = QgsSingleSymbolRenderer(
-                QgsSymbol.defaultSymbol(QgsWkbTypes.PolygonGeometry)
-            )
+        classes = 5
+        if "classes" in symbology:
+            classes = int(symbology["classes"])
 
-            props = QgsSimpleFillSymbolLayer().properties()
-            for key in properties.keys():
-                if key not in props:
-                    return False, "Invalid properties"
+        refresh = False
+        if "refresh" in symbology:
+            refresh = bool(symbology["refresh"])
 
-            symbol = QgsFillSymbol.createSimple(properties)
-            r.setSymbol(symbol)
-        elif symbol == "marker":
-            r = QgsSingleSymbolRenderer(
-                QgsSymbol.defaultSymbol(QgsWkbTypes.PointGeometry)
+        # only the datasource is needed, layers are not loaded
+        project = QgsProject()
+        project.read(
+            self._qgis_project_uri, Qgis.ProjectReadFlag.DontResolveLayers
+        )
+        layers = project.mapLayersByName(symbology["layer"])
+        if not layers or layers[0].type() != Qgis.LayerType.Vector:
+            return {}, f"Vector layer '{symbology['layer']}' does not exist"
+
+        source = layers[0].source()
+        provider = layers[0].providerType()
+        field = symbology["field"]
+
+        key = hashlib.sha1(
+            json.dumps([provider, source, field, method, classes]).encode()
+        ).hexdigest()
+
+        values = None
+        if not refresh:
+            values = self._classification_cached(key)
+
+        if values is None:
+            self.debug(f"Compute {method} of {field} ({source})")
+            lyr = QgsVectorLayer(source, symbology["layer"], provider)
+            if not lyr.isValid():
+                return {}, f"Invalid layer ({lyr.error().summary()})"
+
+            classification = VectorClassification(lyr)
+            if method == "categories":
+                values, err = classification.categories(field)
+            else:
+                values, err = classification.breaks(field, method, classes)
+            if err:
+                return {}, err
+
+            self._classification_update(
+                key, provider, source, field, method, classes, values
             )
 
-            props = QgsSimpleMarkerSymbolLayer().properties()
-            for key in properties.keys():
-                if key not in props:
-                    return False, "Invalid properties"
+        symbology = dict(symbology)
+        if method == "categories":
+            symbology["categories"] = [{"value": v} for v in values]
+        else:
+            symbology["method"] = method
+            symbology["ranges"] = [
+                {"lower": lower, "upper": upper} for lower, upper in values
+            ]
 
-            symbol = QgsMarkerSymbol.createSimple(properties)
-            r.setSymbol(symbol)
+        return symbology, ""
 
-        if "opacity" in rendering:
-            vl.setOpacity(float(rendering["opacity"]))
+    def _classification_cached(self, key: str) -> list | None:
+        rows = self.database.execute(
+            "SELECT data FROM classifications WHERE key = ?", (key,)
+        )
 
-        if r:
-            vl.setRenderer(r)
+        if not rows:
+            return None
 
-            path = self._qgis_project_dir / f"{name}.qml"
-            vl.saveNamedStyle(
-                path.as_posix(), categories=QgsMapLayer.Symbology
-            )
-            return True, ""
+        return json.loads(rows[0][0])
 
-        return False, "Error"
+    def _classification_update(
+        self,
+        key: str,
+        provider: str,
+        source: str,
+        field: str,
+        method: str,
+        classes: int,
+        values: list,
+    ) -> None:
+        updated = QDateTime.currentDateTimeUtc().toString(Qt.ISODate)
+
+        self.database.execute(
+            "INSERT OR REPLACE INTO classifications "
+            "VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                provider,
+                source,
+                field,
+                method,
+                classes,
+                json.dumps(values),
+                updated,
+            ),
+        )
 
+    @locked
     def remove_style(self, name: str) -> bool:
-        if name not in self.styles:
+        if not self.style_exists(name):
             return False, f"Style '{name}' does not exist"
 
         p = QgsProject()
@@ -692,8 +1377,9 @@ class QSAProject:
 
         path = self._qgis_project_dir / f"{name}.qml"
         path.unlink()
+        self._update_styles_index(name, removed=True)
 
-        p.write()
+        self._write(p)
 
         return True, ""
 
@@ -705,6 +1391,19 @@ class QSAProject:
             msg = f"[{caller}][{self.schema}:{self.name}] {msg}"
         logger().debug(msg)
 
+    def _write(self, project: QgsProject) -> bool:
+        if StorageBackend.type() == StorageBackend.POSTGRESQL:
+            return project.write(self._qgis_project_uri)
+
+        # write in a temporary file within the same directory (to keep
+        # relative paths unchanged) then rename it atomically
+        path = Path(self._qgis_project_uri)
+        with atomic_write(path) as tmp:
+            rc = project.write(tmp.as_posix())
+            if not rc:
+                tmp.unlink(missing_ok=True)
+        return rc
+
     @staticmethod
     def _qgis_projects_dir() -> Path:
         return Path(config().qgisserver_projects_dir)
@@ -1,4 +1,6 @@
 # coding: utf8
 
-from .overview import RasterOverview
+from .overview import RasterOverview, RESAMPLINGS
 from .renderer import RasterSymbologyRenderer
+from .classification import RasterClassification
+from .preview import RasterPreview, PREVIEW_MAX_SIZE
@@ -0,0 +1,73 @@
+# coding: utf8
+
+import math
+import rasterio
+import numpy as np
+from rasterio.enums import Resampling
+
+from qgis.core import QgsRasterLayer, QgsPalettedRasterRenderer
+
+MAX_CLASSES = 256
+
+
+class RasterClassification:
+    """
+    Detect the unique values of a categorical raster band. The raster
+    attribute table is used when available, otherwise values are read on
+    a decimated grid so that GDAL relies on overviews instead of a full
+    scan of the band.
+    """
+
+    def __init__(self, layer: QgsRasterLayer, sample_size: int = 1000000):
+        self.layer = layer
+        self.sample_size = sample_size
+
+    def unique_values(
+        self, band: int, limit: int = MAX_CLASSES
+    ) -> (list, str):
+        if band < 1 or band > self.layer.bandCount():
+            return [], f"Invalid band {band}"
+
+        classes = []
+        rat = self.layer.attributeTable(band)
+        if rat:
+            for c in QgsPalettedRasterRenderer.rasterAttributeTableToClassData(
+                rat
+            ):
+                klass = {"value": c.value, "label": c.label}
+                if c.color.isValid():
+                    klass["color"] = c.color.name()
+                classes.append(klass)
+        elif self.layer.providerType() == "gdal":
+            for value in self._sample(band):
+                classes.append({"value": value, "label": f"{value:g}"})
+        else:
+            for c in QgsPalettedRasterRenderer.classDataFromRaster(
+                self.layer.dataProvider(), band
+            ):
+                classes.append({"value": c.value, "label": c.label})
+
+        if len(classes) > limit:
+            return [], f"Too many unique values (more than {limit})"
+
+        return classes, ""
+
+    def _sample(self, band: int) -> list:
+        with rasterio.open(self.layer.source()) as ds:
+            width = ds.width
+            height = ds.height
+
+            pixels = width * height
+            if self.sample_size and pixels > self.sample_size:
+                factor = math.sqrt(pixels / self.sample_size)
+                width = max(1, int(width / factor))
+                height = max(1, int(height / factor))
+
+            data = ds.read(
+                band,
+                out_shape=(height, width),
+                resampling=Resampling.nearest,
+                masked=True,
+            ).compressed()
+
+        return [float(v) for v in np.unique(data)]
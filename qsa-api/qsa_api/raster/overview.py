@@ -1,6 +1,7 @@
 # coding: utf8
 
 import sys
+import time
 from pathlib import Path
 
 from qgis.core import QgsRasterLayer, Qgis
@@ -8,6 +9,16 @@ from qgis.core import QgsRasterLayer, Qgis
 from ..config import QSAConfig
 from ..utils import logger, s3_parse_uri, s3_bucket_upload
 
+RESAMPLINGS = [
+    "NEAREST",
+    "AVERAGE",
+    "GAUSS",
+    "CUBIC",
+    "CUBICSPLINE",
+    "LANCZOS",
+    "MODE",
+]
+
 
 class RasterOverview:
     def __init__(self, layer: QgsRasterLayer) -> None:
@@ -16,7 +27,7 @@ class RasterOverview:
     def is_valid(self):
         return self.layer.dataProvider().hasPyramids()
 
-    def build(self) -> (bool, str):
+    def build(self, resampling: str = "NEAREST") -> (bool, str):
         ds = self.layer.source()
 
         # check if rasters stored on S3
@@ -29,11 +40,19 @@ class RasterOverview:
         for idx, level in enumerate(levels):
             levels[idx].setBuild(True)
 
-        # build overviews
+        # build overviews: GDAL computes each level from the previous one
+        # and processes chunks of a level with several threads
+        start = time.perf_counter()
+        threads = QSAConfig().processing_workers
         fmt = Qgis.RasterPyramidFormat.GeoTiff
-        err = self.layer.dataProvider().buildPyramids(levels, "NEAREST", fmt)
+        err = self.layer.dataProvider().buildPyramids(
+            levels, resampling, fmt, [f"GDAL_NUM_THREADS={threads}"]
+        )
         if err:
             return False, f"Cannot build overview ({err})"
+        self.debug(
+            f"{len(levels)} levels built in {time.perf_counter() - start:.2f}s ({resampling})"
+        )
 
         # search ovr file in GDAL PAM directory
         ovrfile = f"{Path(ds).name}.ovr"
@@ -47,9 +66,11 @@ class RasterOverview:
         bucket, subdirs, _ = s3_parse_uri(ds)
         dest = Path(subdirs) / ovrfile
 
+        start = time.perf_counter()
         rc, msg = s3_bucket_upload(bucket, ovrpath.as_posix(), dest.as_posix())
         if not rc:
             return False, msg
+        self.debug(f"Overviews uploaded in {time.perf_counter() - start:.2f}s")
 
         # clean
         self.debug("Remove ovr file in GDAL PAM directory")
@@ -0,0 +1,71 @@
+# coding: utf8
+
+from qgis.PyQt.QtGui import QColor
+from qgis.PyQt.QtCore import QSize, QTimer, QBuffer, QEventLoop, QIODevice
+from qgis.core import (
+    Qgis,
+    QgsRectangle,
+    QgsMapSettings,
+    QgsRasterLayer,
+    QgsMapRendererParallelJob,
+)
+
+PREVIEW_MAX_SIZE = 1024
+
+
+class RasterPreview:
+    """
+    Render a thumbnail of a raster layer in process.
+
+    No render flag selects overviews: blocks are requested at the output
+    resolution and the data provider (GDAL) reads the closest overview
+    level when the dataset has some, or decimates full resolution data
+    otherwise.
+    """
+
+    def __init__(self, layer: QgsRasterLayer) -> None:
+        self.layer = layer
+
+    def render(
+        self,
+        width: int,
+        height: int,
+        extent: QgsRectangle | None = None,
+        timeout: int = 2000,
+    ) -> (bytes | None, str):
+        if width > PREVIEW_MAX_SIZE or height > PREVIEW_MAX_SIZE:
+            return None, f"Preview size is limited to {PREVIEW_MAX_SIZE}"
+
+        if extent is None or extent.isEmpty():
+            extent = self.layer.extent()
+
+        settings = QgsMapSettings()
+        settings.setLayers([self.layer])
+        settings.setDestinationCrs(self.layer.crs())
+        settings.setOutputSize(QSize(width, height))
+        settings.setExtent(extent)
+        settings.setBackgroundColor(QColor(0, 0, 0, 0))
+        settings.setFlag(Qgis.MapSettingsFlag.RenderPreviewJob, True)
+
+        # rendering is stopped when the time budget is exceeded. The local
+        # event loop runs in the thread of the request, which delivers the
+        # signals of the job and the timer without the main Qt loop.
+        job = QgsMapRendererParallelJob(settings)
+
+        loop = QEventLoop()
+        job.finished.connect(loop.quit)
+        QTimer.singleShot(timeout, loop.quit)
+
+        job.start()
+        if job.isActive():
+            loop.exec_()
+
+        if job.isActive():
+            job.cancel()
+            return None, f"Rendering exceeded {timeout} ms"
+
+        buffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        job.renderedImage().save(buffer, "PNG")
+
+        return bytes(buffer.data()), ""
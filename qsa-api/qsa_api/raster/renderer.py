@@ -3,6 +3,7 @@
 from enum import Enum
 from pathlib import Path
 
+from qgis.PyQt.QtGui import QColor
 from qgis.core import (
     QgsStyle,
     QgsRasterLayer,
@@ -12,6 +13,7 @@ from qgis.core import (
     QgsGradientColorRamp,
     QgsRasterMinMaxOrigin,
     QgsContrastEnhancement,
+    QgsPalettedRasterRenderer,
     QgsSingleBandGrayRenderer,
     QgsMultiBandColorRenderer,
     QgsSingleBandPseudoColorRenderer,
@@ -29,6 +31,7 @@ class RasterSymbologyRenderer:
             None, 1
         ).type()
         MULTI_BAND_COLOR = QgsMultiBandColorRenderer(None, 1, 1, 1).type()
+        PALETTED = QgsPalettedRasterRenderer(None, 1, []).type()
 
     def __init__(self, name: str) -> None:
         self.renderer = None
@@ -52,6 +55,8 @@ class RasterSymbologyRenderer:
             name == RasterSymbologyRenderer.Type.SINGLE_BAND_PSEUDOCOLOR.value
         ):
             self.renderer = QgsSingleBandPseudoColorRenderer(None, 1)
+        elif name == RasterSymbologyRenderer.Type.PALETTED.value:
+            self.renderer = QgsPalettedRasterRenderer(None, 1, [])
 
     @property
     def type(self):
@@ -70,6 +75,8 @@ class RasterSymbologyRenderer:
             == RasterSymbologyRenderer.Type.SINGLE_BAND_PSEUDOCOLOR.value
         ):
             return RasterSymbologyRenderer.Type.SINGLE_BAND_PSEUDOCOLOR
+        elif self.renderer.type() == RasterSymbologyRenderer.Type.PALETTED.value:
+            return RasterSymbologyRenderer.Type.PALETTED
 
         return None
 
@@ -86,6 +93,8 @@ class RasterSymbologyRenderer:
             self._load_singlebandgray_properties(properties)
         elif self.type == RasterSymbologyRenderer.Type.SINGLE_BAND_PSEUDOCOLOR:
             self._load_singlebandpseudocolor_properties(properties)
+        elif self.type == RasterSymbologyRenderer.Type.PALETTED:
+            self._load_paletted_properties(properties)
 
         return True, ""
 
@@ -107,6 +116,16 @@ class RasterSymbologyRenderer:
         elif self.type == RasterSymbologyRenderer.Type.SINGLE_BAND_PSEUDOCOLOR:
             self._refresh_min_max_singlebandpseudocolor(layer)
 
+    @staticmethod
+    def refresh_classes(layer: QgsRasterLayer, classes: list) -> None:
+        # classes detected on data are colored according to the ramp of
+        # the style
+        renderer = layer.renderer()
+        palette = RasterSymbologyRenderer._palette(
+            classes, renderer.sourceColorRamp()
+        )
+        renderer.setClassData(palette)
+
     @staticmethod
     def style_to_json(path: Path) -> (dict, str):
         tif = Path(__file__).resolve().parent / "empty.tif"
@@ -138,6 +157,8 @@ class RasterSymbologyRenderer:
             props = RasterSymbologyRenderer._singlebandpseudocolor_properties(
                 renderer
             )
+        elif renderer_type == RasterSymbologyRenderer.Type.PALETTED:
+            props = RasterSymbologyRenderer._paletted_properties(renderer)
 
         m["symbology"]["properties"] = props
 
@@ -294,6 +315,29 @@ class RasterSymbologyRenderer:
 
         return props
 
+    @staticmethod
+    def _paletted_properties(renderer) -> dict:
+        props = {}
+
+        props["band"] = {}
+        props["band"]["band"] = renderer.band()
+
+        if renderer.sourceColorRamp():
+            ramp = renderer.sourceColorRamp().properties()
+            props["ramp"] = {}
+            props["ramp"]["color1"] = ramp["color1"].split("rgb")[0]
+            props["ramp"]["color2"] = ramp["color2"].split("rgb")[0]
+
+        props["classes"] = []
+        for c in renderer.classes():
+            klass = {}
+            klass["value"] = c.value
+            klass["color"] = c.color.name()
+            klass["label"] = c.label
+            props["classes"].append(klass)
+
+        return props
+
     def _refresh_min_max_multibandcolor(self, layer: QgsRasterLayer) -> None:
         renderer = layer.renderer()
         red_ce = QgsContrastEnhancement(renderer.redContrastEnhancement())
@@ -497,6 +541,51 @@ class RasterSymbologyRenderer:
 
             self.renderer.shader().rasterShaderFunction().classifyColorRamp()
 
+    def _load_paletted_properties(self, properties: dict) -> None:
+        if "band" in properties:
+            self.renderer.setBand(int(properties["band"]["band"]))
+
+        color_ramp = None
+        if "ramp" in properties:
+            ramp = properties["ramp"]
+            if "name" in ramp and ramp["name"]:
+                color_ramp = QgsStyle().defaultStyle().colorRamp(ramp["name"])
+            elif "color1" in ramp and "color2" in ramp:
+                color_ramp = QgsGradientColorRamp.create(ramp)
+
+            if color_ramp:
+                self.renderer.setSourceColorRamp(color_ramp.clone())
+
+        # without classes, unique values are detected when the style is
+        # applied on a layer
+        if "classes" in properties:
+            classes = []
+            for c in properties["classes"]:
+                klass = {"value": float(c["value"])}
+                klass["label"] = str(c["label"]) if "label" in c else ""
+                if "color" in c:
+                    klass["color"] = c["color"]
+                classes.append(klass)
+
+            self.renderer.setClassData(self._palette(classes, color_ramp))
+
+    @staticmethod
+    def _palette(classes: list, ramp) -> list:
+        if ramp is None:
+            ramp = QgsStyle().defaultStyle().colorRamp("Spectral")
+
+        palette = []
+        for index, c in enumerate(classes):
+            color = QColor(c["color"]) if "color" in c else QColor()
+            if not color.isValid():
+                color = ramp.color(index / max(1, len(classes) - 1))
+
+            palette.append(
+                QgsPalettedRasterRenderer.Class(c["value"], color, c["label"])
+            )
+
+        return palette
+
     def _load_contrast_enhancement(self, properties: dict) -> None:
         if "algorithm" in properties:
             alg = properties["algorithm"]
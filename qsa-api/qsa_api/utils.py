@@ -1,14 +1,16 @@
 # coding: utf8
 
 import os
-import sys
+import time
 import boto3
-import logging
 import threading
 from enum import Enum
 from pathlib import Path
+from contextlib import contextmanager
 from flask import current_app
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
+from boto3.exceptions import S3UploadFailedError
 
 from .config import QSAConfig
 
@@ -29,6 +31,22 @@ def s3_parse_uri(uri: str):
     return bucket, subdirs, filename
 
 
+@contextmanager
+def atomic_write(path: Path):
+    # yield a temporary path in the same directory and atomically rename it
+    # afterwards, so that readers never see a partially written file
+    path = Path(path)
+    tmp = path.with_name(
+        f".{path.stem}.{os.getpid()}.{threading.get_ident()}{path.suffix}"
+    )
+    try:
+        yield tmp
+        if tmp.exists():
+            os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
 class StorageBackend(Enum):
     FILESYSTEM = 0
     POSTGRESQL = 1
@@ -50,56 +68,97 @@ def qgisserver_base_url(project: str, psql_schema: str) -> str:
     return url
 
 
+# S3 clients are thread safe but cannot be shared between processes
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+
+def s3_client():
+    pid = os.getpid()
+    with _s3_clients_lock:
+        if pid not in _s3_clients:
+            _s3_clients.clear()
+            _s3_clients[pid] = boto3.session.Session().client("s3")
+        return _s3_clients[pid]
+
+
+def s3_transfer_config(cfg: QSAConfig) -> TransferConfig:
+    mb = 1024 * 1024
+    return TransferConfig(
+        multipart_threshold=cfg.s3_multipart_threshold * mb,
+        multipart_chunksize=cfg.s3_multipart_chunksize * mb,
+        max_concurrency=cfg.s3_max_concurrency,
+        use_threads=cfg.s3_max_concurrency > 1,
+    )
+
+
 # see boto3 doc
 class ProgressPercentage:
 
-    def __init__(self, filename):
+    def __init__(self, filename, log):
+        # the logger is given by the caller because the callback is called
+        # from boto3 threads, outside of the application context
         self._filename = filename
         self._size = float(os.path.getsize(filename))
         self._seen_so_far = 0
         self._lock = threading.Lock()
         self._last = 0
+        self._log = log
 
     def __call__(self, bytes_amount):
         with self._lock:
             self._seen_so_far += bytes_amount
-            percentage = (self._seen_so_far / self._size) * 100
+            percentage = 100.0
+            if self._size:
+                percentage = (self._seen_so_far / self._size) * 100
 
             if percentage < self._last + 5:
                 return
 
             self._last = percentage
 
-            if QSAConfig().loglevel == logging.DEBUG:
-                print(
-                    "\r%s  %s / %s  (%.2f%%)"
-                    % (
-                        self._filename,
-                        self._seen_so_far,
-                        self._size,
-                        percentage,
-                    ),
-                    file=sys.stderr,
-                )
-            sys.stdout.flush()
+            self._log.debug(
+                "[utils.s3_bucket_upload] %s  %s / %s  (%.2f%%)",
+                self._filename,
+                self._seen_so_far,
+                self._size,
+                percentage,
+            )
 
 
 def s3_bucket_upload(bucket: str, source: str, dest: str) -> (bool, str):
+    cfg = QSAConfig()
+    log = logger()
 
-    size = float(os.path.getsize(source) >> 20)
+    size = os.path.getsize(source) / (1024 * 1024)
 
-    logger().debug(
-        f"[utils.s3_bucket_upload] Upload {source} ({size}MB) to S3 bucket {bucket} in {dest}"
+    log.debug(
+        f"[utils.s3_bucket_upload] Upload {source} ({size:.2f}MB) to S3 bucket {bucket} in {dest}"
     )
 
+    # S3 verifies the checksum computed by the client for each part
+    extra_args = {}
+    if cfg.s3_checksum_algorithm:
+        extra_args["ChecksumAlgorithm"] = cfg.s3_checksum_algorithm
+
+    start = time.perf_counter()
     try:
-        s3 = boto3.resource("s3")
-        s3.Bucket(bucket).upload_file(
+        s3_client().upload_file(
             source,
+            bucket,
             dest,
-            Callback=ProgressPercentage(source),
+            ExtraArgs=extra_args,
+            Config=s3_transfer_config(cfg),
+            Callback=ProgressPercentage(source, log),
         )
-    except ClientError as e:
+    except (ClientError, S3UploadFailedError) as e:
+        log.error(f"[utils.s3_bucket_upload] {e}")
         return False, "Upload to S3 bucket failed"
+    duration = time.perf_counter() - start
+
+    throughput = size / duration if duration else 0.0
+    log.info(
+        f"[utils.s3_bucket_upload] Uploaded {size:.2f}MB to {bucket}/{dest} in {duration:.2f}s ({throughput:.2f}MB/s)"
+    )
 
     return True, ""
@@ -1,3 +1,4 @@
 # coding: utf8
 
 from .renderer import VectorSymbologyRenderer
+from .classification import VectorClassification, CLASSIFICATION_METHODS
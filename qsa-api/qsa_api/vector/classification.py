@@ -0,0 +1,204 @@
+# coding: utf8
+
+from qgis.core import (
+    QgsExpression,
+    QgsVectorLayer,
+    QgsVariantUtils,
+    QgsFeatureRequest,
+    QgsDataSourceUri,
+    QgsProviderRegistry,
+    QgsClassificationJenks,
+    QgsClassificationQuantile,
+    QgsClassificationPrettyBreaks,
+    QgsClassificationEqualInterval,
+    QgsClassificationStandardDeviation,
+)
+
+CLASSIFICATION_METHODS = {
+    "equal_interval": QgsClassificationEqualInterval,
+    "quantile": QgsClassificationQuantile,
+    "jenks": QgsClassificationJenks,
+    "pretty": QgsClassificationPrettyBreaks,
+    "stddev": QgsClassificationStandardDeviation,
+}
+
+MAX_CATEGORIES = 256
+
+
+class VectorClassification:
+    """
+    Compute classes of a vector layer with aggregates evaluated by the
+    provider whenever possible: SQL queries for PostgreSQL and a sample
+    of features fetched by id, without geometry, otherwise.
+    """
+
+    def __init__(self, layer: QgsVectorLayer, sample_size: int = 10000):
+        self.layer = layer
+        self.sample_size = sample_size
+
+    def categories(
+        self, field: str, limit: int = MAX_CATEGORIES
+    ) -> (list, str):
+        idx = self.layer.fields().lookupField(field)
+        if idx < 0:
+            return [], f"Invalid field '{field}'"
+
+        # SELECT DISTINCT for database providers
+        values = self.layer.dataProvider().uniqueValues(idx, limit + 1)
+        if len(values) > limit:
+            return [], f"Too many categories (more than {limit})"
+
+        values = [self._value(v) for v in values]
+        return sorted(values, key=lambda v: (v is None, str(v))), ""
+
+    def breaks(self, field: str, method: str, classes: int) -> (list, str):
+        idx = self.layer.fields().lookupField(field)
+        if idx < 0:
+            return [], f"Invalid field '{field}'"
+
+        if not self.layer.fields().at(idx).isNumeric():
+            return [], f"Field '{field}' is not numeric"
+
+        if method not in CLASSIFICATION_METHODS:
+            return [], f"Invalid classification method '{method}'"
+
+        classification = CLASSIFICATION_METHODS[method]()
+        provider = self.layer.dataProvider()
+
+        if not classification.valuesRequired():
+            mini = provider.minimumValue(idx)
+            maxi = provider.maximumValue(idx)
+            if QgsVariantUtils.isNull(mini) or QgsVariantUtils.isNull(maxi):
+                return [], f"No value for field '{field}'"
+
+            ranges = classification.classes(float(mini), float(maxi), classes)
+            return self._bounds(ranges), ""
+
+        if method == "quantile" and self._is_postgres:
+            return self._postgres_quantiles(field, classes)
+
+        values = self._sample(field, idx)
+        if not values:
+            return [], f"No value for field '{field}'"
+
+        ranges = classification.classes(values, classes)
+        return self._bounds(ranges), ""
+
+    @property
+    def _is_postgres(self) -> bool:
+        return self.layer.providerType() == "postgres"
+
+    def _sample(self, field: str, idx: int) -> list:
+        if self._is_postgres:
+            return self._postgres_sample(field)
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([idx])
+
+        count = self.layer.dataProvider().featureCount()
+        if count <= self.sample_size:
+            return self._values(request, idx)[0]
+
+        # features are fetched by id with a regular stride rather than
+        # iterating over the whole dataset, ids being contiguous with most
+        # OGR formats
+        first = QgsFeatureRequest(request)
+        first.setLimit(1)
+        feature = next(self.layer.getFeatures(first), None)
+        if feature is None:
+            # the feature count may be stale
+            return []
+
+        step = count / self.sample_size
+        sample = QgsFeatureRequest(request)
+        sample.setFilterFids(
+            [feature.id() + int(i * step) for i in range(self.sample_size)]
+        )
+
+        values, fetched = self._values(sample, idx)
+        if fetched >= self.sample_size // 2:
+            return values
+
+        # sparse ids (deleted features): every n-th feature is kept while
+        # iterating over the dataset, so that the sample isn't biased
+        # towards the first features
+        return self._values(request, idx, step)[0]
+
+    def _values(
+        self, request: QgsFeatureRequest, idx: int, step: float = 1
+    ) -> (list, int):
+        values = []
+        fetched = 0
+        for i, feature in enumerate(self.layer.getFeatures(request)):
+            if i < int(fetched * step):
+                continue
+            fetched += 1
+
+            value = feature.attribute(idx)
+            if not QgsVariantUtils.isNull(value):
+                values.append(float(value))
+
+        return values, fetched
+
+    def _postgres_sample(self, field: str) -> list:
+        column = QgsExpression.quotedColumnRef(field)
+        sql = f"SELECT {column} FROM {self._postgres_from(column)}"
+
+        # a random filter reads the table once, unlike ORDER BY random()
+        # and unlike TABLESAMPLE it also works with views
+        count = self.layer.dataProvider().featureCount()
+        if count > self.sample_size:
+            sql += f" AND random() < {self.sample_size / count}"
+        sql += f" LIMIT {self.sample_size}"
+
+        return [float(row[0]) for row in self._postgres_execute(sql)]
+
+    def _postgres_quantiles(self, field: str, classes: int) -> (list, str):
+        column = QgsExpression.quotedColumnRef(field)
+        fractions = ", ".join(str(i / classes) for i in range(classes + 1))
+        sql = (
+            f"SELECT unnest(percentile_cont(ARRAY[{fractions}]) "
+            f"WITHIN GROUP (ORDER BY {column})) "
+            f"FROM {self._postgres_from(column)}"
+        )
+
+        values = []
+        for row in self._postgres_execute(sql):
+            if row[0] is not None and float(row[0]) not in values:
+                values.append(float(row[0]))
+
+        if not values:
+            return [], f"No value for field '{field}'"
+
+        if len(values) == 1:
+            return [[values[0], values[0]]], ""
+
+        return [[lo, hi] for lo, hi in zip(values, values[1:])], ""
+
+    def _postgres_from(self, column: str) -> str:
+        uri = QgsDataSourceUri(self.layer.source())
+
+        clause = f"{uri.quotedTablename()} WHERE {column} IS NOT NULL"
+        if self.layer.subsetString():
+            clause += f" AND ({self.layer.subsetString()})"
+        return clause
+
+    def _postgres_execute(self, sql: str) -> list:
+        md = QgsProviderRegistry.instance().providerMetadata("postgres")
+        con = md.createConnection(self.layer.source(), {})
+        return con.executeSql(sql)
+
+    @staticmethod
+    def _bounds(ranges: list) -> list:
+        return [[r.lowerBound(), r.upperBound()] for r in ranges]
+
+    @staticmethod
+    def _value(value):
+        if QgsVariantUtils.isNull(value):
+            return None
+
+        if isinstance(value, (bool, int, float, str)):
+            return value
+
+        return str(value)
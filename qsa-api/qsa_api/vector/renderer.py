@@ -1,20 +1,103 @@
 # coding: utf8
 
+from enum import Enum
 from pathlib import Path
 
 from qgis.core import (
+    QgsStyle,
     QgsSymbol,
+    QgsExpression,
+    QgsLineSymbol,
+    QgsFillSymbol,
+    QgsMarkerSymbol,
+    QgsRendererRange,
     QgsFeatureRenderer,
+    QgsRendererCategory,
     QgsReadWriteContext,
+    QgsRuleBasedRenderer,
+    QgsSingleSymbolRenderer,
+    QgsSimpleFillSymbolLayer,
+    QgsSimpleLineSymbolLayer,
+    QgsSimpleMarkerSymbolLayer,
+    QgsGraduatedSymbolRenderer,
+    QgsCategorizedSymbolRenderer,
 )
 
 from qgis.PyQt.QtXml import QDomDocument, QDomNode
 
+from .classification import CLASSIFICATION_METHODS, VectorClassification
+
 
 RENDERER_TAG_NAME = "renderer-v2"  # constant from core/symbology/renderer.h
 
+SYMBOLS = {
+    "line": (QgsLineSymbol, QgsSimpleLineSymbolLayer),
+    "fill": (QgsFillSymbol, QgsSimpleFillSymbolLayer),
+    "marker": (QgsMarkerSymbol, QgsSimpleMarkerSymbolLayer),
+}
+
+# property of the main color of simple symbol layers
+COLOR_PROPERTIES = {
+    "line": "line_color",
+    "fill": "color",
+    "marker": "color",
+}
+
 
 class VectorSymbologyRenderer:
+    class Type(Enum):
+        SINGLE_SYMBOL = "single_symbol"
+        CATEGORIZED = "categorized"
+        GRADUATED = "graduated"
+        RULE_BASED = "rule_based"
+
+    def __init__(self, name: str) -> None:
+        self.renderer = None
+        self.type = None
+
+        for t in VectorSymbologyRenderer.Type:
+            if t.value == name:
+                self.type = t
+
+    def load(self, symbology: dict) -> (bool, str):
+        if self.type is None:
+            return False, "Invalid symbol"
+
+        symbol, err = self.symbol(symbology["symbol"], symbology["properties"])
+        if symbol is None:
+            return False, err
+
+        if self.type == VectorSymbologyRenderer.Type.SINGLE_SYMBOL:
+            self.renderer = QgsSingleSymbolRenderer(symbol)
+            return True, ""
+
+        ramp = None
+        if "ramp" in symbology:
+            ramp = QgsStyle.defaultStyle().colorRamp(symbology["ramp"])
+            if ramp is None:
+                return False, f"Invalid color ramp '{symbology['ramp']}'"
+
+        if self.type == VectorSymbologyRenderer.Type.CATEGORIZED:
+            return self._load_categorized(symbology, symbol, ramp)
+        elif self.type == VectorSymbologyRenderer.Type.GRADUATED:
+            return self._load_graduated(symbology, symbol, ramp)
+
+        return self._load_rule_based(symbology, ramp)
+
+    @staticmethod
+    def symbol(symbol: str, properties: dict) -> (QgsSymbol | None, str):
+        if symbol not in SYMBOLS:
+            return None, "Invalid symbol"
+
+        symbol_class, symbol_layer_class = SYMBOLS[symbol]
+
+        props = symbol_layer_class().properties()
+        for key in properties.keys():
+            if key not in props:
+                return None, "Invalid properties"
+
+        return symbol_class.createSimple(properties), ""
+
     @staticmethod
     def style_is_vector(path: Path) -> bool:
         with open(path, "r") as file:
@@ -36,7 +119,35 @@ class VectorSymbologyRenderer:
         if renderer is None:
             return {}, f"Internal error: vector style {path} cannot be loaded"
 
-        symbol = renderer.symbol()
+        symbology = {}
+        if isinstance(renderer, QgsSingleSymbolRenderer):
+            symbology["type"] = "single_symbol"
+            symbol = renderer.symbol()
+        elif isinstance(renderer, QgsCategorizedSymbolRenderer):
+            symbology = VectorSymbologyRenderer._categorized_properties(
+                renderer
+            )
+            symbol = renderer.sourceSymbol()
+        elif isinstance(renderer, QgsGraduatedSymbolRenderer):
+            symbology = VectorSymbologyRenderer._graduated_properties(
+                renderer
+            )
+            symbol = renderer.sourceSymbol()
+        elif isinstance(renderer, QgsRuleBasedRenderer):
+            symbology = VectorSymbologyRenderer._rule_based_properties(
+                renderer
+            )
+            symbol = None
+            for rule in renderer.rootRule().children():
+                if rule.symbol():
+                    symbol = rule.symbol()
+                    break
+        else:
+            return {}, f"Unsupported renderer {renderer.type()} in {path}"
+
+        if symbol is None:
+            return {}, f"Internal error: no symbol in vector style {path}"
+
         props = symbol.symbolLayer(0).properties()
         opacity = symbol.opacity()
 
@@ -49,8 +160,7 @@ class VectorSymbologyRenderer:
         m["name"] = path.stem
         m["type"] = "vector"
 
-        m["symbology"] = {}
-        m["symbology"]["type"] = "single_symbol"
+        m["symbology"] = symbology
         m["symbology"]["properties"] = props
         m["symbology"]["symbol"] = symbol
         m["symbology"]["geometry"] = geom
@@ -59,3 +169,198 @@ class VectorSymbologyRenderer:
         m["rendering"]["opacity"] = opacity
 
         return m, ""
+
+    @staticmethod
+    def _class_symbol(
+        symbology: dict,
+        klass: dict,
+        ramp,
+        index: int,
+        count: int,
+    ) -> (QgsSymbol | None, str):
+        # properties of a class override the ones of the style
+        props = dict(symbology["properties"])
+        if "properties" in klass:
+            props.update(klass["properties"])
+
+        symbol, err = VectorSymbologyRenderer.symbol(symbology["symbol"], props)
+        if symbol is None:
+            return None, err
+
+        if ramp and COLOR_PROPERTIES[symbology["symbol"]] not in props:
+            symbol.setColor(ramp.color(index / max(1, count - 1)))
+
+        return symbol, ""
+
+    def _load_categorized(
+        self, symbology: dict, symbol: QgsSymbol, ramp
+    ) -> (bool, str):
+        if "field" not in symbology:
+            return False, "`field` is missing in `symbology`"
+
+        if "categories" not in symbology:
+            return False, "`categories` is missing in `symbology`"
+
+        categories = []
+        count = len(symbology["categories"])
+        for index, category in enumerate(symbology["categories"]):
+            if "value" not in category:
+                return False, "`value` is missing in category"
+
+            s, err = self._class_symbol(symbology, category, ramp, index, count)
+            if s is None:
+                return False, err
+
+            value = category["value"]
+            label = "" if value is None else str(value)
+            if "label" in category:
+                label = category["label"]
+
+            categories.append(QgsRendererCategory(value, s, label))
+
+        self.renderer = QgsCategorizedSymbolRenderer(
+            symbology["field"], categories
+        )
+        self.renderer.setSourceSymbol(symbol)
+        if ramp:
+            self.renderer.setSourceColorRamp(ramp)
+
+        return True, ""
+
+    def _load_graduated(
+        self, symbology: dict, symbol: QgsSymbol, ramp
+    ) -> (bool, str):
+        if "field" not in symbology:
+            return False, "`field` is missing in `symbology`"
+
+        if "ranges" not in symbology:
+            return False, "`ranges` is missing in `symbology`"
+
+        ranges = []
+        count = len(symbology["ranges"])
+        for index, r in enumerate(symbology["ranges"]):
+            if "lower" not in r or "upper" not in r:
+                return False, "`lower` or `upper` is missing in range"
+
+            s, err = self._class_symbol(symbology, r, ramp, index, count)
+            if s is None:
+                return False, err
+
+            lower = float(r["lower"])
+            upper = float(r["upper"])
+            label = f"{lower:g} - {upper:g}"
+            if "label" in r:
+                label = r["label"]
+
+            ranges.append(QgsRendererRange(lower, upper, s, label))
+
+        self.renderer = QgsGraduatedSymbolRenderer(symbology["field"], ranges)
+        self.renderer.setSourceSymbol(symbol)
+        if ramp:
+            self.renderer.setSourceColorRamp(ramp)
+
+        if "method" in symbology:
+            method = symbology["method"]
+            if method not in CLASSIFICATION_METHODS:
+                return False, f"Invalid classification method '{method}'"
+            self.renderer.setClassificationMethod(
+                CLASSIFICATION_METHODS[method]()
+            )
+
+        return True, ""
+
+    def _load_rule_based(self, symbology: dict, ramp) -> (bool, str):
+        if "rules" not in symbology:
+            return False, "`rules` is missing in `symbology`"
+
+        root = QgsRuleBasedRenderer.Rule(None)
+
+        count = len(symbology["rules"])
+        for index, r in enumerate(symbology["rules"]):
+            s, err = self._class_symbol(symbology, r, ramp, index, count)
+            if s is None:
+                return False, err
+
+            rule = QgsRuleBasedRenderer.Rule(s)
+
+            if "filter" in r:
+                exp = QgsExpression(r["filter"])
+                if exp.hasParserError():
+                    return False, f"Invalid filter ({exp.parserErrorString()})"
+                rule.setFilterExpression(r["filter"])
+
+            if "label" in r:
+                rule.setLabel(r["label"])
+
+            if "min_scale" in r:
+                rule.setMinimumScale(float(r["min_scale"]))
+
+            if "max_scale" in r:
+                rule.setMaximumScale(float(r["max_scale"]))
+
+            if "else" in r:
+                rule.setIsElse(bool(r["else"]))
+
+            root.appendChild(rule)
+
+        self.renderer = QgsRuleBasedRenderer(root)
+
+        return True, ""
+
+    @staticmethod
+    def _categorized_properties(renderer) -> dict:
+        symbology = {}
+        symbology["type"] = "categorized"
+        symbology["field"] = renderer.classAttribute()
+        symbology["categories"] = []
+
+        for category in renderer.categories():
+            c = {}
+            c["value"] = VectorClassification._value(category.value())
+            c["label"] = category.label()
+            c["properties"] = category.symbol().symbolLayer(0).properties()
+            symbology["categories"].append(c)
+
+        return symbology
+
+    @staticmethod
+    def _graduated_properties(renderer) -> dict:
+        symbology = {}
+        symbology["type"] = "graduated"
+        symbology["field"] = renderer.classAttribute()
+
+        if renderer.classificationMethod():
+            method_id = renderer.classificationMethod().id()
+            for name, method in CLASSIFICATION_METHODS.items():
+                if method().id() == method_id:
+                    symbology["method"] = name
+
+        symbology["ranges"] = []
+        for r in renderer.ranges():
+            c = {}
+            c["lower"] = r.lowerValue()
+            c["upper"] = r.upperValue()
+            c["label"] = r.label()
+            c["properties"] = r.symbol().symbolLayer(0).properties()
+            symbology["ranges"].append(c)
+
+        return symbology
+
+    @staticmethod
+    def _rule_based_properties(renderer) -> dict:
+        symbology = {}
+        symbology["type"] = "rule_based"
+        symbology["rules"] = []
+
+        for rule in renderer.rootRule().children():
+            r = {}
+            r["filter"] = rule.filterExpression()
+            r["label"] = rule.label()
+            r["min_scale"] = rule.minimumScale()
+            r["max_scale"] = rule.maximumScale()
+            r["else"] = rule.isElse()
+            if rule.symbol():
+                r["properties"] = rule.symbol().symbolLayer(0).properties()
+            symbology["rules"].append(r)
+
+        return symbology
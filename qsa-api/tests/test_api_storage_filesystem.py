@@ -1,6 +1,15 @@
 import os
+import json
+import yaml
+import sqlite3
 import unittest
+import threading
 from pathlib import Path
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+from qsa_api.project import QSAProject
+from qsa_api.raster import RasterOverview
 
 from .utils import TestClient
 
@@ -88,6 +97,22 @@ class APITestCaseFilesystem(unittest.TestCase):
         j = p.get_json()
         self.assertTrue("outline_style" in j)
 
+    def test_symbology_cache(self):
+        url = "/api/symbology/raster/singlebandpseudocolor/ramp/spectral/properties"
+        p = self.app.get(url)
+        self.assertEqual(p.status_code, 200)
+        self.assertTrue("color1" in p.get_json())
+        self.assertTrue("max-age" in p.headers["Cache-Control"])
+
+        # not modified
+        etag = p.headers["ETag"]
+        p = self.app.get(url, {"If-None-Match": etag})
+        self.assertEqual(p.status_code, 304)
+
+        # ramp names are case insensitive
+        p = self.app.get(url.replace("spectral", "Spectral"))
+        self.assertEqual(p.headers["ETag"], etag)
+
     def test_vector_symbology_rendering(self):
         p = self.app.get("/api/symbology/vector/rendering/properties")
         j = p.get_json()
@@ -112,6 +137,12 @@ class APITestCaseFilesystem(unittest.TestCase):
         j = p.get_json()
         self.assertTrue("contrast_enhancement" in j)
 
+    def test_raster_symbology_paletted(self):
+        p = self.app.get("/api/symbology/raster/paletted/properties")
+        j = p.get_json()
+        self.assertTrue("band" in j)
+        self.assertTrue("classes" in j)
+
     def test_layers(self):
         # add project
         data = {}
@@ -183,6 +214,59 @@ class APITestCaseFilesystem(unittest.TestCase):
         # remove last project
         p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
 
+    def test_concurrent_updates(self):
+        # add project
+        data = {}
+        data["name"] = TEST_PROJECT_0
+        data["author"] = "pblottiere"
+        p = self.app.post("/api/projects/", data)
+        self.assertEqual(p.status_code, 201)
+
+        def add_layer(i):
+            data = {}
+            data["name"] = f"layer{i}"
+            data["datasource"] = f"{GPKG}|layername=polygons"
+            data["crs"] = 4326
+            data["type"] = "vector"
+            url = f"/api/projects/{TEST_PROJECT_0}/layers"
+            return self.app.post(url, data).status_code
+
+        def add_style(i):
+            data = {}
+            data["type"] = "vector"
+            data["name"] = f"style{i}"
+            data["symbology"] = {"type": "single_symbol", "symbol": "fill"}
+            data["symbology"]["properties"] = {"outline_width": i}
+            data["rendering"] = {}
+            url = f"/api/projects/{TEST_PROJECT_0}/styles"
+            return self.app.post(url, data).status_code
+
+        # every update is kept whatever the order of concurrent writes
+        count = 8
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            layers = executor.map(add_layer, range(count))
+            styles = executor.map(add_style, range(count))
+            self.assertEqual(list(layers), [201] * count)
+            self.assertEqual(list(styles), [201] * count)
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/layers")
+        self.assertEqual(
+            sorted(p.get_json()), sorted(f"layer{i}" for i in range(count))
+        )
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/styles")
+        self.assertEqual(
+            sorted(p.get_json()), sorted(f"style{i}" for i in range(count))
+        )
+
+        # nothing is left by atomic writes
+        project_dir = Path("/tmp/qsa/projects/qgis") / TEST_PROJECT_0
+        self.assertEqual(list(project_dir.glob(".*.q*")), [])
+
+        # remove project
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+        self.assertEqual(p.status_code, 201)
+
     def test_raster_style(self):
         # add project
         data = {}
@@ -277,6 +361,67 @@ class APITestCaseFilesystem(unittest.TestCase):
         # remove last project
         p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
 
+    def test_raster_preview(self):
+        # add project
+        data = {}
+        data["name"] = TEST_PROJECT_0
+        data["author"] = "pblottiere"
+        p = self.app.post("/api/projects/", data)
+        self.assertEqual(p.status_code, 201)
+
+        # add raster layer
+        data = {}
+        data["name"] = "layer0"
+        data["datasource"] = f"{GEOTIFF}"
+        data["crs"] = 4326
+        data["type"] = "raster"
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+        self.assertEqual(p.status_code, 201)
+
+        # render a preview with a style which is not stored
+        data = {}
+        data["symbology"] = {
+            "type": "singlebandgray",
+            "properties": {"gray": {"band": 1}},
+        }
+        data["width"] = 64
+        data["height"] = 64
+        p = self.app.post(
+            f"/api/projects/{TEST_PROJECT_0}/layers/layer0/preview", data
+        )
+        self.assertEqual(p.status_code, 200)
+        self.assertEqual(p.headers["Content-Type"], "image/png")
+
+        # project is unchanged
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/layers/layer0")
+        self.assertEqual(p.get_json()["styles"], ["default"])
+
+        # unique values of a paletted style without classes are detected
+        # but not stored
+        data["symbology"] = {
+            "type": "paletted",
+            "properties": {"band": {"band": 1}, "ramp": {"name": "Viridis"}},
+        }
+        p = self.app.post(
+            f"/api/projects/{TEST_PROJECT_0}/layers/layer0/preview", data
+        )
+        self.assertEqual(p.status_code, 200)
+
+        db = Path(f"/tmp/qsa/projects/qgis/{TEST_PROJECT_0}/qsa.db")
+        con = sqlite3.connect(db)
+        rows = con.execute("SELECT * FROM classifications").fetchall()
+        con.close()
+        self.assertEqual(rows, [])
+
+        # invalid layer
+        p = self.app.post(
+            f"/api/projects/{TEST_PROJECT_0}/layers/layer1/preview", data
+        )
+        self.assertEqual(p.status_code, 415)
+
+        # remove last project
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+
     def test_vector_style(self):
         # add project
         data = {}
@@ -382,6 +527,49 @@ class APITestCaseFilesystem(unittest.TestCase):
         # remove last project
         p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
 
+    def test_style_index(self):
+        # add project
+        data = {}
+        data["name"] = TEST_PROJECT_0
+        data["author"] = "pblottiere"
+        p = self.app.post("/api/projects/", data)
+        self.assertEqual(p.status_code, 201)
+
+        # add line style to project
+        data = {}
+        data["type"] = "vector"
+        data["name"] = "style_line"
+        data["symbology"] = {"type": "single_symbol", "symbol": "line"}
+        data["symbology"]["properties"] = {"line_width": 0.5}
+        data["rendering"] = {}
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/styles", data)
+        self.assertEqual(p.status_code, 201)
+
+        # a QML file copied outside the API is indexed on first access
+        project_dir = Path("/tmp/qsa/projects/qgis") / TEST_PROJECT_0
+        qml = (project_dir / "style_line.qml").read_text()
+        (project_dir / "style_copy.qml").write_text(qml)
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/styles/style_copy")
+        self.assertEqual(p.status_code, 200)
+        self.assertEqual(p.get_json()["name"], "style_copy")
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/styles")
+        self.assertEqual(p.get_json(), ["style_copy", "style_line"])
+
+        # a QML file removed outside the API is dropped from the index
+        (project_dir / "style_line.qml").unlink()
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/styles/style_line")
+        self.assertEqual(p.status_code, 415)
+        self.assertEqual(p.get_json()["error"], "Invalid style")
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/styles")
+        self.assertEqual(p.get_json(), ["style_copy"])
+
+        # remove last project
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+
     def test_default_style(self):
         # add project
         data = {}
@@ -559,6 +747,516 @@ class APITestCaseFilesystem(unittest.TestCase):
         # remove last project
         p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
 
+    def test_layer_cache(self):
+        if not self.app.is_flask_client:
+            self.skipTest("MapProxy configuration is read from the filesystem")
+
+        mapproxy_dir = Path("/tmp/qsa/projects/mapproxy")
+        os.environ["QSA_MAPPROXY_PROJECTS_DIR"] = mapproxy_dir.as_posix()
+        self.addCleanup(os.environ.pop, "QSA_MAPPROXY_PROJECTS_DIR")
+
+        # add project
+        data = {}
+        data["name"] = TEST_PROJECT_0
+        data["author"] = "pblottiere"
+        p = self.app.post("/api/projects/", data)
+        self.assertEqual(p.status_code, 201)
+
+        # add vector layer with cache options
+        data = {}
+        data["name"] = "layer0"
+        data["datasource"] = f"{GPKG}|layername=polygons"
+        data["crs"] = 4326
+        data["type"] = "vector"
+        data["cache"] = {
+            "meta_size": [8, 8],
+            "meta_buffer": 120,
+            "format": "mixed",
+            "grids": ["webmercator", "wgs84"],
+        }
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+        self.assertEqual(p.status_code, 201)
+
+        # add raster layer with default options
+        data = {}
+        data["name"] = "layer1"
+        data["datasource"] = f"{GEOTIFF}"
+        data["crs"] = 4326
+        data["type"] = "raster"
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+        self.assertEqual(p.status_code, 201)
+
+        # invalid grid
+        data = {}
+        data["name"] = "layer2"
+        data["datasource"] = f"{GPKG}|layername=lines"
+        data["type"] = "vector"
+        data["cache"] = {"grids": ["unknown"]}
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+        self.assertEqual(p.status_code, 415)
+
+        # check mapproxy configuration
+        with open(mapproxy_dir / f"{TEST_PROJECT_0}.yaml") as f:
+            cfg = yaml.safe_load(f)
+
+        cache = cfg["caches"]["layer0_cache"]
+        self.assertEqual(cache["meta_size"], [8, 8])
+        self.assertEqual(cache["meta_buffer"], 120)
+        self.assertEqual(cache["format"], "mixed")
+        self.assertEqual(cache["request_format"], "image/png")
+        self.assertEqual(cache["grids"], ["webmercator", "wgs84"])
+        self.assertFalse("use_direct_from_level" in cache)
+
+        cache = cfg["caches"]["layer1_cache"]
+        self.assertEqual(cache["meta_size"], [1, 1])
+        self.assertEqual(cache["use_direct_from_level"], 14)
+
+        # options are kept after a reset
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/cache/reset", {})
+        self.assertEqual(p.status_code, 201)
+
+        with open(mapproxy_dir / f"{TEST_PROJECT_0}.yaml") as f:
+            cfg = yaml.safe_load(f)
+        self.assertEqual(cfg["caches"]["layer0_cache"]["meta_size"], [8, 8])
+
+        # a reset clears caches without forgetting their usage
+        os.environ["QSA_MAPPROXY_CACHE_USAGE_TTL"] = "0"
+        self.addCleanup(os.environ.pop, "QSA_MAPPROXY_CACHE_USAGE_TTL")
+
+        tiles = mapproxy_dir / "cache_data" / "layer1_cache_webmercator"
+        for path, size in [
+            ("03/000/000/001/000/000/002.png", 10),
+            ("03/000/000/001/000/000/003.png", 20),
+            ("04/000/000/002/000/000/004.png", 30),
+        ]:
+            (tiles / path).parent.mkdir(parents=True, exist_ok=True)
+            (tiles / path).write_bytes(b"0" * size)
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/cache")
+        self.assertEqual(p.status_code, 201)
+
+        usage = p.get_json()["layers"]["layer1"]
+        self.assertTrue(usage["cleared"])
+        self.assertEqual(usage["tiles"], 3)
+        self.assertEqual(usage["size"], 60)
+        self.assertEqual(
+            usage["zoom"],
+            {"3": {"tiles": 2, "size": 30}, "4": {"tiles": 1, "size": 30}},
+        )
+
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/cache/reset", {})
+        self.assertEqual(p.status_code, 201)
+        self.assertFalse(tiles.exists())
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/cache")
+        usage = p.get_json()["layers"]["layer1"]
+        self.assertTrue(usage["cleared"])
+        self.assertEqual(usage["tiles"], 0)
+        self.assertEqual(usage["zoom"], {})
+
+        # usage of removed layers is forgotten
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/cache")
+        self.assertEqual(p.status_code, 201)
+
+        usage_file = mapproxy_dir / f"{TEST_PROJECT_0}.usage.json"
+        with open(usage_file) as f:
+            self.assertTrue("layer1" in json.load(f))
+
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}/layers/layer1")
+        self.assertEqual(p.status_code, 201)
+
+        with open(usage_file) as f:
+            self.assertFalse("layer1" in json.load(f))
+
+        # remove last project
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+        self.assertFalse(usage_file.exists())
+
+    def test_layer_cache_types(self):
+        if not self.app.is_flask_client:
+            self.skipTest("MapProxy configuration is read from the filesystem")
+
+        mapproxy_dir = Path("/tmp/qsa/projects/mapproxy")
+        os.environ["QSA_MAPPROXY_PROJECTS_DIR"] = mapproxy_dir.as_posix()
+        self.addCleanup(os.environ.pop, "QSA_MAPPROXY_PROJECTS_DIR")
+        self.addCleanup(os.environ.pop, "QSA_MAPPROXY_CACHE_TYPE", None)
+
+        cache_data = mapproxy_dir / "cache_data"
+        caches = {
+            "mbtiles": ("layer0_cache.mbtiles", "tiles"),
+            "geopackage": ("layer0_cache.gpkg", "layer0"),
+            "sqlite": ("layer0_cache_webmercator/3.mbtile", "tiles"),
+        }
+
+        for cache_type, (filename, table) in caches.items():
+            os.environ["QSA_MAPPROXY_CACHE_TYPE"] = cache_type
+
+            # add project and layer
+            data = {}
+            data["name"] = TEST_PROJECT_0
+            data["author"] = "pblottiere"
+            p = self.app.post("/api/projects/", data)
+            self.assertEqual(p.status_code, 201)
+
+            data = {}
+            data["name"] = "layer0"
+            data["datasource"] = f"{GPKG}|layername=polygons"
+            data["crs"] = 4326
+            data["type"] = "vector"
+            p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+            self.assertEqual(p.status_code, 201)
+
+            with open(mapproxy_dir / f"{TEST_PROJECT_0}.yaml") as f:
+                cfg = yaml.safe_load(f)
+            cache = cfg["caches"]["layer0_cache"]["cache"]
+            self.assertEqual(cache["type"], cache_type)
+
+            # seed a tile like MapProxy, keeping the database open
+            path = cache_data / filename
+            path.parent.mkdir(parents=True, exist_ok=True)
+            con = sqlite3.connect(path)
+            con.execute(
+                f'CREATE TABLE "{table}" (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)'
+            )
+            con.execute(
+                f'INSERT INTO "{table}" VALUES (3, 1, 2, ?)', (b"0" * 10,)
+            )
+            con.commit()
+
+            p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/cache")
+            usage = p.get_json()["layers"]["layer0"]
+            self.assertEqual(usage["tiles"], 1)
+            self.assertEqual(usage["size"], 10)
+
+            # the cache is cleared for MapProxy too
+            p = self.app.post(
+                f"/api/projects/{TEST_PROJECT_0}/cache/reset", {}
+            )
+            self.assertEqual(p.status_code, 201)
+
+            count = con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()
+            self.assertEqual(count[0], 0)
+            con.close()
+
+            p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/cache")
+            self.assertEqual(p.get_json()["layers"]["layer0"]["tiles"], 0)
+
+            # remove project
+            p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+            self.assertEqual(p.status_code, 201)
+
+            path.unlink()
+
+    def test_overview_interrupted(self):
+        if not self.app.is_flask_client:
+            self.skipTest("Project database is read from the filesystem")
+
+        # add project
+        data = {}
+        data["name"] = TEST_PROJECT_0
+        data["author"] = "pblottiere"
+        p = self.app.post("/api/projects/", data)
+        self.assertEqual(p.status_code, 201)
+
+        # add raster layer
+        data = {}
+        data["name"] = "layer0"
+        data["datasource"] = f"{GEOTIFF}"
+        data["crs"] = 4326
+        data["type"] = "raster"
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+        self.assertEqual(p.status_code, 201)
+
+        # a job killed while building overviews
+        db = Path(f"/tmp/qsa/projects/qgis/{TEST_PROJECT_0}/qsa.db")
+        con = sqlite3.connect(db)
+        con.execute(
+            "INSERT OR REPLACE INTO overviews VALUES(?, ?, ?, ?, ?, ?)",
+            ("layer0", "running", "NEAREST", None, "", ""),
+        )
+        con.commit()
+        con.close()
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/layers/layer0")
+        overview = p.get_json()["overview"]
+        self.assertEqual(overview["status"], "failed")
+        self.assertEqual(overview["error"], "Interrupted")
+
+        # reading the status doesn't create lock files
+        project_dir = Path(f"/tmp/qsa/projects/qgis/{TEST_PROJECT_0}")
+        self.assertEqual(list(project_dir.glob(".overview_*.lock")), [])
+
+        # remove project
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+
+    def test_overview_removed_layer(self):
+        if not self.app.is_flask_client:
+            self.skipTest("Overviews are built by the test process")
+
+        # add project
+        data = {}
+        data["name"] = TEST_PROJECT_0
+        data["author"] = "pblottiere"
+        p = self.app.post("/api/projects/", data)
+        self.assertEqual(p.status_code, 201)
+
+        # overviews are built until the layer is removed
+        started = threading.Event()
+        removed = threading.Event()
+        done = threading.Event()
+
+        def build(overview, resampling):
+            started.set()
+            removed.wait(10)
+            return True, ""
+
+        def update(project, layer, status, *args):
+            update.statuses.append(status)
+            update.origin(project, layer, status, *args)
+            if status != "running":
+                done.set()
+
+        update.statuses = []
+        update.origin = QSAProject._overview_status_update
+
+        data = {}
+        data["name"] = "layer0"
+        data["datasource"] = f"{GEOTIFF}"
+        data["crs"] = 4326
+        data["type"] = "raster"
+        data["overview"] = True
+        data["overview_background"] = True
+        with (
+            mock.patch.object(RasterOverview, "is_valid", return_value=False),
+            mock.patch.object(RasterOverview, "build", build),
+            mock.patch.object(QSAProject, "_overview_status_update", update),
+        ):
+            p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+            self.assertEqual(p.status_code, 201)
+            self.assertTrue(started.wait(10))
+
+            p = self.app.delete(
+                f"/api/projects/{TEST_PROJECT_0}/layers/layer0"
+            )
+            self.assertEqual(p.status_code, 201)
+            removed.set()
+
+            # the job ends without writing a status
+            self.assertFalse(done.wait(2))
+
+        self.assertEqual(update.statuses, ["running"])
+
+        db = Path(f"/tmp/qsa/projects/qgis/{TEST_PROJECT_0}/qsa.db")
+        con = sqlite3.connect(db)
+        rows = con.execute("SELECT * FROM overviews").fetchall()
+        con.close()
+        self.assertEqual(rows, [])
+
+        # remove project
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+
+    def test_styles_batch(self):
+        # add project
+        data = {}
+        data["name"] = TEST_PROJECT_0
+        data["author"] = "pblottiere"
+        p = self.app.post("/api/projects/", data)
+        self.assertEqual(p.status_code, 201)
+
+        # add vector and raster layers
+        data = {}
+        data["name"] = "layer0"
+        data["datasource"] = f"{GPKG}|layername=polygons"
+        data["crs"] = 4326
+        data["type"] = "vector"
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+        self.assertEqual(p.status_code, 201)
+
+        data = {}
+        data["name"] = "layer1"
+        data["datasource"] = f"{GEOTIFF}"
+        data["crs"] = 4326
+        data["type"] = "raster"
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+        self.assertEqual(p.status_code, 201)
+
+        # add styles and assign them at once
+        fill = {}
+        fill["type"] = "vector"
+        fill["name"] = "style_fill"
+        fill["symbology"] = {
+            "type": "single_symbol",
+            "symbol": "fill",
+            "properties": {"color": "#00BBBB"},
+        }
+        fill["rendering"] = {}
+
+        gray = {}
+        gray["type"] = "raster"
+        gray["name"] = "style_gray"
+        gray["symbology"] = {
+            "type": "singlebandgray",
+            "properties": {"gray": {"band": 1}},
+        }
+        gray["rendering"] = {}
+
+        data = {}
+        data["styles"] = [fill, gray]
+        data["layers"] = [
+            {"layer": "layer0", "style": "style_fill", "current": True},
+            {"layer": "layer1", "style": "style_gray", "current": True},
+        ]
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/styles/batch", data)
+        self.assertEqual(p.status_code, 201)
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/layers/layer0")
+        self.assertEqual(p.get_json()["current_style"], "style_fill")
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/layers/layer1")
+        self.assertEqual(p.get_json()["current_style"], "style_gray")
+
+        # unknown layer: nothing is written
+        fill["name"] = "style_fill_2"
+        data = {}
+        data["styles"] = [fill]
+        data["layers"] = [
+            {"layer": "layer2", "style": "style_fill_2", "current": True}
+        ]
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/styles/batch", data)
+        self.assertEqual(p.status_code, 415)
+
+        p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/styles")
+        self.assertTrue("style_fill_2" not in p.get_json())
+
+        # style type not matching the layer type
+        data = {}
+        data["layers"] = [
+            {"layer": "layer0", "style": "style_gray", "current": True}
+        ]
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/styles/batch", data)
+        self.assertEqual(p.status_code, 415)
+
+        # remove last project
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+
+    def test_styles_batch_paletted(self):
+        # add project
+        data = {}
+        data["name"] = TEST_PROJECT_0
+        data["author"] = "pblottiere"
+        p = self.app.post("/api/projects/", data)
+        self.assertEqual(p.status_code, 201)
+
+        # add raster layers
+        for name in ["layer0", "layer1"]:
+            data = {}
+            data["name"] = name
+            data["datasource"] = f"{GEOTIFF}"
+            data["crs"] = 4326
+            data["type"] = "raster"
+            p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+            self.assertEqual(p.status_code, 201)
+
+        # unique values are detected concurrently for both layers
+        paletted = {}
+        paletted["type"] = "raster"
+        paletted["name"] = "style_paletted"
+        paletted["symbology"] = {
+            "type": "paletted",
+            "properties": {"band": {"band": 1}, "ramp": {"name": "Viridis"}},
+        }
+        paletted["rendering"] = {}
+
+        data = {}
+        data["styles"] = [paletted]
+        data["layers"] = [
+            {"layer": "layer0", "style": "style_paletted", "current": True},
+            {"layer": "layer1", "style": "style_paletted", "current": True},
+        ]
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/styles/batch", data)
+        self.assertEqual(p.status_code, 201)
+
+        for name in ["layer0", "layer1"]:
+            p = self.app.get(f"/api/projects/{TEST_PROJECT_0}/layers/{name}")
+            self.assertEqual(p.get_json()["current_style"], "style_paletted")
+
+        # remove project
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+
+    def test_vector_style_classification(self):
+        # add project
+        data = {}
+        data["name"] = TEST_PROJECT_0
+        data["author"] = "pblottiere"
+        p = self.app.post("/api/projects/", data)
+        self.assertEqual(p.status_code, 201)
+
+        # add vector layer
+        data = {}
+        data["name"] = "layer0"
+        data["datasource"] = f"{GPKG}|layername=points"
+        data["crs"] = 4326
+        data["type"] = "vector"
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/layers", data)
+        self.assertEqual(p.status_code, 201)
+
+        # categorized style with categories computed from the layer
+        data = {}
+        data["type"] = "vector"
+        data["name"] = "style_categorized"
+        data["symbology"] = {
+            "type": "categorized",
+            "symbol": "marker",
+            "properties": {},
+            "field": "Class",
+            "layer": "layer0",
+            "ramp": "Spectral",
+        }
+        data["rendering"] = {}
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/styles", data)
+        self.assertEqual(p.status_code, 201)
+
+        p = self.app.get(
+            f"/api/projects/{TEST_PROJECT_0}/styles/style_categorized"
+        )
+        j = p.get_json()
+        self.assertEqual(j["symbology"]["type"], "categorized")
+        self.assertEqual(j["symbology"]["field"], "Class")
+        self.assertTrue(j["symbology"]["categories"])
+
+        # graduated style with breaks computed from the layer
+        data = {}
+        data["type"] = "vector"
+        data["name"] = "style_graduated"
+        data["symbology"] = {
+            "type": "graduated",
+            "symbol": "marker",
+            "properties": {},
+            "field": "Importance",
+            "layer": "layer0",
+            "method": "equal_interval",
+            "classes": 3,
+        }
+        data["rendering"] = {}
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/styles", data)
+        self.assertEqual(p.status_code, 201)
+
+        p = self.app.get(
+            f"/api/projects/{TEST_PROJECT_0}/styles/style_graduated"
+        )
+        j = p.get_json()
+        self.assertEqual(j["symbology"]["method"], "equal_interval")
+        self.assertEqual(len(j["symbology"]["ranges"]), 3)
+
+        # invalid field
+        data["name"] = "style_invalid"
+        data["symbology"]["field"] = "unknown"
+        p = self.app.post(f"/api/projects/{TEST_PROJECT_0}/styles", data)
+        self.assertEqual(p.status_code, 415)
+
+        # remove last project
+        p = self.app.delete(f"/api/projects/{TEST_PROJECT_0}")
+
 
 if __name__ == "__main__":
     unittest.main()
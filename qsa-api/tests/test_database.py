@@ -0,0 +1,84 @@
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+from qsa_api.database import QSADatabase
+
+
+def migrate_v1(con, directory):
+    con.execute("CREATE TABLE t(name TEXT PRIMARY KEY, value)")
+
+
+def migrate_v2(con, directory):
+    con.execute("INSERT INTO t VALUES('dir', ?)", (directory.as_posix(),))
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.path = self.dir / "qsa.db"
+
+    def tearDown(self):
+        QSADatabase(self.path, []).close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_migrations(self):
+        db = QSADatabase(self.path, [migrate_v1])
+        db.migrate()
+        self.assertEqual(db.execute("PRAGMA user_version"), [(1,)])
+        self.assertEqual(db.execute("PRAGMA journal_mode"), [("wal",)])
+
+        # only new migrations are applied
+        db.close()
+        db = QSADatabase(self.path, [migrate_v1, migrate_v2])
+        rows = db.execute("SELECT value FROM t WHERE name = ?", ("dir",))
+        self.assertEqual(rows, [(self.dir.as_posix(),)])
+        self.assertEqual(db.execute("PRAGMA user_version"), [(2,)])
+
+    def test_transaction(self):
+        db = QSADatabase(self.path, [migrate_v1])
+
+        with self.assertRaises(ValueError):
+            with db.transaction() as con:
+                con.execute("INSERT INTO t VALUES(?, ?)", ("a", 1))
+                raise ValueError()
+        self.assertEqual(db.execute("SELECT * FROM t"), [])
+
+        version = db.version
+        with db.transaction() as con:
+            con.execute("INSERT INTO t VALUES(?, ?)", ("a", 1))
+        self.assertEqual(db.execute("SELECT * FROM t"), [("a", 1)])
+        self.assertNotEqual(db.version, version)
+
+    def test_removed_database(self):
+        db = QSADatabase(self.path, [migrate_v1])
+        db.execute("INSERT INTO t VALUES(?, ?)", ("a", 1))
+
+        # pooled connections to a removed database are not reused
+        shutil.rmtree(self.dir)
+        self.assertEqual(db.execute("SELECT * FROM t"), [])
+
+        # nor pooled back when released
+        with db.connect() as con:
+            shutil.rmtree(self.dir)
+            db.execute("INSERT INTO t VALUES(?, ?)", ("b", 2))
+        self.assertNotIn(con, QSADatabase._pools[self.path.as_posix()][2])
+        self.assertEqual(db.execute("SELECT * FROM t"), [("b", 2)])
+
+    def test_checkpoint(self):
+        db = QSADatabase(self.path, [migrate_v1])
+        with db.connect() as con:
+            pass
+
+        # connections are still pooled after a checkpoint
+        for i in range(10):
+            db.execute("INSERT INTO t VALUES(?, ?)", (str(i), i))
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        with db.connect() as other:
+            self.assertIs(other, con)
+
+
+if __name__ == "__main__":
+    unittest.main()
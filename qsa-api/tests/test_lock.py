@@ -0,0 +1,172 @@
+import os
+import time
+import shutil
+import unittest
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+from flask import Flask
+
+from qsa_api.config import QSAConfig
+from qsa_api.lock import QSALock
+from qsa_api.project import QSAProject
+from qsa_api.utils import atomic_write
+
+PSQL_SERVICE = "qsa_test"
+
+
+def increment(app, counter, count):
+    # a read-modify-write which loses updates without the lock
+    with app.app_context():
+        for _ in range(count):
+            with QSALock("project"):
+                value = int(counter.read_text())
+                time.sleep(0.001)
+                counter.write_text(str(value + 1))
+
+
+class LockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        os.environ["QSA_QGISSERVER_PROJECTS_DIR"] = self.dir.as_posix()
+
+        self.app = Flask(__name__)
+        self.app.config["CONFIG"] = QSAConfig()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+        self.counter = self.dir / "counter"
+        self.counter.write_text("0")
+
+    def tearDown(self):
+        self.ctx.pop()
+        os.environ.pop("QSA_QGISSERVER_PROJECTS_DIR", None)
+        os.environ.pop("QSA_QGISSERVER_PROJECTS_PSQL_SERVICE", None)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def use_postgresql(self):
+        try:
+            import psycopg2
+
+            psycopg2.connect(service=PSQL_SERVICE).close()
+        except Exception:
+            self.skipTest("PostgreSQL service is not available")
+
+        os.environ["QSA_QGISSERVER_PROJECTS_PSQL_SERVICE"] = PSQL_SERVICE
+
+    def run_threads(self, count=4, increments=20):
+        threads = [
+            threading.Thread(
+                target=increment, args=(self.app, self.counter, increments)
+            )
+            for _ in range(count)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(int(self.counter.read_text()), count * increments)
+
+    def test_reentrant(self):
+        with QSALock("project"):
+            with QSALock("project"):
+                self.assertEqual(QSALock._held()["public:project"][0], 2)
+            self.assertEqual(QSALock._held()["public:project"][0], 1)
+        self.assertFalse("public:project" in QSALock._held())
+
+        # the lock is released when the outer block exits
+        thread = threading.Thread(
+            target=increment, args=(self.app, self.counter, 1)
+        )
+        thread.start()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.counter.read_text(), "1")
+
+    def test_threads(self):
+        self.run_threads()
+
+    def test_processes(self):
+        ctx = multiprocessing.get_context("fork")
+        processes = [
+            ctx.Process(target=increment, args=(self.app, self.counter, 20))
+            for _ in range(4)
+        ]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+
+        self.assertEqual(int(self.counter.read_text()), 80)
+
+    def test_postgresql(self):
+        self.use_postgresql()
+
+        with QSALock("project"):
+            with QSALock("project"):
+                pass
+
+        self.run_threads()
+
+    def test_atomic_write(self):
+        path = self.dir / "project.qgs"
+
+        # readers only see complete versions of the file
+        versions = [c * 1024 * 1024 for c in ["a", "b"]]
+        path.write_text(versions[0])
+
+        seen = set()
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                seen.add(path.read_text())
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        for i in range(20):
+            with atomic_write(path) as tmp:
+                tmp.write_text(versions[i % 2])
+        done.set()
+        reader.join()
+
+        self.assertTrue(seen <= set(versions))
+
+        # the file is unchanged on failure
+        with self.assertRaises(RuntimeError):
+            with atomic_write(path) as tmp:
+                tmp.write_text("partial")
+                raise RuntimeError()
+
+        self.assertEqual(path.read_text(), versions[1])
+        self.assertEqual(
+            sorted(p.name for p in self.dir.iterdir()),
+            ["counter", "project.qgs"],
+        )
+
+    def test_project_write(self):
+        project = QSAProject("project")
+        project._qgis_project_dir.mkdir(parents=True)
+
+        path = Path(project._qgis_project_uri)
+        path.write_text("project")
+
+        class FailingProject:
+            def write(self, filename):
+                Path(filename).write_text("partial")
+                return False
+
+        # a failed write leaves neither a partial project nor a
+        # temporary file
+        self.assertFalse(project._write(FailingProject()))
+        self.assertEqual(path.read_text(), "project")
+        self.assertEqual(
+            [p.name for p in project._qgis_project_dir.iterdir()],
+            [path.name],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import numpy as np
+
+from qsa_api.processing.expression import RasterExpression
+
+
+class RasterExpressionTestCase(unittest.TestCase):
+    def evaluate(self, expression, **arrays):
+        exp = RasterExpression(expression)
+        self.assertTrue(exp.is_valid(), exp.error)
+
+        if not arrays:
+            arrays = {"a@1": np.ma.masked_array([0.0])}
+        return exp.evaluate(arrays).tolist()
+
+    def test_precedence(self):
+        # OR binds tighter than AND like in QGIS
+        exp = RasterExpression("a@1 AND b@1 OR c@1")
+        self.assertEqual(
+            exp.tree,
+            (
+                "operator",
+                "AND",
+                ("ref", "a@1"),
+                ("operator", "OR", ("ref", "b@1"), ("ref", "c@1")),
+            ),
+        )
+
+        a = np.ma.masked_array([0.0])
+        b = np.ma.masked_array([0.0])
+        c = np.ma.masked_array([1.0])
+        values = self.evaluate(
+            "a@1 AND b@1 OR c@1", **{"a@1": a, "b@1": b, "c@1": c}
+        )
+        self.assertEqual(values, [0.0])
+
+        self.assertEqual(self.evaluate("1 + 2 * 3"), [7.0])
+        self.assertEqual(self.evaluate("2 * 3 ^ 2"), [18.0])
+        self.assertEqual(self.evaluate("1 + 1 = 2"), [1.0])
+        self.assertEqual(self.evaluate("1 < 2 AND 3 > 4 OR 1"), [1.0])
+        self.assertEqual(self.evaluate("(1 + 2) * 3"), [9.0])
+
+    def test_associativity(self):
+        self.assertEqual(self.evaluate("1 - 2 - 3"), [-4.0])
+        self.assertEqual(self.evaluate("8 / 4 / 2"), [1.0])
+        self.assertEqual(self.evaluate("2 ^ 3 ^ 2"), [512.0])
+
+    def test_unary_minus(self):
+        # unary minus has the highest precedence
+        self.assertEqual(self.evaluate("-2 ^ 2"), [4.0])
+        self.assertEqual(self.evaluate("2 * -3"), [-6.0])
+        self.assertEqual(self.evaluate("--2"), [2.0])
+        self.assertEqual(self.evaluate("+2 - -2"), [4.0])
+
+    def test_functions(self):
+        a = np.ma.masked_array([1.0, 4.0, -1.0], mask=[False, False, False])
+
+        self.assertEqual(
+            self.evaluate("MIN(a@1, 2)", **{"a@1": a}), [1.0, 2.0, -1.0]
+        )
+        self.assertEqual(
+            self.evaluate("max(a@1, 2)", **{"a@1": a}), [2.0, 4.0, 2.0]
+        )
+        self.assertEqual(
+            self.evaluate("if(a@1 > 1, 10, 20)", **{"a@1": a}),
+            [20.0, 10.0, 20.0],
+        )
+
+        # invalid operations produce nodata pixels
+        self.assertEqual(
+            self.evaluate("sqrt(a@1)", **{"a@1": a}), [1.0, 2.0, None]
+        )
+        self.assertEqual(
+            self.evaluate("a@1 / 0", **{"a@1": a}), [None, None, None]
+        )
+
+        exp = RasterExpression('"my layer@1" + a@2')
+        self.assertEqual(exp.references, ["my layer@1", "a@2"])
+        self.assertEqual(exp.layers, ["my layer", "a"])
+
+    def test_errors(self):
+        errors = {
+            "1 +": "Unexpected end of expression",
+            "(1 + 2": "Unexpected end of expression",
+            "1 + 2)": "Unexpected token ')'",
+            "1 $ 2": "Invalid character at position 1",
+            "foo(1)": "Unknown function 'foo'",
+            "min(1)": "Invalid number of arguments for 'min'",
+            "sqrt 1": "Expected '(' instead of '1'",
+            '"layer" + 1': "Invalid raster reference 'layer'",
+        }
+
+        for expression, error in errors.items():
+            exp = RasterExpression(expression)
+            self.assertFalse(exp.is_valid())
+            self.assertEqual(exp.error, error)
+
+
+if __name__ == "__main__":
+    unittest.main()
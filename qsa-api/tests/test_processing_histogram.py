@@ -0,0 +1,88 @@
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+from flask import Flask
+
+from qgis.core import QgsProject, QgsRasterLayer, QgsVectorLayer
+
+from qsa_api.processing import Histogram
+
+GEOTIFF = Path(__file__).parent / "landsat_4326.tif"
+
+GPKG = Path(__file__).parent / "data.gpkg"
+
+
+class HistogramTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+        self.dir = Path(tempfile.mkdtemp())
+
+        self.layer = QgsRasterLayer(GEOTIFF.as_posix(), "landsat")
+
+        project = QgsProject()
+        project.addMapLayer(self.layer.clone())
+        project.addMapLayer(
+            QgsVectorLayer(f"{GPKG}|layername=polygons", "polygons", "ogr")
+        )
+        self.project = (self.dir / "project.qgs").as_posix()
+        project.write(self.project)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.ctx.pop()
+
+    def test_approximate(self):
+        pixels = self.layer.width() * self.layer.height()
+
+        histo = Histogram(self.project, "landsat", GEOTIFF.as_posix(), "gdal")
+        h, err = histo.process(0, 256, 16, bands=[1, 2], approximate=True)
+        self.assertEqual(err, "")
+        self.assertEqual(list(h.keys()), [1, 2])
+        self.assertEqual(len(h[1]["values"]), 16)
+        self.assertEqual(sum(h[1]["values"]), pixels)
+
+        # other providers cannot be read by GDAL and fall back to the
+        # exact histogram computed by QGIS
+        histo = Histogram(
+            self.project, "landsat", "url=http://localhost/wms", "wms"
+        )
+        h, err = histo.process(0, 256, 16, bands=[1], approximate=True)
+        self.assertEqual(err, "")
+        self.assertEqual(list(h.keys()), [1])
+        self.assertEqual(len(h[1]["values"]), 16)
+        self.assertEqual(sum(h[1]["values"]), pixels)
+
+        # bands are checked by both paths
+        band = self.layer.bandCount() + 1
+        for approximate in [True, False]:
+            histo = Histogram(
+                self.project, "landsat", GEOTIFF.as_posix(), "gdal"
+            )
+            h, err = histo.process(
+                0, 256, 16, bands=[band], approximate=approximate
+            )
+            self.assertEqual(h, {})
+            self.assertEqual(err, "Invalid band")
+
+    def test_batch(self):
+        histograms = Histogram.process_batch(
+            self.project, ["unknown", "landsat", "polygons"], 0, 256, 16
+        )
+
+        results = {}
+        for h in histograms:
+            results[h["layer"]] = h
+
+        self.assertEqual(results["unknown"]["error"], "Layer does not exist")
+        self.assertEqual(results["polygons"]["error"], "Not a raster layer")
+        self.assertEqual(
+            len(results["landsat"]["histogram"]), self.layer.bandCount()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,265 @@
+import os
+import shutil
+import unittest
+import collections
+import tempfile
+import rasterio
+import numpy as np
+from pathlib import Path
+from unittest import mock
+from flask import Flask
+from rasterio.transform import from_bounds
+
+from qgis.core import QgsProject, QgsRasterLayer
+
+from qsa_api.processing import RasterCalculator
+
+GEOTIFF = Path(__file__).parent / "landsat_4326.tif"
+
+
+class RasterCalculatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+        # several tiles and processes even with a small raster
+        self.env = {
+            "QSA_PROCESSING_TILE_SIZE": "2",
+            "QSA_PROCESSING_WORKERS": "2",
+        }
+        os.environ.update(self.env)
+
+        self.dir = Path(tempfile.mkdtemp())
+
+        # same extent with a pixel twice bigger
+        coarse = self.dir / "coarse.tif"
+        with rasterio.open(GEOTIFF) as src:
+            bounds = src.bounds
+            self.resolution = src.res
+            width = max(1, src.width // 2)
+            height = max(1, src.height // 2)
+            profile = src.profile
+            profile.update(
+                width=width,
+                height=height,
+                count=1,
+                transform=from_bounds(*bounds, width, height),
+            )
+            data = src.read(1, out_shape=(height, width))
+        with rasterio.open(coarse, "w", **profile) as dst:
+            dst.write(data, 1)
+        self.coarse_resolution = (
+            (bounds.right - bounds.left) / width,
+            (bounds.top - bounds.bottom) / height,
+        )
+
+        project = QgsProject()
+        project.addMapLayer(QgsRasterLayer(GEOTIFF.as_posix(), "landsat"))
+        project.addMapLayer(QgsRasterLayer(coarse.as_posix(), "coarse"))
+        self.project = (self.dir / "project.qgs").as_posix()
+        project.write(self.project)
+
+    def tearDown(self):
+        for key in self.env:
+            os.environ.pop(key, None)
+        os.environ.pop("QSA_PROCESSING_MAX_PIXELS", None)
+
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.ctx.pop()
+
+    def grid(self, expression, **grid):
+        return RasterCalculator._grid(
+            self.project, expression, {"crs": "EPSG:4326", **grid}
+        )
+
+    def write(self, engine, expression):
+        grid, err = self.grid(expression)
+        self.assertTrue(grid, err)
+
+        vuri = RasterCalculator._virtual_uri(expression, grid)
+        filename = (self.dir / f"{engine}.tif").as_posix()
+
+        rc, err = RasterCalculator._write(engine, vuri, filename)
+        self.assertTrue(rc, err)
+        RasterCalculator._update_nodata(filename)
+
+        with rasterio.open(filename) as ds:
+            return ds.read(1, masked=True).astype(np.float64)
+
+    def test_engines(self):
+        expression = '"landsat@1" * 2 + "landsat@2" / 4 - 1'
+
+        expected = self.write("qgis", expression)
+        for engine in ["tiled", "numpy"]:
+            data = self.write(engine, expression)
+            self.assertEqual(data.shape, expected.shape)
+            np.testing.assert_array_equal(data.mask, expected.mask)
+            np.testing.assert_allclose(
+                data.compressed(), expected.compressed(), rtol=1e-6
+            )
+
+    def test_cog(self):
+        expected = self.write("tiled", '"landsat@1" * 2')
+
+        # internal tiles and overviews are laid out by the COG driver
+        cog = (self.dir / "cog.tif").as_posix()
+        RasterCalculator._write_cog(
+            (self.dir / "tiled.tif").as_posix(), cog, "DEFLATE", "YES"
+        )
+        with rasterio.open(cog) as ds:
+            self.assertEqual(ds.tags(ns="IMAGE_STRUCTURE")["LAYOUT"], "COG")
+            self.assertEqual(ds.profile["compress"], "deflate")
+            self.assertTrue(ds.profile["tiled"])
+            np.testing.assert_allclose(
+                ds.read(1, masked=True).astype(np.float64), expected
+            )
+
+        # the COG is directly written on the destination
+        out = {}
+        dest = (self.dir / "dest.tif").as_posix()
+        RasterCalculator._process(
+            self.project,
+            '"landsat@1" * 2',
+            "tiled",
+            dest,
+            out,
+            {
+                "format": "cog",
+                "compress": "DEFLATE",
+                "predictor": "YES",
+                "stream": False,
+                "grid": {"crs": "EPSG:4326"},
+                "overviews": True,
+            },
+        )
+        self.assertTrue(out["rc"], out["error"])
+        with rasterio.open(dest) as ds:
+            self.assertEqual(ds.tags(ns="IMAGE_STRUCTURE")["LAYOUT"], "COG")
+
+    def test_stream(self):
+        expression = '"landsat@1" * 2'
+        grid, err = self.grid(expression)
+        vuri = RasterCalculator._virtual_uri(expression, grid)
+
+        # streamable GeoTIFFs are written by strips, in order
+        expected = self.write("tiled", expression)
+        for engine in ["tiled", "numpy"]:
+            filename = (self.dir / f"{engine}_stream.tif").as_posix()
+            rc, err = RasterCalculator._write(engine, vuri, filename, True)
+            self.assertTrue(rc, err)
+
+            with rasterio.open(filename) as ds:
+                self.assertFalse(ds.profile["tiled"])
+                np.testing.assert_allclose(
+                    ds.read(1).astype(np.float64), expected.filled()
+                )
+
+        rc, err = RasterCalculator._write(
+            "qgis", vuri, (self.dir / "qgis_stream.tif").as_posix(), True
+        )
+        self.assertFalse(rc)
+        self.assertEqual(err, "Streaming is not supported by qgis engine")
+
+        # the temporary footprint of overviews is checked before streaming
+        usage = collections.namedtuple("usage", "total used free")
+        with mock.patch(
+            "qsa_api.processing.raster_calculator.shutil.disk_usage",
+            return_value=usage(0, 0, 0),
+        ):
+            rc, err = RasterCalculator._process_stream(
+                "tiled", vuri, "/vsis3/bucket/out.tif", grid, True
+            )
+        self.assertFalse(rc)
+        self.assertTrue("bytes of temporary disk space" in err)
+
+    def test_references(self):
+        # only referenced layers are inputs of the calculator
+        grid, err = self.grid('"landsat@1" + 1')
+        self.assertEqual(list(grid["layers"].keys()), ["landsat"])
+
+        # layers are not matched by a substring of the expression
+        grid, err = self.grid('"landsat_2020@1" + 1')
+        self.assertFalse(grid)
+        self.assertEqual(err, "No raster layer referenced in expression")
+
+        grid, err = self.grid('"unknown@1" + ')
+        self.assertFalse(grid)
+        self.assertEqual(err, "Invalid expression")
+
+        # a missing layer is reported by the numpy engine
+        expression = '"landsat@1" + "unknown@1"'
+        grid, err = self.grid(expression)
+        vuri = RasterCalculator._virtual_uri(expression, grid)
+        filename = (self.dir / "numpy.tif").as_posix()
+        rc, err = RasterCalculator._write("numpy", vuri, filename)
+        self.assertFalse(rc)
+        self.assertEqual(err, "Unknown raster layer 'unknown'")
+
+    def test_grid_policy(self):
+        expression = '"landsat@1" + "coarse@1"'
+
+        grid, err = self.grid(expression)
+        np.testing.assert_allclose(grid["resolution"], self.resolution)
+
+        grid, err = self.grid(expression, policy="coarsest")
+        np.testing.assert_allclose(grid["resolution"], self.coarse_resolution)
+
+        grid, err = self.grid(expression, policy="explicit")
+        self.assertFalse(grid)
+        self.assertEqual(err, "A resolution is required with explicit policy")
+
+        # the extent is aligned on the explicit resolution
+        resolution = self.resolution[0] / 3
+        grid, err = self.grid(
+            expression, policy="explicit", resolution=resolution
+        )
+        self.assertEqual(grid["resolution"], [resolution, resolution])
+
+        extent = grid["extent"]
+        self.assertAlmostEqual(
+            extent.width(), grid["width"] * resolution, places=12
+        )
+        self.assertAlmostEqual(
+            extent.height(), grid["height"] * resolution, places=12
+        )
+
+        with rasterio.open(GEOTIFF) as src:
+            self.assertAlmostEqual(extent.xMinimum(), src.bounds.left)
+            self.assertAlmostEqual(extent.yMaximum(), src.bounds.top)
+
+    def test_budget(self):
+        expression = '"landsat@1" + 1'
+
+        grid, err = self.grid(expression)
+        pixels = grid["width"] * grid["height"]
+        self.assertGreater(pixels, 1)
+
+        os.environ["QSA_PROCESSING_MAX_PIXELS"] = str(pixels - 1)
+        grid, err = self.grid(expression)
+        self.assertFalse(grid)
+        self.assertTrue("exceeds the budget" in err)
+
+        grid, err = self.grid(expression, oversize="downsample")
+        self.assertLessEqual(grid["width"] * grid["height"], pixels - 1)
+
+        # dry run
+        grid = {"crs": "EPSG:4326", "oversize": "downsample"}
+        calc = RasterCalculator(self.project, expression, grid=grid)
+        estimate, err = calc.estimate()
+        self.assertEqual(estimate["layers"], ["landsat"])
+        self.assertEqual(
+            estimate["pixels"], estimate["width"] * estimate["height"]
+        )
+        self.assertEqual(estimate["size"], estimate["pixels"] * 8)
+        self.assertLessEqual(estimate["pixels"], pixels - 1)
+
+        grid = {"crs": "EPSG:4326"}
+        calc = RasterCalculator(self.project, expression, grid=grid)
+        estimate, err = calc.estimate()
+        self.assertFalse(estimate)
+        self.assertTrue("exceeds the budget" in err)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import boto3
+import unittest
+import tempfile
+from flask import Flask
+
+from qsa_api import utils
+from qsa_api.utils import s3_bucket_upload
+
+try:
+    from moto import mock_aws
+except ImportError:
+    try:
+        from moto import mock_s3 as mock_aws
+    except ImportError:
+        mock_aws = None
+
+BUCKET = "qsa-test-bucket"
+
+
+@unittest.skipIf(mock_aws is None, "moto is not installed")
+class S3UploadTestCase(unittest.TestCase):
+    def setUp(self):
+        os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+        os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+        os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+        self.app = Flask(__name__)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.addCleanup(self.ctx.pop)
+
+        # clients created outside of the mock must not be reused
+        utils._s3_clients.clear()
+
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+
+        self.s3 = boto3.client("s3")
+        self.s3.create_bucket(Bucket=BUCKET)
+
+    def test_upload_multipart(self):
+        # 5MB is the minimal size of a part
+        os.environ["QSA_S3_MULTIPART_THRESHOLD"] = "5"
+        os.environ["QSA_S3_MULTIPART_CHUNKSIZE"] = "5"
+        os.environ["QSA_S3_MAX_CONCURRENCY"] = "4"
+        self.addCleanup(os.environ.pop, "QSA_S3_MULTIPART_THRESHOLD")
+        self.addCleanup(os.environ.pop, "QSA_S3_MULTIPART_CHUNKSIZE")
+        self.addCleanup(os.environ.pop, "QSA_S3_MAX_CONCURRENCY")
+
+        data = os.urandom(12 * 1024 * 1024)
+        with tempfile.NamedTemporaryFile(suffix=".tif") as fp:
+            fp.write(data)
+            fp.flush()
+
+            rc, err = s3_bucket_upload(BUCKET, fp.name, "dir/raster.tif")
+            self.assertTrue(rc)
+            self.assertEqual(err, "")
+
+        obj = self.s3.get_object(Bucket=BUCKET, Key="dir/raster.tif")
+        self.assertEqual(obj["Body"].read(), data)
+
+        # 3 parts
+        self.assertTrue(obj["ETag"].strip('"').endswith("-3"))
+
+    def test_upload_unknown_bucket(self):
+        with tempfile.NamedTemporaryFile(suffix=".tif") as fp:
+            fp.write(b"qsa")
+            fp.flush()
+
+            rc, err = s3_bucket_upload("unknown", fp.name, "raster.tif")
+            self.assertFalse(rc)
+            self.assertEqual(err, "Upload to S3 bucket failed")
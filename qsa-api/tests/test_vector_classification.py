@@ -0,0 +1,87 @@
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from qgis.core import QgsFeature, QgsVectorDataProvider, QgsVectorLayer
+
+from qsa_api.vector import VectorClassification, VectorSymbologyRenderer
+
+GPKG = Path(__file__).parent / "data.gpkg"
+
+
+class VectorClassificationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.layer = QgsVectorLayer(
+            f"{GPKG}|layername=points", "points", "ogr"
+        )
+
+    def test_sample(self):
+        # features are fetched with a regular stride over their ids
+        classification = VectorClassification(self.layer, sample_size=4)
+        idx = self.layer.fields().lookupField("Heading")
+        values = classification._sample("Heading", idx)
+        self.assertEqual(sorted(values), [80.0, 90.0, 90.0, 240.0])
+
+        # small layers are fully read
+        classification = VectorClassification(self.layer)
+        self.assertEqual(
+            len(classification._sample("Heading", idx)),
+            self.layer.featureCount(),
+        )
+
+        breaks, err = VectorClassification(self.layer, 4).breaks(
+            "Heading", "quantile", 2
+        )
+        self.assertEqual(err, "")
+        self.assertEqual(breaks[0][0], 80.0)
+        self.assertEqual(breaks[-1][1], 240.0)
+
+    def test_sample_sparse(self):
+        layer = QgsVectorLayer("None?field=value:double", "table", "memory")
+        features = []
+        for i in range(100):
+            feature = QgsFeature(layer.fields())
+            feature.setAttributes([float(i)])
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+
+        # most ids of the stride don't exist anymore, so every n-th
+        # feature is kept instead of the first ones
+        ids = [f.id() for f in layer.getFeatures()]
+        layer.dataProvider().deleteFeatures(ids[1:90])
+
+        classification = VectorClassification(layer, sample_size=4)
+        values = classification._sample("value", 0)
+        self.assertEqual(sorted(values), [0.0, 91.0, 94.0, 97.0])
+
+        # stale feature count of an empty layer
+        layer.dataProvider().deleteFeatures(ids)
+        with mock.patch.object(
+            QgsVectorDataProvider, "featureCount", return_value=10
+        ):
+            self.assertEqual(classification._sample("value", 0), [])
+
+    def test_ramp_color(self):
+        symbology = {
+            "symbol": "line",
+            "properties": {"line_width": 1},
+            "field": "Heading",
+            "ramp": "Viridis",
+            "categories": [
+                {"value": 0},
+                {"value": 90, "properties": {"line_color": "#ff0000"}},
+            ],
+        }
+
+        # the ramp doesn't override a color set explicitly
+        renderer = VectorSymbologyRenderer("categorized")
+        rc, err = renderer.load(symbology)
+        self.assertTrue(rc, err)
+
+        categories = renderer.renderer.categories()
+        self.assertNotEqual(categories[0].symbol().color().name(), "#ff0000")
+        self.assertEqual(categories[1].symbol().color().name(), "#ff0000")
+
+
+if __name__ == "__main__":
+    unittest.main()
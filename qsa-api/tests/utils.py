@@ -24,6 +24,10 @@ class TestResponse:
     def status_code(self):
         return self.resp.status_code
 
+    @property
+    def headers(self):
+        return self.resp.headers
+
     def get_json(self):
         if self.flask_client:
             return self.resp.get_json()
@@ -83,8 +87,8 @@ class TestClient:
         r = self.app.delete(self.url(url))
         return TestResponse(r, self.is_flask_client)
 
-    def get(self, url):
-        r = self.app.get(self.url(url))
+    def get(self, url, headers=None):
+        r = self.app.get(self.url(url), headers=headers)
         return TestResponse(r, self.is_flask_client)
 
     def url(self, url) -> str: